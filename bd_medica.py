@@ -1,17 +1,332 @@
 import sqlite3
+import base64
 import hashlib
+import hmac
+import threading
+import atexit
+import os
+import queue
+import re
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 DB_NAME = "citas_medicas.db"
 
+# Número máximo de conexiones inactivas que el pool conserva abiertas.
+TAMANO_POOL = 5
+
+# Perfiles de almacenamiento: PRAGMAs que se aplican a cada conexión nueva del pool.
+# "concurrente" usa WAL para que las lecturas (panel del médico, calendario) no se
+# bloqueen mientras un paciente agenda; "clasico" conserva el journal por defecto.
+PERFILES_ALMACENAMIENTO = {
+    "clasico": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    "concurrente": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,        # ~16 MB por conexión
+        "mmap_size": 134217728,      # 128 MB
+        "temp_store": "MEMORY",
+    },
+}
+PERFIL_ALMACENAMIENTO = os.environ.get("CITAS_PERFIL_BD", "concurrente")
+
+# Jornada de atención por defecto, para médicos sin registro en JornadasMedicos.
+HORA_INICIO_JORNADA = "08:00"
+HORA_FIN_JORNADA = "17:00"
+DURACION_CITA_MINUTOS = 30
+
+# Modo de disponibilidad:
+#  - "materializado": los horarios son filas de la tabla Horarios que se reservan y liberan.
+#  - "virtual": los horarios libres se calculan al vuelo con la jornada del médico menos
+#    sus citas activas; no se escriben filas en Horarios.
+MODOS_DISPONIBILIDAD = ("materializado", "virtual")
+MODO_DISPONIBILIDAD = os.environ.get("CITAS_MODO_DISPONIBILIDAD", "materializado")
+
+
+class _ConexionPool:
+    """
+    Envoltura de una conexión del pool.
+    Se usa igual que una conexión de sqlite3, pero close() la devuelve al pool
+    en lugar de cerrarla (descartando cualquier transacción sin confirmar).
+    Con `with conectar_bd() as conexion:` se confirma la transacción al salir del bloque
+    (o se revierte si hubo una excepción) y la conexión vuelve al pool.
+    """
+
+    def __init__(self, pool, conexion):
+        self._pool = pool
+        self._conexion = conexion
+
+    def __getattr__(self, nombre):
+        if self._conexion is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conexion, nombre)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        try:
+            if tipo is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+        return False
+
+    def close(self):
+        if self._conexion is not None:
+            conexion, self._conexion = self._conexion, None
+            self._pool.liberar(conexion)
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones SQLite compartido por todas las funciones de acceso a datos.
+    Las conexiones se reutilizan entre llamadas (y entre hilos, una a la vez),
+    se verifican antes de entregarse y se cierran todas en cerrar().
+    """
+
+    def __init__(self, db_name, tamano=TAMANO_POOL, perfil=PERFIL_ALMACENAMIENTO):
+        if perfil not in PERFILES_ALMACENAMIENTO:
+            raise ValueError(f"Perfil de almacenamiento desconocido: {perfil}")
+        self.db_name = db_name
+        self.tamano = tamano
+        self.perfil = perfil
+        self._lock = threading.Lock()
+        self._libres = []
+        self._cerrado = False
+        self.estadisticas = {"abiertas": 0, "reutilizadas": 0, "descartadas": 0, "cerradas": 0}
+
+    def _abrir(self):
+        conexion = sqlite3.connect(self.db_name, check_same_thread=False)
+        conexion.execute("PRAGMA foreign_keys = ON;")
+        for pragma, valor in PERFILES_ALMACENAMIENTO[self.perfil].items():
+            conexion.execute(f"PRAGMA {pragma} = {valor};")
+        with self._lock:
+            self.estadisticas["abiertas"] += 1
+        return conexion
+
+    @staticmethod
+    def _esta_sana(conexion):
+        try:
+            conexion.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def obtener(self):
+        """Entrega una conexión libre y sana del pool, o abre una nueva."""
+        while True:
+            with self._lock:
+                if self._cerrado:
+                    raise sqlite3.ProgrammingError("El pool de conexiones está cerrado.")
+                conexion = self._libres.pop() if self._libres else None
+            if conexion is None:
+                return _ConexionPool(self, self._abrir())
+            if self._esta_sana(conexion):
+                with self._lock:
+                    self.estadisticas["reutilizadas"] += 1
+                return _ConexionPool(self, conexion)
+            self._descartar(conexion)
+
+    def liberar(self, conexion):
+        """Devuelve la conexión al pool; si el pool está lleno o cerrado, la cierra."""
+        try:
+            if conexion.in_transaction:
+                conexion.rollback()
+        except sqlite3.Error:
+            self._descartar(conexion)
+            return
+        with self._lock:
+            if not self._cerrado and len(self._libres) < self.tamano:
+                self._libres.append(conexion)
+                return
+            self.estadisticas["cerradas"] += 1
+        conexion.close()
+
+    def _descartar(self, conexion):
+        with self._lock:
+            self.estadisticas["descartadas"] += 1
+        try:
+            conexion.close()
+        except sqlite3.Error:
+            pass
+
+    def cerrar(self):
+        """Cierra todas las conexiones inactivas; las prestadas se cierran al liberarse."""
+        with self._lock:
+            self._cerrado = True
+            libres, self._libres = self._libres, []
+            self.estadisticas["cerradas"] += len(libres)
+        for conexion in libres:
+            conexion.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def obtener_pool():
+    """Retorna el pool de conexiones del proceso, creándolo (o recreándolo si cambió DB_NAME)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_name != DB_NAME:
+            if _pool is not None:
+                _pool.cerrar()
+            _pool = PoolConexiones(DB_NAME, TAMANO_POOL, PERFIL_ALMACENAMIENTO)
+        return _pool
+
+def configurar_pool(tamano=None, db_name=None, perfil=None):
+    """
+    Cambia el tamaño del pool, la base de datos usada y/o el perfil de almacenamiento
+    (una clave de PERFILES_ALMACENAMIENTO).
+    El pool actual se cierra y se crea uno nuevo en la siguiente conexión.
+    """
+    global TAMANO_POOL, DB_NAME, PERFIL_ALMACENAMIENTO
+    if perfil is not None:
+        if perfil not in PERFILES_ALMACENAMIENTO:
+            raise ValueError(f"Perfil de almacenamiento desconocido: {perfil}")
+        PERFIL_ALMACENAMIENTO = perfil
+    if tamano is not None:
+        TAMANO_POOL = tamano
+    if db_name is not None:
+        DB_NAME = db_name
+    cerrar_conexiones()
+
+def cerrar_conexiones():
+    """Cierra el pool de conexiones del proceso (se usa al salir de la aplicación)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+    # Con otro pool (u otra base) el esquema se vuelve a verificar en el próximo asegurar_esquema()
+    # y los datos de referencia se vuelven a consultar.
+    with _lock_esquema:
+        _esquema_aplicado.clear()
+    _cache_referencia.invalidar()
+
+atexit.register(cerrar_conexiones)
+
+def configurar_disponibilidad(modo):
+    """Selecciona el modo de disponibilidad ("materializado" o "virtual")."""
+    global MODO_DISPONIBILIDAD
+    if modo not in MODOS_DISPONIBILIDAD:
+        raise ValueError(f"Modo de disponibilidad desconocido: {modo}")
+    MODO_DISPONIBILIDAD = modo
+
+def estadisticas_conexiones():
+    """Retorna un dict con las conexiones abiertas, reutilizadas, descartadas y cerradas del pool actual."""
+    return dict(obtener_pool().estadisticas)
+
 def conectar_bd():
     """
-    Conecta a la base de datos SQLite y activa la verificación de claves foráneas.
-    Devuelve la conexión.
+    Obtiene una conexión del pool (con la verificación de claves foráneas ya activa).
+    Al llamar a close() la conexión vuelve al pool para ser reutilizada.
+    """
+    return obtener_pool().obtener()
+
+# Bus de eventos de citas: las interfaces se suscriben por usuario y reciben los cambios
+# (cita agendada, cancelada, reagendada, atendida, recordatorio) en cuanto se confirman,
+# sin tener que consultar la base de datos periódicamente.
+_suscriptores = {}
+_lock_suscriptores = threading.Lock()
+_eventos = queue.Queue()
+_despachador = None
+
+def suscribir(clave, funcion):
     """
-    conexion = sqlite3.connect(DB_NAME)
-    conexion.execute("PRAGMA foreign_keys = ON;")
-    return conexion
+    Registra funcion(evento) para los eventos de la clave indicada:
+    ("paciente", paciente_id), ("medico", medico_id) o "*" para todos.
+    evento es un dict con "tipo", "cita_id", "paciente_id" y "medico_id".
+    Las funciones se ejecutan en el hilo despachador del bus, nunca en el que hizo el cambio.
+    """
+    global _despachador
+    with _lock_suscriptores:
+        _suscriptores.setdefault(clave, []).append(funcion)
+        if _despachador is None or not _despachador.is_alive():
+            _despachador = threading.Thread(target=_despachar_eventos, name="eventos-citas", daemon=True)
+            _despachador.start()
+
+def cancelar_suscripcion(clave, funcion):
+    """Quita una suscripción hecha con suscribir (no hace nada si no existe)."""
+    with _lock_suscriptores:
+        funciones = _suscriptores.get(clave, [])
+        if funcion in funciones:
+            funciones.remove(funcion)
+        if not funciones:
+            _suscriptores.pop(clave, None)
+
+def publicar_evento(tipo, cita_id=None, paciente_id=None, medico_id=None):
+    """Publica un evento de cita; se llama después de confirmar (commit) el cambio."""
+    with _lock_suscriptores:
+        if not _suscriptores:
+            return
+    _eventos.put({"tipo": tipo, "cita_id": cita_id, "paciente_id": paciente_id, "medico_id": medico_id})
+
+def _despachar_eventos():
+    while True:
+        evento = _eventos.get()
+        # Primero los suscriptores globales (cachés), para que las sesiones ya lean datos frescos.
+        claves = ("*", ("paciente", evento["paciente_id"]), ("medico", evento["medico_id"]))
+        with _lock_suscriptores:
+            funciones = [f for clave in claves for f in _suscriptores.get(clave, [])]
+        for funcion in funciones:
+            try:
+                funcion(evento)
+            except Exception:
+                traceback.print_exc()
+
+# Registro del esquema de otros módulos (por ejemplo, la tabla Notificaciones).
+# Cada inicializador recibe una conexión, debe ser idempotente y se ejecuta dentro de
+# crear_base_de_datos; asegurar_esquema() lo hace una sola vez por proceso y base de datos.
+_inicializadores_esquema = []
+_esquema_aplicado = {}  # db_name -> cantidad de inicializadores ya aplicados
+_lock_esquema = threading.RLock()
+
+def registrar_esquema(funcion):
+    """
+    Registra funcion(conexion), que crea las tablas e índices propios de un módulo.
+    Se puede usar como decorador; retorna la misma función.
+    """
+    with _lock_esquema:
+        if funcion not in _inicializadores_esquema:
+            _inicializadores_esquema.append(funcion)
+    return funcion
+
+def _aplicar_inicializadores(conexion, desde=0):
+    for funcion in _inicializadores_esquema[desde:]:
+        funcion(conexion)
+    conexion.commit()
+    _esquema_aplicado[obtener_pool().db_name] = len(_inicializadores_esquema)
+
+def asegurar_esquema():
+    """
+    Garantiza que el esquema completo (tablas, migraciones e inicializadores registrados) exista.
+    Solo la primera llamada del proceso toca la base de datos; las siguientes no hacen consultas.
+    """
+    db_name = obtener_pool().db_name
+    if _esquema_aplicado.get(db_name) == len(_inicializadores_esquema):
+        return
+    with _lock_esquema:
+        aplicados = _esquema_aplicado.get(db_name)
+        if aplicados is None:
+            crear_base_de_datos()
+        elif aplicados < len(_inicializadores_esquema):
+            # Un módulo registró su esquema después de crear la base: solo se aplica lo nuevo.
+            conexion = conectar_bd()
+            try:
+                _aplicar_inicializadores(conexion, aplicados)
+            finally:
+                conexion.close()
 
 def crear_base_de_datos():
     """Crea la base de datos con todas sus tablas necesarias e inserta las 5 especialidades fijas."""
@@ -94,23 +409,277 @@ def crear_base_de_datos():
     for esp in especialidades_fijas:
         cursor.execute("INSERT OR IGNORE INTO Especialidades (nombre) VALUES (?)", (esp,))
     conexion.commit()
+    aplicar_migraciones(conexion)
+    with _lock_esquema:
+        _aplicar_inicializadores(conexion)
     conexion.close()
     print("✅ Base de datos creada e inicializada exitosamente.")
 
+# Migraciones del esquema: (versión, descripción, sentencias).
+# Se aplican en orden, una sola vez, y la versión aplicada queda en schema_version.
+# Las sentencias deben ser idempotentes (IF NOT EXISTS) por si una base antigua
+# ya tiene parte de los cambios. Nunca se modifica una migración ya publicada:
+# los cambios nuevos se agregan como una versión nueva al final de la lista.
+MIGRACIONES = [
+    (1, "Índices para las consultas frecuentes de citas, horarios y médicos", [
+        "CREATE INDEX IF NOT EXISTS idx_citas_medico_fecha ON Citas(medico_id, fecha, hora, estado)",
+        "CREATE INDEX IF NOT EXISTS idx_citas_paciente_fecha ON Citas(paciente_id, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_horarios_medico_fecha_estado ON Horarios(medico_id, fecha, estado, hora)",
+        "CREATE INDEX IF NOT EXISTS idx_medicos_usuario ON Medicos(usuario_id)",
+        "CREATE INDEX IF NOT EXISTS idx_medicos_especialidad ON Medicos(especialidad_id)",
+    ]),
+    (2, "Jornada de atención configurable por médico", [
+        """
+        CREATE TABLE IF NOT EXISTS JornadasMedicos (
+            medico_id INTEGER PRIMARY KEY,
+            hora_inicio TEXT NOT NULL,
+            hora_fin TEXT NOT NULL,
+            duracion_minutos INTEGER NOT NULL CHECK(duracion_minutos > 0),
+            FOREIGN KEY (medico_id) REFERENCES Medicos(id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    # El rowid codifica el origen: 2*id para Usuarios y 2*id + 1 para Medicos,
+    # así los triggers actualizan la entrada exacta sin recorrer el índice.
+    (3, "Índice de texto completo de nombres de pacientes y médicos", [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS NombresBusqueda USING fts5(
+            nombre, tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        "DELETE FROM NombresBusqueda",
+        "INSERT INTO NombresBusqueda (rowid, nombre) SELECT 2 * id, nombres || ' ' || apellidos FROM Usuarios",
+        "INSERT INTO NombresBusqueda (rowid, nombre) SELECT 2 * id + 1, nombres || ' ' || apellidos FROM Medicos",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_usuarios_nombre_ins AFTER INSERT ON Usuarios BEGIN
+            INSERT INTO NombresBusqueda (rowid, nombre) VALUES (2 * new.id, new.nombres || ' ' || new.apellidos);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_usuarios_nombre_upd AFTER UPDATE OF nombres, apellidos ON Usuarios BEGIN
+            DELETE FROM NombresBusqueda WHERE rowid = 2 * old.id;
+            INSERT INTO NombresBusqueda (rowid, nombre) VALUES (2 * new.id, new.nombres || ' ' || new.apellidos);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_usuarios_nombre_del AFTER DELETE ON Usuarios BEGIN
+            DELETE FROM NombresBusqueda WHERE rowid = 2 * old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_medicos_nombre_ins AFTER INSERT ON Medicos BEGIN
+            INSERT INTO NombresBusqueda (rowid, nombre) VALUES (2 * new.id + 1, new.nombres || ' ' || new.apellidos);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_medicos_nombre_upd AFTER UPDATE OF nombres, apellidos ON Medicos BEGIN
+            DELETE FROM NombresBusqueda WHERE rowid = 2 * old.id + 1;
+            INSERT INTO NombresBusqueda (rowid, nombre) VALUES (2 * new.id + 1, new.nombres || ' ' || new.apellidos);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_medicos_nombre_del AFTER DELETE ON Medicos BEGIN
+            DELETE FROM NombresBusqueda WHERE rowid = 2 * old.id + 1;
+        END
+        """,
+    ]),
+    # Índice parcial: solo sirve a consultas con el literal estado = 'Pendiente' (la ventana de
+    # recordatorios). Un índice que empezara por estado también lo elegiría SQLite para las
+    # consultas de un médico con estado = ? y recorrería las citas pendientes de toda la clínica;
+    # esas usan idx_citas_medico_fecha.
+    (4, "Estado de tareas en segundo plano e índice parcial de citas pendientes por fecha", [
+        """
+        CREATE TABLE IF NOT EXISTS EstadoTareas (
+            tarea TEXT PRIMARY KEY,
+            valor TEXT NOT NULL,
+            actualizado TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_citas_pendientes_fecha ON Citas(fecha, hora) WHERE estado = 'Pendiente'",
+    ]),
+    # Los correos se guardan normalizados (normalizar_email) desde esta versión. Los antiguos se
+    # normalizan salvo que choquen con otro que solo difiere en mayúsculas o espacios (OR IGNORE):
+    # esos quedan igual y el índice NOCASE permite encontrarlos de todos modos.
+    (5, "Correos normalizados e índice de correo sin distinguir mayúsculas", [
+        "CREATE INDEX IF NOT EXISTS idx_usuarios_email_nocase ON Usuarios(email COLLATE NOCASE)",
+        "UPDATE OR IGNORE Usuarios SET email = LOWER(TRIM(email)) WHERE email <> LOWER(TRIM(email))",
+        "UPDATE OR IGNORE Medicos SET email = LOWER(TRIM(email)) WHERE email <> LOWER(TRIM(email))",
+    ]),
+]
+
+def version_esquema(conexion):
+    """Retorna la versión de esquema aplicada en la base de datos (0 si no hay migraciones)."""
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            aplicada TEXT NOT NULL
+        );
+    """)
+    row = conexion.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def aplicar_migraciones(conexion):
+    """
+    Aplica, cada una en su propia transacción, las migraciones pendientes.
+    Retorna la versión de esquema resultante.
+    """
+    actual = version_esquema(conexion)
+    for version, descripcion, sentencias in MIGRACIONES:
+        if version <= actual:
+            continue
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            # Otro proceso pudo aplicar la misma migración mientras esperábamos el bloqueo.
+            if version_esquema(conexion) >= version:
+                conexion.rollback()
+                continue
+            for sentencia in sentencias:
+                conexion.execute(sentencia)
+            conexion.execute("INSERT INTO schema_version (version, descripcion, aplicada) VALUES (?, ?, ?)",
+                             (version, descripcion, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conexion.commit()
+        except sqlite3.Error:
+            conexion.rollback()
+            raise
+        actual = version
+    return actual
+
+# Hash de contraseñas. Se guarda como "algoritmo$param=valor,...$sal$hash" (base64 sin relleno)
+# con una sal aleatoria por usuario. Los hashes antiguos (SHA-256 en hexadecimal, sin sal) se
+# siguen aceptando y se reemplazan por el formato vigente en el siguiente inicio de sesión, igual
+# que los guardados con otro algoritmo o con otro costo.
+# El costo es intencional (decenas de ms por hash), así que los hashes se calculan en un pool de
+# MAX_HASH_TRABAJADORES hilos: hashlib libera el GIL, y el pool acota la CPU y la memoria usadas
+# (scrypt reserva 128 * n * r bytes por hash) aunque muchas sesiones inicien sesión a la vez.
+MAX_HASH_TRABAJADORES = os.cpu_count() or 2
+BYTES_SAL = 16
+
+_hashers = {}  # algoritmo -> (derivar, parámetros de costo por defecto)
+
+def registrar_hasher(algoritmo, derivar, **parametros):
+    """
+    Registra un algoritmo de hash: derivar(password: bytes, sal: bytes, **parametros) -> bytes.
+    `parametros` son los valores de costo por defecto (enteros).
+    """
+    _hashers[algoritmo] = (derivar, parametros)
+
+def _derivar_scrypt(password, sal, n, r, p):
+    return hashlib.scrypt(password, salt=sal, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+def _derivar_pbkdf2_sha256(password, sal, iteraciones):
+    return hashlib.pbkdf2_hmac("sha256", password, sal, iteraciones)
+
+registrar_hasher("scrypt", _derivar_scrypt, n=2 ** 14, r=8, p=1)
+registrar_hasher("pbkdf2_sha256", _derivar_pbkdf2_sha256, iteraciones=600000)
+
+ALGORITMO_HASH = os.environ.get("CITAS_ALGORITMO_HASH", "scrypt")
+_parametros_hash = dict(_hashers[ALGORITMO_HASH][1])
+_ejecutor_hash = ThreadPoolExecutor(max_workers=MAX_HASH_TRABAJADORES, thread_name_prefix="hash")
+
+def configurar_hash(algoritmo=None, **parametros):
+    """
+    Cambia el algoritmo (con sus costos por defecto) y/o los parámetros de costo de los hashes
+    nuevos. Los hashes ya guardados se rehacen con la configuración nueva al iniciar sesión.
+    """
+    global ALGORITMO_HASH, _parametros_hash
+    if algoritmo is not None:
+        if algoritmo not in _hashers:
+            raise ValueError(f"Algoritmo de hash desconocido: {algoritmo}")
+        ALGORITMO_HASH = algoritmo
+        _parametros_hash = dict(_hashers[algoritmo][1])
+    desconocidos = set(parametros) - set(_parametros_hash)
+    if desconocidos:
+        raise ValueError(f"Parámetros desconocidos para {ALGORITMO_HASH}: {', '.join(sorted(desconocidos))}")
+    _parametros_hash.update(parametros)
+
+def _b64(datos):
+    return base64.b64encode(datos).decode("ascii").rstrip("=")
+
+def _desde_b64(texto):
+    return base64.b64decode(texto + "=" * (-len(texto) % 4))
+
+def _calcular_hash(password):
+    algoritmo, parametros = ALGORITMO_HASH, dict(_parametros_hash)
+    sal = os.urandom(BYTES_SAL)
+    derivado = _hashers[algoritmo][0](password.encode(), sal, **parametros)
+    texto_parametros = ",".join(f"{nombre}={valor}" for nombre, valor in parametros.items())
+    return f"{algoritmo}${texto_parametros}${_b64(sal)}${_b64(derivado)}"
+
+def _verificar_hash(password, almacenado):
+    if "$" not in almacenado:
+        # Formato antiguo: SHA-256 sin sal.
+        return hmac.compare_digest(almacenado, hashlib.sha256(password.encode()).hexdigest()), True
+    try:
+        algoritmo, texto_parametros, sal, esperado = almacenado.split("$")
+        parametros = {nombre: int(valor) for nombre, valor in
+                      (par.split("=") for par in texto_parametros.split(",") if par)}
+        derivar = _hashers[algoritmo][0]
+        derivado = derivar(password.encode(), _desde_b64(sal), **parametros)
+        valida = hmac.compare_digest(derivado, _desde_b64(esperado))
+    except (ValueError, KeyError, TypeError):
+        return False, False
+    return valida, algoritmo != ALGORITMO_HASH or parametros != _parametros_hash
+
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Retorna el hash de la contraseña en el formato vigente (calculado en el pool de hash)."""
+    return _ejecutor_hash.submit(_calcular_hash, password).result()
 
-def verificar_credenciales(email, password):
-    """Verifica si el usuario existe y la contraseña es correcta."""
+def verificar_password(password, almacenado):
+    """
+    Compara la contraseña con el hash guardado (en el pool de hash).
+    Retorna (valida: bool, necesita_rehash: bool); necesita_rehash indica que el hash está en
+    un formato o costo distinto del vigente.
+    """
+    return _ejecutor_hash.submit(_verificar_hash, password, almacenado).result()
+
+def _rehacer_hash(user_id, anterior, password):
+    # Solo si nadie cambió la contraseña mientras tanto; si falla, el inicio de sesión sigue valiendo.
+    nuevo = hash_password(password)
+    conexion = conectar_bd()
+    try:
+        conexion.execute("UPDATE Usuarios SET password = ? WHERE id = ? AND password = ?", (nuevo, user_id, anterior))
+        conexion.commit()
+    except sqlite3.Error:
+        traceback.print_exc()
+    finally:
+        conexion.close()
+
+def normalizar_email(email):
+    """Forma en que se guardan y se buscan los correos: sin espacios alrededor y en minúsculas."""
+    return email.strip().lower()
+
+def autenticar_usuario(email, password):
+    """
+    Busca el usuario por correo (sin distinguir mayúsculas, con idx_usuarios_email_nocase)
+    y verifica la contraseña en una sola consulta. Si el hash guardado no está en el formato
+    vigente, se reemplaza por uno nuevo.
+    Retorna (existe: bool, contrasena_valida: bool, tipo_usuario|None, user_id|None).
+    """
     conexion = conectar_bd()
     cursor = conexion.cursor()
-    cursor.execute("SELECT id, tipo_usuario, password FROM Usuarios WHERE email = ?", (email,))
+    # Si una base antigua tiene dos correos que solo difieren en mayúsculas, gana el idéntico.
+    cursor.execute("""
+        SELECT id, tipo_usuario, password FROM Usuarios
+        WHERE email = ? COLLATE NOCASE
+        ORDER BY email = ? DESC
+        LIMIT 1
+    """, (normalizar_email(email), email.strip()))
     usuario = cursor.fetchone()
     conexion.close()
-    if usuario:
-        user_id, tipo_usuario, hashed_pass = usuario
-        if hashed_pass == hash_password(password):
-            return True, tipo_usuario, user_id
+    if usuario is None:
+        return False, False, None, None
+    user_id, tipo_usuario, hashed_pass = usuario
+    valida, rehacer = verificar_password(password, hashed_pass)
+    if valida and rehacer:
+        _rehacer_hash(user_id, hashed_pass, password)
+    return True, valida, tipo_usuario, user_id
+
+def verificar_credenciales(email, password):
+    """Verifica si el usuario existe y la contraseña es correcta."""
+    existe, valida, tipo_usuario, user_id = autenticar_usuario(email, password)
+    if valida:
+        return True, tipo_usuario, user_id
     return False, None, None
 
 def registrar_usuario_en_bd(tipo_usuario, nombres, apellidos, email, telefono, cedula, password, especialidad=None,
@@ -121,6 +690,8 @@ def registrar_usuario_en_bd(tipo_usuario, nombres, apellidos, email, telefono, c
     Si el usuario es Administrador, también se registra en la tabla Medicos con la especialidad dada.
     Retorna (exito: bool, mensaje: str, user_id: int|None).
     """
+    email = normalizar_email(email)
+    hashed_pass = hash_password(password)
     conexion = conectar_bd()
     cursor = conexion.cursor()
     try:
@@ -128,7 +699,7 @@ def registrar_usuario_en_bd(tipo_usuario, nombres, apellidos, email, telefono, c
             INSERT INTO Usuarios (tipo_usuario, nombres, apellidos, email, telefono, cedula, password,
                                   security_q1, security_a1, security_q2, security_a2, security_q3, security_a3, photo)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (tipo_usuario, nombres, apellidos, email, telefono, cedula, hash_password(password),
+        """, (tipo_usuario, nombres, apellidos, email, telefono, cedula, hashed_pass,
               security_q1, security_a1, security_q2, security_a2, security_q3, security_a3, photo))
         user_id = cursor.lastrowid
         if tipo_usuario == "Administrador" and especialidad and especialidad != "Seleccionar":
@@ -143,6 +714,7 @@ def registrar_usuario_en_bd(tipo_usuario, nombres, apellidos, email, telefono, c
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (nombres, apellidos, esp_id, telefono, email, user_id))
         conexion.commit()
+        invalidar_cache_referencia()
         return True, "✅ Usuario registrado correctamente.", user_id
     except sqlite3.IntegrityError as e:
         error_msg = str(e)
@@ -172,6 +744,7 @@ def obtener_usuario(user_id):
 
 def actualizar_datos_usuario(user_id, nombres, apellidos, email, telefono):
     """Actualiza en la tabla Usuarios los datos básicos."""
+    email = normalizar_email(email)
     conexion = conectar_bd()
     cursor = conexion.cursor()
     try:
@@ -200,11 +773,15 @@ def cambiar_contrasena(user_id, old_password, new_password):
         conexion.close()
         return False, "Usuario no encontrado."
     current_hashed = row[0]
-    if current_hashed != hash_password(old_password):
-        conexion.close()
+    # Los hashes se calculan sin retener la conexión del pool.
+    conexion.close()
+    if not verificar_password(old_password, current_hashed)[0]:
         return False, "La contraseña actual no es correcta."
+    new_hashed = hash_password(new_password)
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
     try:
-        cursor.execute("UPDATE Usuarios SET password = ? WHERE id = ?", (hash_password(new_password), user_id))
+        cursor.execute("UPDATE Usuarios SET password = ? WHERE id = ?", (new_hashed, user_id))
         conexion.commit()
         return True, "Contraseña actualizada correctamente."
     except sqlite3.Error as e:
@@ -212,14 +789,113 @@ def cambiar_contrasena(user_id, old_password, new_password):
     finally:
         conexion.close()
 
+# Caché en memoria de los datos de referencia (especialidades, médicos), que solo cambian al
+# registrar un médico: registrar_usuario_en_bd la invalida. Además, cada entrada vence a los
+# TTL_CACHE_REFERENCIA segundos (por cambios hechos desde otro proceso) y, si se llena,
+# se descarta la usada hace más tiempo.
+TTL_CACHE_REFERENCIA = 300
+TAMANO_CACHE_REFERENCIA = 256
+
+class CacheReferencia:
+    """Caché con vencimiento (TTL) y descarte LRU, segura entre hilos, con estadísticas."""
+
+    def __init__(self, tamano=TAMANO_CACHE_REFERENCIA, ttl=TTL_CACHE_REFERENCIA):
+        self.tamano = tamano
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> (vence, valor)
+        # Aumenta en cada invalidación; sirve para saber si un dato derivado quedó desactualizado.
+        self.version = 0
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "vencidas": 0, "invalidaciones": 0}
+
+    def obtener(self, clave, cargar):
+        """Retorna el valor de `clave`; si no está o venció, lo obtiene con cargar() y lo guarda."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                if entrada[0] > ahora:
+                    self._entradas.move_to_end(clave)
+                    self.estadisticas["aciertos"] += 1
+                    return entrada[1]
+                del self._entradas[clave]
+                self.estadisticas["vencidas"] += 1
+            self.estadisticas["fallos"] += 1
+            version = self.version
+        valor = cargar()
+        with self._lock:
+            # Si se invalidó mientras se consultaba, el valor puede estar desactualizado: no se guarda.
+            if version == self.version:
+                self._entradas[clave] = (ahora + self.ttl, valor)
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.tamano:
+                    self._entradas.popitem(last=False)
+        return valor
+
+    def buscar(self, clave, predeterminado=None):
+        """Retorna el valor vigente de `clave` sin cargarlo, o `predeterminado` si no está."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.estadisticas["aciertos"] += 1
+                return entrada[1]
+            self.estadisticas["fallos"] += 1
+            return predeterminado
+
+    def guardar(self, clave, valor, version=None):
+        """
+        Guarda un valor obtenido por fuera de obtener() (por ejemplo, una precarga por lotes).
+        Si se indica `version` y hubo una invalidación desde entonces, no se guarda.
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, filtro=None):
+        """Descarta todas las entradas, o solo aquellas cuya clave cumple filtro(clave)."""
+        with self._lock:
+            if filtro is None:
+                self._entradas.clear()
+            else:
+                for clave in [c for c in self._entradas if filtro(c)]:
+                    del self._entradas[clave]
+            self.version += 1
+            self.estadisticas["invalidaciones"] += 1
+
+    def estadisticas_actuales(self):
+        """Retorna un dict con aciertos, fallos, vencidas, invalidaciones y entradas."""
+        with self._lock:
+            return dict(self.estadisticas, entradas=len(self._entradas))
+
+_cache_referencia = CacheReferencia()
+
+def invalidar_cache_referencia():
+    """Descarta los datos de referencia en caché (se llama al registrar un médico)."""
+    _cache_referencia.invalidar()
+
+def version_cache_referencia():
+    """Retorna un número que cambia cada vez que se invalidan los datos de referencia."""
+    return _cache_referencia.version
+
+def estadisticas_cache_referencia():
+    """Retorna un dict con aciertos, fallos, vencidas, invalidaciones y entradas de la caché de referencia."""
+    return _cache_referencia.estadisticas_actuales()
+
 def obtener_especialidades():
     """Obtiene la lista de especialidades existentes."""
-    conexion = conectar_bd()
-    cursor = conexion.cursor()
-    cursor.execute("SELECT id, nombre FROM Especialidades")
-    especialidades = cursor.fetchall()
-    conexion.close()
-    return especialidades
+    def consultar():
+        conexion = conectar_bd()
+        cursor = conexion.cursor()
+        cursor.execute("SELECT id, nombre FROM Especialidades ORDER BY id")
+        especialidades = cursor.fetchall()
+        conexion.close()
+        return especialidades
+    return list(_cache_referencia.obtener(("especialidades",), consultar))
 
 def obtener_medicos(especialidad_id=None, usuario_id=None):
     """
@@ -229,33 +905,59 @@ def obtener_medicos(especialidad_id=None, usuario_id=None):
     Si ninguno se pasa, retorna todos los médicos.
     Retorna [(id, "nombres apellidos"), ...].
     """
-    conexion = conectar_bd()
-    cursor = conexion.cursor()
-    if usuario_id is not None:
-        cursor.execute("""
-            SELECT id, (nombres || ' ' || apellidos) as nombre_completo
-            FROM Medicos
-            WHERE usuario_id = ?
-        """, (usuario_id,))
-    elif especialidad_id is not None:
-        cursor.execute("""
-            SELECT id, (nombres || ' ' || apellidos) as nombre_completo
-            FROM Medicos
-            WHERE especialidad_id = ?
-        """, (especialidad_id,))
-    else:
+    def consultar():
+        conexion = conectar_bd()
+        cursor = conexion.cursor()
+        if usuario_id is not None:
+            cursor.execute("""
+                SELECT id, (nombres || ' ' || apellidos) as nombre_completo
+                FROM Medicos
+                WHERE usuario_id = ?
+            """, (usuario_id,))
+        elif especialidad_id is not None:
+            cursor.execute("""
+                SELECT id, (nombres || ' ' || apellidos) as nombre_completo
+                FROM Medicos
+                WHERE especialidad_id = ?
+            """, (especialidad_id,))
+        else:
+            cursor.execute("""
+                SELECT id, (nombres || ' ' || apellidos) as nombre_completo
+                FROM Medicos
+            """)
+        medicos = cursor.fetchall()
+        conexion.close()
+        return medicos
+    return list(_cache_referencia.obtener(("medicos", especialidad_id, usuario_id), consultar))
+
+def obtener_medicos_por_especialidad():
+    """
+    Retorna, con una sola consulta agrupada, el mapa {especialidad_id: [(id, "nombres apellidos"), ...]}
+    de todas las especialidades (las que no tienen médicos quedan con una lista vacía).
+    """
+    def consultar():
+        conexion = conectar_bd()
+        cursor = conexion.cursor()
         cursor.execute("""
-            SELECT id, (nombres || ' ' || apellidos) as nombre_completo
-            FROM Medicos
+            SELECT E.id, M.id, (M.nombres || ' ' || M.apellidos)
+            FROM Especialidades E
+            LEFT JOIN Medicos M ON M.especialidad_id = E.id
+            ORDER BY E.id, M.id
         """)
-    medicos = cursor.fetchall()
-    conexion.close()
-    return medicos
+        mapa = {}
+        for esp_id, medico_id, nombre in cursor.fetchall():
+            medicos = mapa.setdefault(esp_id, [])
+            if medico_id is not None:
+                medicos.append((medico_id, nombre))
+        conexion.close()
+        return mapa
+    mapa = _cache_referencia.obtener(("medicos_por_especialidad",), consultar)
+    return {esp_id: list(medicos) for esp_id, medicos in mapa.items()}
 
-def obtener_pacientes_de_medico(medico_id):
+def obtener_pacientes_de_medico(medico_id, limite=None):
     """
     Retorna la lista de pacientes (Usuarios) que han tenido (o tienen)
-    al menos una cita con el médico dado.
+    al menos una cita con el médico dado (como máximo `limite`, si se indica).
     Formato: [(paciente_id, "Nombres Apellidos"), ...].
     """
     conexion = conectar_bd()
@@ -266,26 +968,174 @@ def obtener_pacientes_de_medico(medico_id):
         JOIN Usuarios U ON C.paciente_id = U.id
         WHERE C.medico_id = ?
         ORDER BY U.apellidos, U.nombres
-    """, (medico_id,))
+        LIMIT ?
+    """, (medico_id, -1 if limite is None else limite))
     data = cursor.fetchall()
     conexion.close()
     return data
 
-def obtener_horarios_disponibles(medico_id, fecha):
-    """Obtiene los horarios disponibles para el médico en la fecha indicada."""
+def _consulta_nombres(texto):
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5 por prefijo:
+    "mart jo" -> '"mart"* "jo"*' (todas las palabras, cada una como prefijo).
+    Retorna None si el texto no tiene palabras.
+    """
+    palabras = re.findall(r"\w+", texto or "")
+    if not palabras:
+        return None
+    return " ".join(f'"{p}"*' for p in palabras)
+
+def buscar_nombres(texto, tipo=None, limite=20):
+    """
+    Busca pacientes y/o médicos por nombre, sin distinguir mayúsculas ni tildes y por prefijo
+    ("martinez" y "mart" encuentran a "Martínez").
+    tipo puede ser "Usuario", "Medico" o None (ambos).
+    Retorna [(tipo, id, "Nombres Apellidos"), ...] ordenado por relevancia.
+    """
+    consulta = _consulta_nombres(texto)
+    if consulta is None:
+        return []
+    filtro = {"Usuario": " AND rowid % 2 = 0", "Medico": " AND rowid % 2 = 1"}.get(tipo, "")
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    cursor.execute(f"""
+        SELECT rowid, nombre FROM NombresBusqueda
+        WHERE NombresBusqueda MATCH ?{filtro}
+        ORDER BY rank
+        LIMIT ?
+    """, (consulta, limite))
+    resultados = [("Medico" if rowid % 2 else "Usuario", rowid // 2, nombre) for rowid, nombre in cursor.fetchall()]
+    conexion.close()
+    return resultados
+
+def buscar_pacientes_de_medico(medico_id, texto, limite=20):
+    """
+    Como obtener_pacientes_de_medico, pero solo los pacientes cuyo nombre coincide con `texto`
+    (misma búsqueda que buscar_nombres). Sin texto, retorna los primeros `limite` pacientes.
+    """
+    consulta = _consulta_nombres(texto)
+    if consulta is None:
+        return obtener_pacientes_de_medico(medico_id, limite)
     conexion = conectar_bd()
     cursor = conexion.cursor()
     cursor.execute("""
-        SELECT id, hora FROM Horarios 
-        WHERE medico_id = ? AND fecha = ? AND estado = 'Disponible'
-    """, (medico_id, fecha))
+        SELECT U.id, (U.nombres || ' ' || U.apellidos) AS nombre_completo
+        FROM NombresBusqueda N
+        JOIN Usuarios U ON U.id = N.rowid / 2
+        WHERE NombresBusqueda MATCH ? AND N.rowid % 2 = 0
+          AND EXISTS (SELECT 1 FROM Citas C WHERE C.paciente_id = U.id AND C.medico_id = ?)
+        ORDER BY N.rank
+        LIMIT ?
+    """, (consulta, medico_id, limite))
+    data = cursor.fetchall()
+    conexion.close()
+    return data
+
+def obtener_horarios_disponibles(medico_id, fecha):
+    """
+    Obtiene los horarios disponibles para el médico en la fecha indicada, como [(id, hora), ...].
+    En modo virtual se calculan con la jornada del médico y el id es None.
+    """
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    if MODO_DISPONIBILIDAD == "virtual":
+        cursor.execute(_sql_turnos("AND M.id = ?") + """
+            SELECT NULL, T.hora FROM turnos T
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Citas C
+                WHERE C.medico_id = T.medico_id AND C.fecha = T.fecha AND C.hora = T.hora
+                  AND C.estado != 'Cancelada'
+            )
+            ORDER BY T.hora
+        """, (fecha, fecha, HORA_INICIO_JORNADA, HORA_FIN_JORNADA, DURACION_CITA_MINUTOS, medico_id))
+    else:
+        cursor.execute("""
+            SELECT id, hora FROM Horarios 
+            WHERE medico_id = ? AND fecha = ? AND estado = 'Disponible'
+        """, (medico_id, fecha))
     horarios = cursor.fetchall()
     conexion.close()
     return horarios
 
+def obtener_horarios_disponibles_rango(medico_id, fecha_inicio, fecha_fin):
+    """
+    Obtiene, con una sola consulta, las horas disponibles del médico en cada día entre
+    fecha_inicio y fecha_fin ("YYYY-MM-DD", inclusive), generando antes los horarios que falten.
+    Retorna {fecha: ["HH:MM", ...]} con todas las fechas del rango (vacía si no hay horas).
+    """
+    generar_horarios_disponibles(medico_id, fecha_inicio, fecha_fin)
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    if MODO_DISPONIBILIDAD == "virtual":
+        cursor.execute(_sql_turnos("AND M.id = ?") + """
+            SELECT T.fecha, T.hora FROM turnos T
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Citas C
+                WHERE C.medico_id = T.medico_id AND C.fecha = T.fecha AND C.hora = T.hora
+                  AND C.estado != 'Cancelada'
+            )
+            ORDER BY T.fecha, T.hora
+        """, (fecha_inicio, fecha_fin, HORA_INICIO_JORNADA, HORA_FIN_JORNADA, DURACION_CITA_MINUTOS, medico_id))
+    else:
+        cursor.execute("""
+            SELECT fecha, hora FROM Horarios
+            WHERE medico_id = ? AND fecha BETWEEN ? AND ? AND estado = 'Disponible'
+            ORDER BY fecha, hora
+        """, (medico_id, fecha_inicio, fecha_fin))
+    filas = cursor.fetchall()
+    conexion.close()
+    inicio = datetime.strptime(fecha_inicio, "%Y-%m-%d")
+    dias = (datetime.strptime(fecha_fin, "%Y-%m-%d") - inicio).days + 1
+    horas = {(inicio + timedelta(days=d)).strftime("%Y-%m-%d"): [] for d in range(dias)}
+    for fecha, hora in filas:
+        horas[fecha].append(hora)
+    return horas
+
+def _reservar_horario(cursor, medico_id, fecha, hora, cita_id=None):
+    """
+    Reclama el horario para una cita dentro de la transacción en curso.
+    En modo materializado solo pasa a 'Reservado' si seguía 'Disponible'; si el horario aún
+    no se había generado, se inserta ya reservado (la restricción UNIQUE impide que dos
+    reservas lo reclamen). En modo virtual la hora debe pertenecer a la jornada del médico y
+    no tener otra cita activa (cita_id excluye a la propia cita al reagendar).
+    Retorna True si el horario quedó reservado por esta transacción.
+    """
+    if MODO_DISPONIBILIDAD == "virtual":
+        cursor.execute(_sql_turnos("AND M.id = ?") + """
+            SELECT 1 FROM turnos T
+            WHERE T.hora = ? AND NOT EXISTS (
+                SELECT 1 FROM Citas C
+                WHERE C.medico_id = T.medico_id AND C.fecha = T.fecha AND C.hora = T.hora
+                  AND C.estado != 'Cancelada' AND C.id IS NOT ?
+            )
+        """, (fecha, fecha, HORA_INICIO_JORNADA, HORA_FIN_JORNADA, DURACION_CITA_MINUTOS,
+              medico_id, hora, cita_id))
+        return cursor.fetchone() is not None
+    cursor.execute("""
+        UPDATE Horarios SET estado = 'Reservado'
+        WHERE medico_id = ? AND fecha = ? AND hora = ? AND estado = 'Disponible'
+    """, (medico_id, fecha, hora))
+    if cursor.rowcount == 1:
+        return True
+    cursor.execute("""
+        INSERT OR IGNORE INTO Horarios (medico_id, fecha, hora, estado)
+        VALUES (?, ?, ?, 'Reservado')
+    """, (medico_id, fecha, hora))
+    return cursor.rowcount == 1
+
+def _liberar_horario(cursor, medico_id, fecha, hora):
+    """Vuelve a dejar 'Disponible' el horario (en modo virtual no hay nada que liberar)."""
+    if MODO_DISPONIBILIDAD == "virtual":
+        return
+    cursor.execute("""
+        UPDATE Horarios SET estado = 'Disponible'
+        WHERE medico_id = ? AND fecha = ? AND hora = ?
+    """, (medico_id, fecha, hora))
+
 def registrar_cita(paciente_id, medico_id, fecha, hora):
     """
-    Registra la cita del paciente y actualiza el estado del horario a 'Reservado'.
+    Registra la cita del paciente y reserva el horario en una sola transacción.
+    Si dos pacientes intentan el mismo horario a la vez, solo uno lo obtiene.
     Devuelve una tupla (resultado, mensaje).
     """
     try:
@@ -297,17 +1147,20 @@ def registrar_cita(paciente_id, medico_id, fecha, hora):
     conexion = conectar_bd()
     cursor = conexion.cursor()
     try:
+        # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer el estado del horario.
+        cursor.execute("BEGIN IMMEDIATE")
+        if not _reservar_horario(cursor, medico_id, fecha, hora):
+            conexion.rollback()
+            return False, "❌ El horario seleccionado ya no está disponible."
         cursor.execute("""
             INSERT INTO Citas (paciente_id, medico_id, fecha, hora, estado)
             VALUES (?, ?, ?, ?, 'Pendiente')
         """, (paciente_id, medico_id, fecha, hora))
-        cursor.execute("""
-            UPDATE Horarios SET estado = 'Reservado'
-            WHERE medico_id = ? AND fecha = ? AND hora = ?
-        """, (medico_id, fecha, hora))
         conexion.commit()
+        publicar_evento("agendada", cursor.lastrowid, paciente_id, medico_id)
         return True, "✅ Cita agendada con éxito."
     except sqlite3.Error as e:
+        conexion.rollback()
         return False, f"❌ Error al registrar la cita: {e}"
     finally:
         conexion.close()
@@ -333,6 +1186,34 @@ def obtener_citas_paciente(user_id):
     conexion.close()
     return citas
 
+def obtener_citas_paciente_rango(user_id, fecha_inicio, fecha_fin, por_dia=False):
+    """
+    Retorna las citas del paciente entre fecha_inicio y fecha_fin ("YYYY-MM-DD", inclusive),
+    ordenadas por fecha y hora, con el mismo formato que obtener_citas_paciente.
+    Si por_dia es True, retorna un dict {fecha: [citas de ese día]}.
+    """
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    cursor.execute("""
+        SELECT Citas.id, Citas.fecha, Especialidades.nombre, 
+               Medicos.nombres || ' ' || Medicos.apellidos AS medico, 
+               Citas.hora,
+               Medicos.id as medico_id
+        FROM Citas
+        JOIN Medicos ON Citas.medico_id = Medicos.id
+        JOIN Especialidades ON Medicos.especialidad_id = Especialidades.id
+        WHERE Citas.paciente_id = ? AND Citas.fecha BETWEEN ? AND ?
+        ORDER BY Citas.fecha, Citas.hora
+    """, (user_id, fecha_inicio, fecha_fin))
+    citas = cursor.fetchall()
+    conexion.close()
+    if not por_dia:
+        return citas
+    agrupadas = {}
+    for cita in citas:
+        agrupadas.setdefault(cita[1], []).append(cita)
+    return agrupadas
+
 def cancelar_cita(paciente_id, medico_id, fecha, hora):
     """
     Cancela la cita del paciente y libera el horario (cambia a 'Disponible').
@@ -341,20 +1222,19 @@ def cancelar_cita(paciente_id, medico_id, fecha, hora):
     conexion = conectar_bd()
     cursor = conexion.cursor()
     try:
-        cursor.execute("SELECT estado FROM Citas WHERE paciente_id = ? AND medico_id = ? AND fecha = ? AND hora = ?", 
+        cursor.execute("SELECT id, estado FROM Citas WHERE paciente_id = ? AND medico_id = ? AND fecha = ? AND hora = ?", 
                        (paciente_id, medico_id, fecha, hora))
-        estado = cursor.fetchone()
-        if estado and estado[0] in ('Presente', 'Ausente'):
+        cita = cursor.fetchone()
+        if cita and cita[1] in ('Presente', 'Ausente'):
             return False, "No se puede cancelar una cita ya atendida."
         cursor.execute("""
             DELETE FROM Citas
             WHERE paciente_id = ? AND medico_id = ? AND fecha = ? AND hora = ?
         """, (paciente_id, medico_id, fecha, hora))
-        cursor.execute("""
-            UPDATE Horarios SET estado = 'Disponible'
-            WHERE medico_id = ? AND fecha = ? AND hora = ?
-        """, (medico_id, fecha, hora))
+        _liberar_horario(cursor, medico_id, fecha, hora)
         conexion.commit()
+        if cita:
+            publicar_evento("cancelada", cita[0], paciente_id, medico_id)
         return True, "✅ Cita cancelada exitosamente."
     except sqlite3.Error as e:
         return False, f"❌ Error al cancelar la cita: {e}"
@@ -378,12 +1258,9 @@ def cancelar_cita_por_id(cita_id):
         paciente_id, medico_id, fecha, hora = row
         # En lugar de eliminar la cita, se actualiza el estado a 'Cancelada'
         cursor.execute("UPDATE Citas SET estado = 'Cancelada' WHERE id = ?", (cita_id,))
-        cursor.execute("""
-            UPDATE Horarios 
-            SET estado = 'Disponible'
-            WHERE medico_id = ? AND fecha = ? AND hora = ?
-        """, (medico_id, fecha, hora))
+        _liberar_horario(cursor, medico_id, fecha, hora)
         conexion.commit()
+        publicar_evento("cancelada", cita_id, paciente_id, medico_id)
         return True, "✅ Cita cancelada exitosamente."
     except sqlite3.Error as e:
         return False, f"❌ Error al cancelar la cita: {e}"
@@ -391,33 +1268,174 @@ def cancelar_cita_por_id(cita_id):
         conexion.close()
 
 
-def generar_horarios_disponibles(medico_id, fecha):
+def configurar_jornada(medico_id, hora_inicio, hora_fin, duracion_minutos=DURACION_CITA_MINUTOS):
     """
-    Genera horarios disponibles (cada 30 minutos) para el médico en la fecha indicada,
-    únicamente si aún no existen registros para esa fecha.
+    Define la jornada de atención del médico (horas "HH:MM" inclusive y duración de cada cita).
+    Solo afecta a los horarios que se generen a partir de ahora.
+    Devuelve (resultado, mensaje).
     """
+    try:
+        inicio = datetime.strptime(hora_inicio, "%H:%M")
+        fin = datetime.strptime(hora_fin, "%H:%M")
+    except ValueError:
+        return False, "Formato de hora inválido (use HH:MM)."
+    if fin < inicio or int(duracion_minutos) <= 0:
+        return False, "La jornada debe terminar después de empezar y la duración ser positiva."
+    conexion = conectar_bd()
+    try:
+        conexion.execute("""
+            INSERT INTO JornadasMedicos (medico_id, hora_inicio, hora_fin, duracion_minutos)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(medico_id) DO UPDATE SET
+                hora_inicio = excluded.hora_inicio,
+                hora_fin = excluded.hora_fin,
+                duracion_minutos = excluded.duracion_minutos
+        """, (medico_id, inicio.strftime("%H:%M"), fin.strftime("%H:%M"), int(duracion_minutos)))
+        conexion.commit()
+        return True, "Jornada actualizada correctamente."
+    except sqlite3.Error as e:
+        return False, f"Error al configurar la jornada: {e}"
+    finally:
+        conexion.close()
+
+def _sql_turnos(filtro_medicos=""):
+    """
+    CTEs recursivas que generan los turnos (medico_id, fecha, hora) de cada médico entre dos fechas,
+    según su jornada en JornadasMedicos o la jornada por defecto.
+    Parámetros, en orden: fecha_inicio, fecha_fin, hora_inicio, hora_fin y duración por defecto,
+    seguidos de los parámetros de filtro_medicos (condición sobre M.id).
+    """
+    return f"""
+        WITH RECURSIVE
+        dias(fecha) AS (
+            SELECT date(?)
+            UNION ALL
+            SELECT date(fecha, '+1 day') FROM dias WHERE fecha < date(?)
+        ),
+        jornadas(medico_id, inicio, fin, paso) AS (
+            SELECT M.id, COALESCE(J.hora_inicio, ?), COALESCE(J.hora_fin, ?), COALESCE(J.duracion_minutos, ?)
+            FROM Medicos M
+            LEFT JOIN JornadasMedicos J ON J.medico_id = M.id
+            WHERE 1=1 {filtro_medicos}
+        ),
+        minutos(medico_id, minuto, fin, paso) AS (
+            SELECT medico_id,
+                   CAST(substr(inicio, 1, 2) AS INTEGER) * 60 + CAST(substr(inicio, 4, 2) AS INTEGER),
+                   CAST(substr(fin, 1, 2) AS INTEGER) * 60 + CAST(substr(fin, 4, 2) AS INTEGER),
+                   paso
+            FROM jornadas
+            UNION ALL
+            SELECT medico_id, minuto + paso, fin, paso FROM minutos WHERE minuto + paso <= fin
+        ),
+        turnos(medico_id, fecha, hora) AS (
+            SELECT m.medico_id, d.fecha, printf('%02d:%02d', m.minuto / 60, m.minuto % 60)
+            FROM dias d CROSS JOIN minutos m
+        )
+    """
+
+def generar_horarios_lote(fecha_inicio, fecha_fin, medico_ids=None):
+    """
+    Genera, en una sola transacción, los horarios 'Disponible' de los médicos indicados
+    (o de todos) para cada día entre fecha_inicio y fecha_fin ("YYYY-MM-DD", inclusive).
+    Los horarios que ya existen no se modifican. Retorna la cantidad de horarios creados.
+    """
+    if MODO_DISPONIBILIDAD == "virtual":
+        return 0
+    filtro, params = "", []
+    if medico_ids is not None:
+        medico_ids = list(medico_ids)
+        if not medico_ids:
+            return 0
+        filtro = f"AND M.id IN ({', '.join('?' for _ in medico_ids)})"
+        params = medico_ids
     conexion = conectar_bd()
     cursor = conexion.cursor()
-    cursor.execute("SELECT COUNT(*) FROM Horarios WHERE medico_id = ? AND fecha = ?", (medico_id, fecha))
-    if cursor.fetchone()[0] > 0:
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        # rowcount no se informa para sentencias que empiezan con WITH; se usa total_changes.
+        cambios_previos = conexion.total_changes
+        cursor.execute(_sql_turnos(filtro) + """
+            INSERT OR IGNORE INTO Horarios (medico_id, fecha, hora, estado)
+            SELECT medico_id, fecha, hora, 'Disponible' FROM turnos
+        """, [fecha_inicio, fecha_fin, HORA_INICIO_JORNADA, HORA_FIN_JORNADA, DURACION_CITA_MINUTOS] + params)
+        creados = conexion.total_changes - cambios_previos
+        conexion.commit()
+        return creados
+    except sqlite3.Error:
+        conexion.rollback()
+        raise
+    finally:
         conexion.close()
+
+def generar_horarios_disponibles(medico_id, fecha, fecha_fin=None):
+    """
+    Genera los horarios disponibles del médico en la fecha indicada (o entre fecha y fecha_fin)
+    según su jornada, completando solo los que falten (no escribe nada si ya están generados).
+    En modo virtual no hay horarios que generar.
+    """
+    if MODO_DISPONIBILIDAD == "virtual":
         return
-    hora_actual = datetime.strptime("08:00", "%H:%M")
-    hora_fin = datetime.strptime("17:00", "%H:%M")
-    while hora_actual <= hora_fin:
-        cursor.execute("""
-            INSERT INTO Horarios (medico_id, fecha, hora, estado)
-            VALUES (?, ?, ?, 'Disponible')
-        """, (medico_id, fecha, hora_actual.strftime("%H:%M")))
-        hora_actual += timedelta(minutes=30)
-    conexion.commit()
+    fecha_fin = fecha_fin or fecha
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    cursor.execute(_sql_turnos("AND M.id = ?") + """
+        SELECT COUNT(*) FROM turnos T
+        WHERE NOT EXISTS (
+            SELECT 1 FROM Horarios H
+            WHERE H.medico_id = T.medico_id AND H.fecha = T.fecha AND H.hora = T.hora
+        )
+    """, (fecha, fecha_fin, HORA_INICIO_JORNADA, HORA_FIN_JORNADA, DURACION_CITA_MINUTOS, medico_id))
+    faltantes = cursor.fetchone()[0]
     conexion.close()
+    if faltantes:
+        generar_horarios_lote(fecha, fecha_fin, [medico_id])
 
-def obtener_todas_citas(fecha=None, medico_id=None):
+def _filtros_citas(fecha=None, medico_id=None, estados=None, fecha_desde=None, fecha_hasta=None, busqueda=None):
+    """Arma la cláusula WHERE (y sus parámetros) compartida por obtener_todas_citas y contar_citas."""
+    where = " WHERE 1=1"
+    params = []
+    if fecha:
+        where += " AND C.fecha = ?"
+        params.append(fecha)
+    if medico_id:
+        where += " AND C.medico_id = ?"
+        params.append(medico_id)
+    if estados is not None:
+        estados = list(estados)
+        if not estados:
+            where += " AND 0"
+        else:
+            where += f" AND C.estado IN ({', '.join('?' for _ in estados)})"
+            params.extend(estados)
+    if fecha_desde:
+        where += " AND C.fecha >= ?"
+        params.append(fecha_desde)
+    if fecha_hasta:
+        where += " AND C.fecha <= ?"
+        params.append(fecha_hasta)
+    consulta = _consulta_nombres(busqueda)
+    if consulta:
+        # Coincidencia por nombre de paciente (rowid par) o de médico (rowid impar) en NombresBusqueda.
+        where += """ AND (
+            C.paciente_id IN (SELECT rowid / 2 FROM NombresBusqueda WHERE NombresBusqueda MATCH ? AND rowid % 2 = 0)
+            OR C.medico_id IN (SELECT rowid / 2 FROM NombresBusqueda WHERE NombresBusqueda MATCH ? AND rowid % 2 = 1)
+        )"""
+        params.extend([consulta, consulta])
+    return where, params
+
+def obtener_todas_citas(fecha=None, medico_id=None, estados=None, fecha_desde=None, fecha_hasta=None,
+                        busqueda=None, orden="asc", limite=None, desplazamiento=None, despues_de=None):
     """
-    Retorna todas las citas. Filtra opcionalmente por fecha y/o médico.
+    Retorna las citas que cumplen los filtros indicados (todos opcionales):
+    fecha exacta, médico, conjunto de estados, rango fecha_desde..fecha_hasta y
+    búsqueda por nombre de paciente o médico (por prefijo y sin tildes, ver buscar_nombres).
+    orden es "asc" o "desc" por (fecha, hora, id). Para paginar se usa limite junto con
+    desplazamiento (OFFSET) o despues_de=(fecha, hora, id) de la última cita de la página
+    anterior (paginación por clave, que no se vuelve más lenta en las últimas páginas).
     Devuelve una lista de tuplas: (cita_id, fecha, hora, paciente, medico, estado).
     """
+    if orden not in ("asc", "desc"):
+        raise ValueError("orden debe ser 'asc' o 'desc'.")
     conexion = conectar_bd()
     cursor = conexion.cursor()
     query = """
@@ -428,25 +1446,41 @@ def obtener_todas_citas(fecha=None, medico_id=None):
         FROM Citas C
         JOIN Usuarios U ON C.paciente_id = U.id
         JOIN Medicos M ON C.medico_id = M.id
-        WHERE 1=1
     """
-    params = []
-    if fecha:
-        query += " AND C.fecha = ?"
-        params.append(fecha)
-    if medico_id:
-        query += " AND C.medico_id = ?"
-        params.append(medico_id)
-    query += " ORDER BY C.fecha, C.hora"
+    where, params = _filtros_citas(fecha, medico_id, estados, fecha_desde, fecha_hasta, busqueda)
+    query += where
+    if despues_de is not None:
+        query += f" AND (C.fecha, C.hora, C.id) {'>' if orden == 'asc' else '<'} (?, ?, ?)"
+        params.extend(despues_de)
+    query += f" ORDER BY C.fecha {orden}, C.hora {orden}, C.id {orden}"
+    if limite is not None:
+        query += " LIMIT ? OFFSET ?"
+        params.extend([limite, desplazamiento or 0])
     cursor.execute(query, params)
     citas = cursor.fetchall()
     conexion.close()
     return citas
 
+def contar_citas(fecha=None, medico_id=None, estados=None, fecha_desde=None, fecha_hasta=None, busqueda=None):
+    """Retorna cuántas citas cumplen los mismos filtros que acepta obtener_todas_citas."""
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    where, params = _filtros_citas(fecha, medico_id, estados, fecha_desde, fecha_hasta, busqueda)
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM Citas C
+        JOIN Usuarios U ON C.paciente_id = U.id
+        JOIN Medicos M ON C.medico_id = M.id
+    """ + where, params)
+    total = cursor.fetchone()[0]
+    conexion.close()
+    return total
+
 def editar_cita(cita_id, nueva_fecha, nueva_hora):
     """
     Cambia la fecha y hora de la cita, validando que la nueva fecha/hora no sean pasadas.
-    Maneja la liberación del horario anterior y la reserva del nuevo.
+    Maneja la liberación del horario anterior y la reserva del nuevo, y borra el recordatorio
+    de la fecha anterior para que se genere el de la nueva.
     """
     try:
         new_dt = datetime.strptime(f"{nueva_fecha} {nueva_hora}", "%Y-%m-%d %H:%M")
@@ -457,33 +1491,38 @@ def editar_cita(cita_id, nueva_fecha, nueva_hora):
     conexion = conectar_bd()
     cursor = conexion.cursor()
     try:
-        cursor.execute("SELECT medico_id, fecha, hora, estado FROM Citas WHERE id = ?", (cita_id,))
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT paciente_id, medico_id, fecha, hora, estado FROM Citas WHERE id = ?", (cita_id,))
         cita_row = cursor.fetchone()
         if not cita_row:
-            conexion.close()
             return False, "Cita no encontrada."
-        med_id, old_fecha, old_hora, estado = cita_row
+        pac_id, med_id, old_fecha, old_hora, estado = cita_row
         if estado != 'Pendiente':
             return False, "Solo se pueden editar citas pendientes."
-        cursor.execute("""
-            UPDATE Horarios 
-            SET estado = 'Disponible'
-            WHERE medico_id = ? AND fecha = ? AND hora = ?
-        """, (med_id, old_fecha, old_hora))
+        _liberar_horario(cursor, med_id, old_fecha, old_hora)
+        if not _reservar_horario(cursor, med_id, nueva_fecha, nueva_hora, cita_id):
+            conexion.rollback()
+            return False, "El horario seleccionado ya no está disponible."
         cursor.execute("""
             UPDATE Citas 
             SET fecha = ?, hora = ?
             WHERE id = ?
         """, (nueva_fecha, nueva_hora, cita_id))
-        cursor.execute("""
-            UPDATE Horarios
-            SET estado = 'Reservado'
-            WHERE medico_id = ? AND fecha = ? AND hora = ?
-        """, (med_id, nueva_fecha, nueva_hora))
+        # La cita conserva su id: sin esto, el índice único de Notificaciones (cita_id, paciente_id)
+        # impediría generar el recordatorio de la nueva fecha. La tabla la crea notificaciones_paciente.
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Notificaciones'")
+        if cursor.fetchone():
+            cursor.execute("DELETE FROM Notificaciones WHERE cita_id = ?", (cita_id,))
         conexion.commit()
+        publicar_evento("reagendada", cita_id, pac_id, med_id)
         return True, "Cita reagendada correctamente."
     except sqlite3.IntegrityError as e:
+        conexion.rollback()
         return False, f"Error de integridad al editar la cita: {e}"
+    except sqlite3.Error as e:
+        # Por ejemplo "database is locked" si BEGIN IMMEDIATE agota busy_timeout.
+        conexion.rollback()
+        return False, f"Error al editar la cita: {e}"
     finally:
         conexion.close()
 
@@ -496,7 +1535,7 @@ def atender_cita(cita_id, asistencia):
     conexion = conectar_bd()
     cursor = conexion.cursor()
     try:
-        cursor.execute("SELECT estado FROM Citas WHERE id = ?", (cita_id,))
+        cursor.execute("SELECT estado, paciente_id, medico_id FROM Citas WHERE id = ?", (cita_id,))
         row = cursor.fetchone()
         if not row:
             conexion.close()
@@ -506,6 +1545,7 @@ def atender_cita(cita_id, asistencia):
             return False, "Solo se pueden atender citas pendientes."
         cursor.execute("UPDATE Citas SET estado = ? WHERE id = ?", (asistencia, cita_id))
         conexion.commit()
+        publicar_evento("atendida", cita_id, row[1], row[2])
         return True, "Cita atendida correctamente."
     except sqlite3.Error as e:
         return False, f"Error al atender la cita: {e}"
@@ -523,16 +1563,56 @@ def obtener_medico_id_por_usuario_id(user_id):
     """
     Dado un user_id (Usuarios.id), retorna el id del médico (Medicos.id)
     donde Medicos.usuario_id = user_id, o None si no existe.
+    Solo se guarda en caché un id encontrado: si la fila de Medicos aún no existe (por ejemplo,
+    se consulta antes de que se confirme el registro), la próxima llamada vuelve a consultar.
     """
+    clave = ("medico_id", user_id)
+    medico_id = _cache_referencia.buscar(clave)
+    if medico_id is not None:
+        return medico_id
+    version = _cache_referencia.version
     conexion = conectar_bd()
     cursor = conexion.cursor()
     cursor.execute("SELECT id FROM Medicos WHERE usuario_id = ?", (user_id,))
     row = cursor.fetchone()
     conexion.close()
-    if row:
-        return row[0]
-    return None
+    if row is None:
+        return None
+    _cache_referencia.guardar(clave, row[0], version)
+    return row[0]
+
+def _main():
+    """
+    Punto de entrada de línea de comandos.
+    Sin argumentos crea la base de datos; con "generar-horarios" pregenera horarios por adelantado
+    y con "jornada" configura la jornada de un médico.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Administración de la base de datos de citas médicas.")
+    sub = parser.add_subparsers(dest="comando")
+    gen = sub.add_parser("generar-horarios", help="Genera horarios disponibles por adelantado.")
+    gen.add_argument("--desde", default=datetime.now().strftime("%Y-%m-%d"), help="Fecha inicial YYYY-MM-DD (hoy por defecto).")
+    gen.add_argument("--dias", type=int, default=90, help="Cantidad de días a generar (90 por defecto, un trimestre).")
+    gen.add_argument("--medico", type=int, action="append", help="Id del médico (repetible); todos por defecto.")
+    jor = sub.add_parser("jornada", help="Configura la jornada de atención de un médico.")
+    jor.add_argument("medico_id", type=int)
+    jor.add_argument("hora_inicio", help="HH:MM")
+    jor.add_argument("hora_fin", help="HH:MM")
+    jor.add_argument("duracion_minutos", type=int, nargs="?", default=DURACION_CITA_MINUTOS)
+    args = parser.parse_args()
 
-# Si se ejecuta este módulo de forma independiente, se crea la base de datos.
-if __name__ == "__main__":
     crear_base_de_datos()
+    if args.comando == "generar-horarios":
+        desde = datetime.strptime(args.desde, "%Y-%m-%d")
+        hasta = (desde + timedelta(days=args.dias - 1)).strftime("%Y-%m-%d")
+        inicio = time.perf_counter()
+        creados = generar_horarios_lote(desde.strftime("%Y-%m-%d"), hasta, args.medico)
+        print(f"✅ {creados} horarios generados del {args.desde} al {hasta} en {time.perf_counter() - inicio:.2f}s.")
+    elif args.comando == "jornada":
+        ok, mensaje = configurar_jornada(args.medico_id, args.hora_inicio, args.hora_fin, args.duracion_minutos)
+        print(("✅ " if ok else "❌ ") + mensaje)
+
+# Si se ejecuta este módulo de forma independiente, se crea la base de datos
+# (y opcionalmente se pregeneran horarios; ver _main).
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,569 @@
+"""
+Mediciones de rendimiento de la capa de datos (bd_medica).
+Cada benchmark trabaja sobre una base de datos temporal, nunca sobre citas_medicas.db.
+
+Uso:
+    python benchmark_bd.py lectura_concurrente   (el perfil concurrente debe bajar p95 y max de lectura)
+    python benchmark_bd.py reserva_concurrente
+    python benchmark_bd.py disponibilidad
+    python benchmark_bd.py calendario
+    python benchmark_bd.py notificaciones
+    python benchmark_bd.py recordatorios_globales
+    python benchmark_bd.py esquema
+    python benchmark_bd.py latencia_ui
+    python benchmark_bd.py login
+    python benchmark_bd.py hash_contrasenas
+
+Las verificaciones de comportamiento (planes de consulta, reserva con un solo ganador, recordatorios
+de citas reagendadas, orden de datos_async, hilos del planificador, flujo OAuth...) están en tests/
+y se ejecutan con `python -m pytest`.
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import bd_medica
+
+
+def _preparar_bd(ruta, medicos=5, pacientes=50):
+    """Crea una base de datos de prueba con médicos y pacientes ficticios."""
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+    bd_medica.configurar_pool(db_name=ruta)
+    bd_medica.crear_base_de_datos()
+    conexion = bd_medica.conectar_bd()
+    cursor = conexion.cursor()
+    for i in range(medicos):
+        cursor.execute("""
+            INSERT INTO Usuarios (tipo_usuario, nombres, apellidos, email, telefono, cedula, password)
+            VALUES ('Administrador', ?, ?, ?, '0999999999', ?, 'x')
+        """, (f"Medico{i}", f"Apellido{i}", f"medico{i}@bench.com", f"1{i:09d}"))
+        cursor.execute("""
+            INSERT INTO Medicos (nombres, apellidos, especialidad_id, telefono, email, usuario_id)
+            VALUES (?, ?, ?, '0999999999', ?, ?)
+        """, (f"Medico{i}", f"Apellido{i}", i % 5 + 1, f"medico{i}@bench.com", cursor.lastrowid))
+    for i in range(pacientes):
+        cursor.execute("""
+            INSERT INTO Usuarios (tipo_usuario, nombres, apellidos, email, telefono, cedula, password)
+            VALUES ('Paciente', ?, ?, ?, '0999999999', ?, 'x')
+        """, (f"Paciente{i}", f"Apellido{i}", f"paciente{i}@bench.com", f"2{i:09d}"))
+    conexion.commit()
+    medico_ids = [r[0] for r in cursor.execute("SELECT id FROM Medicos").fetchall()]
+    paciente_ids = [r[0] for r in cursor.execute("SELECT id FROM Usuarios WHERE tipo_usuario = 'Paciente'").fetchall()]
+    conexion.close()
+    return medico_ids, paciente_ids
+
+
+def _percentiles(muestras):
+    muestras = sorted(muestras)
+    return {
+        "p50": statistics.median(muestras) * 1000,
+        "p95": muestras[int(len(muestras) * 0.95) - 1] * 1000,
+        "max": muestras[-1] * 1000,
+    }
+
+
+def lectura_concurrente(perfil, escritores=4, segundos=3.0, calentamiento=1.0, dias=90):
+    """
+    Mide la latencia de obtener_todas_citas mientras varios hilos agendan citas.
+    Las lecturas del primer `calentamiento` segundos no se cuentan (pool sin conexiones abiertas,
+    caché de SQLite vacía). Hay horarios para `dias` días para que los escritores no agoten los
+    horarios libres antes de terminar.
+    La métrica que el perfil "concurrente" (WAL) debe mejorar es la cola de la latencia de lectura,
+    p95 y max, y con ella la cantidad de lecturas completadas: con journal DELETE una lectura que
+    coincide con un commit espera a que termine. La mediana no tiene por qué mejorar, porque la mayoría de las lecturas no coincide con una escritura.
+    Retorna (percentiles de lectura en ms, lecturas medidas, citas agendadas).
+    """
+    ruta = os.path.join(tempfile.gettempdir(), f"bench_lectura_{perfil}.db")
+    bd_medica.configurar_pool(perfil=perfil, tamano=escritores + 2)
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=escritores, pacientes=200)
+    fechas = [(date.today() + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(1, dias + 1)]
+    bd_medica.generar_horarios_lote(fechas[0], fechas[-1], medico_ids)
+    inicio_medicion = time.perf_counter() + calentamiento
+    fin = inicio_medicion + segundos
+    agendadas = [0] * escritores
+
+    def escritor(n):
+        medico_id = medico_ids[n]
+        i = 0
+        while time.perf_counter() < fin:
+            fecha = fechas[i % len(fechas)]
+            for hora_id, hora in bd_medica.obtener_horarios_disponibles(medico_id, fecha)[:1]:
+                ok, _ = bd_medica.registrar_cita(paciente_ids[i % len(paciente_ids)], medico_id, fecha, hora)
+                agendadas[n] += ok
+            i += 1
+
+    hilos = [threading.Thread(target=escritor, args=(n,)) for n in range(escritores)]
+    for hilo in hilos:
+        hilo.start()
+    latencias = []
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        bd_medica.obtener_todas_citas(medico_id=medico_ids[0])
+        if inicio >= inicio_medicion:
+            latencias.append(time.perf_counter() - inicio)
+    for hilo in hilos:
+        hilo.join()
+    bd_medica.cerrar_conexiones()
+    return _percentiles(latencias), len(latencias), sum(agendadas)
+
+
+def reserva_concurrente(intentos=300, rondas=5):
+    """
+    Lanza `intentos` hilos que agendan el mismo horario al mismo tiempo, `rondas` veces.
+    Retorna una lista de (ganadores, segundos) por ronda.
+    """
+    ruta = os.path.join(tempfile.gettempdir(), "bench_reserva.db")
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=1, pacientes=intentos)
+    fecha = (date.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+    bd_medica.generar_horarios_disponibles(medico_ids[0], fecha)
+    horas = [h for _, h in bd_medica.obtener_horarios_disponibles(medico_ids[0], fecha)][:rondas]
+    resultados = []
+    for hora in horas:
+        barrera = threading.Barrier(intentos)
+        ganadores = []
+
+        def agendar(paciente_id):
+            barrera.wait()
+            ok, _ = bd_medica.registrar_cita(paciente_id, medico_ids[0], fecha, hora)
+            if ok:
+                ganadores.append(paciente_id)
+
+        hilos = [threading.Thread(target=agendar, args=(pid,)) for pid in paciente_ids]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        resultados.append((len(ganadores), time.perf_counter() - inicio))
+    bd_medica.cerrar_conexiones()
+    return resultados
+
+
+def disponibilidad(modo, medicos=200, dias=365, citas=2000, consultas=2000):
+    """
+    Compara los modos de disponibilidad para `medicos` médicos durante `dias` días.
+    Retorna un dict con filas en Horarios, tamaño del archivo, tiempo de generación,
+    tiempo por cita agendada y percentiles de obtener_horarios_disponibles (ms).
+    """
+    ruta = os.path.join(tempfile.gettempdir(), f"bench_disponibilidad_{modo}.db")
+    bd_medica.configurar_disponibilidad(modo)
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=medicos, pacientes=citas)
+    desde = date.today() + timedelta(days=1)
+    fechas = [(desde + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(dias)]
+    inicio = time.perf_counter()
+    bd_medica.generar_horarios_lote(fechas[0], fechas[-1])
+    generacion = time.perf_counter() - inicio
+    azar = random.Random(42)
+    inicio = time.perf_counter()
+    for paciente_id in paciente_ids:
+        medico_id, fecha = azar.choice(medico_ids), azar.choice(fechas)
+        bd_medica.generar_horarios_disponibles(medico_id, fecha)
+        libres = bd_medica.obtener_horarios_disponibles(medico_id, fecha)
+        if libres:
+            bd_medica.registrar_cita(paciente_id, medico_id, fecha, azar.choice(libres)[1])
+    por_cita = (time.perf_counter() - inicio) / len(paciente_ids)
+    latencias = []
+    for _ in range(consultas):
+        medico_id, fecha = azar.choice(medico_ids), azar.choice(fechas)
+        inicio = time.perf_counter()
+        bd_medica.generar_horarios_disponibles(medico_id, fecha)
+        bd_medica.obtener_horarios_disponibles(medico_id, fecha)
+        latencias.append(time.perf_counter() - inicio)
+    conexion = bd_medica.conectar_bd()
+    filas = conexion.execute("SELECT COUNT(*) FROM Horarios").fetchone()[0]
+    conexion.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conexion.close()
+    bd_medica.cerrar_conexiones()
+    bd_medica.configurar_disponibilidad("materializado")
+    return {
+        "filas_horarios": filas,
+        "tamano_mb": os.path.getsize(ruta) / 1e6,
+        "generacion_s": generacion,
+        "ms_por_cita": por_cita * 1000,
+        "consulta": _percentiles(latencias),
+    }
+
+
+def _insertar_historial(paciente_id, medico_id, citas, desde=date(2000, 1, 1), estado="Presente"):
+    """Inserta directamente `citas` citas del paciente a partir de `desde` (varias por día, sin validar)."""
+    horas = [f"{h:02d}:{m:02d}" for h in range(8, 17) for m in (0, 30)]
+    conexion = bd_medica.conectar_bd()
+    conexion.executemany("""
+        INSERT INTO Citas (paciente_id, medico_id, fecha, hora, estado)
+        VALUES (?, ?, ?, ?, ?)
+    """, (
+        (paciente_id, medico_id, (desde + timedelta(days=i // 3)).strftime("%Y-%m-%d"), horas[i % 3], estado)
+        for i in range(citas)
+    ))
+    conexion.commit()
+    conexion.close()
+
+def calendario(historial=10000, repeticiones=200):
+    """
+    Compara el costo de armar un mes del calendario del paciente: cargando todo el historial
+    y filtrando en Python (forma anterior) vs. obtener_citas_paciente_rango.
+    Retorna (ms por mes antes, ms por mes ahora, citas del mes).
+    """
+    ruta = os.path.join(tempfile.gettempdir(), "bench_calendario.db")
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=1, pacientes=1)
+    _insertar_historial(paciente_ids[0], medico_ids[0], historial)
+    year, month = 2005, 6
+
+    def mes_completo():
+        return [c for c in bd_medica.obtener_citas_paciente(paciente_ids[0])
+                if (d := datetime.strptime(c[1], "%Y-%m-%d").date()).year == year and d.month == month]
+
+    def mes_rango():
+        return bd_medica.obtener_citas_paciente_rango(paciente_ids[0], f"{year}-{month:02d}-01",
+                                                      f"{year}-{month:02d}-30", por_dia=True)
+
+    tiempos = []
+    for funcion in (mes_completo, mes_rango):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        tiempos.append((time.perf_counter() - inicio) / repeticiones * 1000)
+    citas_mes = len(mes_completo())
+    assert citas_mes == sum(len(v) for v in mes_rango().values())
+    bd_medica.cerrar_conexiones()
+    return tiempos[0], tiempos[1], citas_mes
+
+
+def _generar_notificaciones_fila_por_fila(paciente_id):
+    """Forma anterior de generar_notificaciones: recorre las citas pendientes en Python."""
+    conexion = bd_medica.conectar_bd()
+    cursor = conexion.cursor()
+    now = datetime.now()
+    cursor.execute("""
+        SELECT C.id, C.fecha, C.hora, E.nombre, (M.nombres || ' ' || M.apellidos)
+        FROM Citas C
+        JOIN Medicos M ON C.medico_id = M.id
+        JOIN Especialidades E ON M.especialidad_id = E.id
+        WHERE C.paciente_id = ? AND C.estado = 'Pendiente'
+    """, (paciente_id,))
+    for cita_id, fecha_str, hora_str, especialidad, medico in cursor.fetchall():
+        cita_dt = datetime.strptime(f"{fecha_str} {hora_str}", "%Y-%m-%d %H:%M")
+        if timedelta(0) < cita_dt - now <= timedelta(hours=24):
+            cursor.execute("SELECT id FROM Notificaciones WHERE cita_id = ? AND paciente_id = ?", (cita_id, paciente_id))
+            if cursor.fetchone() is None:
+                message = f"Tienes una cita de {especialidad} con {medico} el {cita_dt.strftime('%d/%m/%Y')} a las {cita_dt.strftime('%H:%M')}."
+                cursor.execute("""
+                    INSERT INTO Notificaciones (cita_id, paciente_id, message, leido)
+                    VALUES (?, ?, ?, 0)
+                """, (cita_id, paciente_id, message))
+    conexion.commit()
+    conexion.close()
+
+def notificaciones(citas=50000, repeticiones=20):
+    """
+    Compara el costo de una pasada de recordatorios para un paciente con `citas` citas pendientes
+    (la mayoría fuera de la ventana de 24 horas): fila por fila (forma anterior) vs. generar_notificaciones.
+    Retorna (ms por pasada antes, ms por pasada ahora, notificaciones generadas).
+    """
+    import notificaciones_paciente
+    ruta = os.path.join(tempfile.gettempdir(), "bench_notificaciones.db")
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=1, pacientes=1)
+    notificaciones_paciente.crear_tabla_notificaciones()
+    # Las citas empiezan ayer para que algunas caigan dentro de las próximas 24 horas.
+    _insertar_historial(paciente_ids[0], medico_ids[0], citas, desde=date.today() - timedelta(days=1),
+                        estado="Pendiente")
+    tiempos = []
+    for funcion in (_generar_notificaciones_fila_por_fila, notificaciones_paciente.generar_notificaciones):
+        conexion = bd_medica.conectar_bd()
+        conexion.execute("DELETE FROM Notificaciones")
+        conexion.commit()
+        conexion.close()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion(paciente_ids[0])
+        tiempos.append((time.perf_counter() - inicio) / repeticiones * 1000)
+    generadas = len(notificaciones_paciente.obtener_notificaciones(paciente_ids[0]))
+    bd_medica.cerrar_conexiones()
+    return tiempos[0], tiempos[1], generadas
+
+
+def recordatorios_globales(pacientes=1000, citas_por_paciente=50):
+    """
+    Mide generar_recordatorios_globales con `pacientes` pacientes y `citas_por_paciente` citas
+    pendientes cada uno: una primera pasada y una segunda con citas agendadas después de la primera.
+    Retorna una lista de (nombre de la pasada, generadas, revisadas, segundos).
+    """
+    import notificaciones_paciente
+    ruta = os.path.join(tempfile.gettempdir(), "bench_recordatorios.db")
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=1, pacientes=pacientes)
+    notificaciones_paciente.crear_tabla_notificaciones()
+    ayer = date.today() - timedelta(days=1)
+    # El primer paciente queda sin citas hasta la pasada incremental.
+    for paciente_id in paciente_ids[1:]:
+        _insertar_historial(paciente_id, medico_ids[0], citas_por_paciente, desde=ayer, estado="Pendiente")
+    resultados = [("primera pasada", *notificaciones_paciente.generar_recordatorios_globales())]
+    _insertar_historial(paciente_ids[0], medico_ids[0], 9, desde=ayer, estado="Pendiente")
+    resultados.append(("citas nuevas", *notificaciones_paciente.generar_recordatorios_globales()))
+    bd_medica.cerrar_conexiones()
+    return resultados
+
+
+def esquema(repeticiones=2000):
+    """
+    Compara obtener_notificaciones ejecutando el DDL de Notificaciones en cada llamada
+    (forma anterior: conexión extra, CREATE TABLE IF NOT EXISTS y commit) vs. con el esquema
+    asegurado una sola vez por proceso. Retorna (llamadas/s antes, llamadas/s ahora).
+    """
+    import notificaciones_paciente
+    ruta = os.path.join(tempfile.gettempdir(), "bench_esquema.db")
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=1, pacientes=1)
+
+    def con_ddl():
+        conexion = bd_medica.conectar_bd()
+        notificaciones_paciente._esquema_notificaciones(conexion)
+        conexion.commit()
+        conexion.close()
+        notificaciones_paciente.obtener_notificaciones(paciente_ids[0])
+
+    def sin_ddl():
+        notificaciones_paciente.obtener_notificaciones(paciente_ids[0])
+
+    resultados = []
+    for funcion in (con_ddl, sin_ddl):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        resultados.append(repeticiones / (time.perf_counter() - inicio))
+    bd_medica.cerrar_conexiones()
+    return resultados[0], resultados[1]
+
+
+def latencia_ui(retardo=0.2, sesiones_lentas=4, llamadas=10):
+    """
+    Simula una base de datos lenta (cada conexión tarda `retardo` segundos en entregarse) y mide,
+    para una sesión que consulta mientras otras `sesiones_lentas` hacen lo mismo:
+    cuánto queda bloqueado el manejador del evento (llamada directa vs. datos_async.ejecutar)
+    y la latencia hasta recibir el resultado.
+    Retorna (percentiles bloqueo directo, percentiles bloqueo async, percentiles resultado async).
+    """
+    import datos_async
+    ruta = os.path.join(tempfile.gettempdir(), "bench_latencia_ui.db")
+    medico_ids, paciente_ids = _preparar_bd(ruta, medicos=1, pacientes=1)
+    conectar_original = bd_medica.conectar_bd
+
+    def conectar_lento():
+        time.sleep(retardo)
+        return conectar_original()
+
+    def consulta():
+        return bd_medica.obtener_citas_paciente(paciente_ids[0])
+
+    bd_medica.conectar_bd = conectar_lento
+    try:
+        bloqueo_directo = []
+        for _ in range(llamadas):
+            inicio = time.perf_counter()
+            consulta()
+            bloqueo_directo.append(time.perf_counter() - inicio)
+
+        lentas = [object() for _ in range(sesiones_lentas)]
+        for sesion in lentas:
+            for _ in range(llamadas):
+                datos_async.ejecutar(sesion, consulta)
+        sesion = object()
+        bloqueo_async, resultado_async = [], []
+        for _ in range(llamadas):
+            listo = threading.Event()
+            inicio = time.perf_counter()
+            datos_async.ejecutar(sesion, consulta, al_terminar=lambda _: listo.set())
+            bloqueo_async.append(time.perf_counter() - inicio)
+            listo.wait()
+            resultado_async.append(time.perf_counter() - inicio)
+        for s in lentas:
+            datos_async.ejecutar(s, lambda: None).result()
+    finally:
+        bd_medica.conectar_bd = conectar_original
+        bd_medica.cerrar_conexiones()
+    return _percentiles(bloqueo_directo), _percentiles(bloqueo_async), _percentiles(resultado_async)
+
+
+def _login_dos_consultas(email, password):
+    """Forma anterior del inicio de sesión: LOWER(email) (sin índice) y luego verificar_credenciales."""
+    email = email.strip().lower()
+    conexion = bd_medica.conectar_bd()
+    existe = conexion.execute("SELECT id FROM Usuarios WHERE LOWER(email) = ?", (email,)).fetchone()
+    conexion.close()
+    if existe is None:
+        return None
+    return bd_medica.verificar_credenciales(email, password)
+
+def login(usuarios=1000000, intentos=20000, intentos_antes=20):
+    """
+    Mide inicios de sesión por segundo con `usuarios` usuarios registrados: la forma anterior
+    (dos consultas, la primera recorre Usuarios completa) vs. autenticar_usuario.
+    Los correos se escriben con mayúsculas distintas a las guardadas. Para medir solo la búsqueda,
+    las contraseñas usan un hash de costo mínimo (el costo real se mide en hash_contrasenas).
+    Retorna (logins/s antes, logins/s ahora).
+    """
+    ruta = os.path.join(tempfile.gettempdir(), "bench_login.db")
+    algoritmo, parametros = bd_medica.ALGORITMO_HASH, dict(bd_medica._parametros_hash)
+    bd_medica.configurar_hash("pbkdf2_sha256", iteraciones=1)
+    _preparar_bd(ruta, medicos=0, pacientes=0)
+    conexion = bd_medica.conectar_bd()
+    conexion.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?)
+        INSERT INTO Usuarios (tipo_usuario, nombres, apellidos, email, telefono, cedula, password)
+        SELECT 'Paciente', 'Paciente', 'Apellido', 'paciente' || i || '@bench.com', '0999999999',
+               printf('3%09d', i), ?
+        FROM n
+    """, (usuarios, bd_medica.hash_password("clave")))
+    conexion.commit()
+    conexion.close()
+    aleatorio = random.Random(0)
+
+    def correo():
+        return f"Paciente{aleatorio.randrange(usuarios)}@Bench.com"
+
+    resultados = []
+    for funcion, n in ((_login_dos_consultas, intentos_antes), (bd_medica.autenticar_usuario, intentos)):
+        correos = [correo() for _ in range(n)]
+        inicio = time.perf_counter()
+        for email in correos:
+            funcion(email, "clave")
+        resultados.append(n / (time.perf_counter() - inicio))
+    bd_medica.cerrar_conexiones()
+    bd_medica.configurar_hash(algoritmo, **parametros)
+    return resultados[0], resultados[1]
+
+
+def hash_contrasenas(repeticiones=20, sesiones=8, logins_por_sesion=5):
+    """
+    Mide el hash de contraseñas con la configuración vigente:
+    hashes/s de cada algoritmo registrado (y del SHA-256 anterior, como referencia);
+    logins/s con `sesiones` sesiones iniciando sesión a la vez, y la latencia de una consulta
+    simple (obtener_usuario) mientras tanto.
+    Retorna (lista de (nombre, hashes/s), logins/s, percentiles de la consulta en ms).
+    """
+    ruta = os.path.join(tempfile.gettempdir(), "bench_hash.db")
+    _, paciente_ids = _preparar_bd(ruta, medicos=0, pacientes=sesiones)
+    velocidades = []
+    inicio = time.perf_counter()
+    for _ in range(repeticiones * 100):
+        hashlib.sha256(b"Clave$123").hexdigest()
+    velocidades.append(("sha256 sin sal (anterior)", repeticiones * 100 / (time.perf_counter() - inicio)))
+    for algoritmo, (_, parametros) in bd_medica._hashers.items():
+        nombre = f"{algoritmo} " + ",".join(f"{k}={v}" for k, v in parametros.items())
+        sal = os.urandom(bd_medica.BYTES_SAL)
+        derivar = bd_medica._hashers[algoritmo][0]
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            derivar(b"Clave$123", sal, **parametros)
+        velocidades.append((nombre, repeticiones / (time.perf_counter() - inicio)))
+
+    conexion = bd_medica.conectar_bd()
+    hashed = bd_medica.hash_password("Clave$123")
+    for i, paciente_id in enumerate(paciente_ids):
+        conexion.execute("UPDATE Usuarios SET email = ?, password = ? WHERE id = ?",
+                         (f"hash{i}@bench.com", hashed, paciente_id))
+    conexion.commit()
+    conexion.close()
+
+    def sesion(i):
+        for _ in range(logins_por_sesion):
+            bd_medica.autenticar_usuario(f"hash{i}@bench.com", "Clave$123")
+
+    hilos = [threading.Thread(target=sesion, args=(i,)) for i in range(sesiones)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    latencias = []
+    while any(hilo.is_alive() for hilo in hilos):
+        antes = time.perf_counter()
+        bd_medica.obtener_usuario(paciente_ids[0])
+        latencias.append(time.perf_counter() - antes)
+        time.sleep(0.005)
+    for hilo in hilos:
+        hilo.join()
+    logins = sesiones * logins_por_sesion / (time.perf_counter() - inicio)
+    bd_medica.cerrar_conexiones()
+    return velocidades, logins, _percentiles(latencias)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de la capa de datos.")
+    parser.add_argument("benchmark", choices=["lectura_concurrente", "reserva_concurrente", "disponibilidad",
+                                              "calendario", "notificaciones", "recordatorios_globales",
+                                              "esquema", "latencia_ui", "login", "hash_contrasenas"])
+    args = parser.parse_args()
+    if args.benchmark == "lectura_concurrente":
+        rondas = 5
+        perfiles = list(bd_medica.PERFILES_ALMACENAMIENTO)
+        corridas = {perfil: [] for perfil in perfiles}
+        for ronda in range(rondas):
+            # Se alterna el orden de los perfiles para no favorecer siempre al mismo.
+            for perfil in (perfiles if ronda % 2 == 0 else perfiles[::-1]):
+                corridas[perfil].append(lectura_concurrente(perfil))
+        print(f"{rondas} corridas por perfil, mediana entre corridas. Métrica esperada: p95 y max de "
+              f"lectura más bajos y más lecturas con WAL (concurrente); p50 puede quedar igual.")
+        for perfil in perfiles:
+            mediana = {clave: statistics.median(lat[clave] for lat, _, _ in corridas[perfil])
+                       for clave in ("p50", "p95", "max")}
+            p95 = sorted(lat["p95"] for lat, _, _ in corridas[perfil])
+            lecturas = statistics.median(n for _, n, _ in corridas[perfil])
+            agendadas = statistics.median(n for _, _, n in corridas[perfil])
+            print(f"{perfil:12s} lectura p50={mediana['p50']:.2f}ms p95={mediana['p95']:.2f}ms "
+                  f"(entre {p95[0]:.2f} y {p95[-1]:.2f}) max={mediana['max']:.2f}ms  "
+                  f"lecturas={lecturas:.0f} citas agendadas={agendadas:.0f}")
+    elif args.benchmark == "reserva_concurrente":
+        intentos = 300
+        resultados = reserva_concurrente(intentos)
+        for ganadores, segundos in resultados:
+            print(f"{intentos} reservas simultáneas: {ganadores} ganador(es) en {segundos:.2f}s "
+                  f"({intentos / segundos:.0f} intentos/s)")
+    elif args.benchmark == "disponibilidad":
+        for modo in bd_medica.MODOS_DISPONIBILIDAD:
+            r = disponibilidad(modo)
+            print(f"{modo:13s} filas Horarios={r['filas_horarios']} archivo={r['tamano_mb']:.1f}MB "
+                  f"generación={r['generacion_s']:.2f}s agendar={r['ms_por_cita']:.2f}ms/cita "
+                  f"consulta p50={r['consulta']['p50']:.2f}ms p95={r['consulta']['p95']:.2f}ms")
+    elif args.benchmark == "calendario":
+        antes, ahora, citas_mes = calendario()
+        print(f"Paciente con 10000 citas, mes con {citas_mes}: historial completo={antes:.2f}ms/mes "
+              f"rango={ahora:.2f}ms/mes")
+    elif args.benchmark == "notificaciones":
+        antes, ahora, generadas = notificaciones()
+        print(f"Paciente con 50000 citas pendientes ({generadas} en las próximas 24h): "
+              f"fila por fila={antes:.2f}ms/pasada  una sentencia={ahora:.2f}ms/pasada")
+    elif args.benchmark == "recordatorios_globales":
+        resultados = recordatorios_globales()
+        for nombre, generadas, revisadas, segundos in resultados:
+            print(f"{nombre:14s} generadas={generadas} citas revisadas={revisadas} en {segundos * 1000:.1f}ms "
+                  f"({revisadas / segundos:.0f} citas/s)")
+    elif args.benchmark == "esquema":
+        antes, ahora = esquema()
+        print(f"obtener_notificaciones: con DDL en cada llamada={antes:.0f} llamadas/s  "
+              f"esquema asegurado una vez={ahora:.0f} llamadas/s")
+    elif args.benchmark == "latencia_ui":
+        directo, bloqueo, resultado = latencia_ui()
+        print("BD lenta (200ms por conexión), 4 sesiones ocupadas en paralelo:")
+        print(f"  manejador bloqueado, llamada directa: p50={directo['p50']:.1f}ms p95={directo['p95']:.1f}ms")
+        print(f"  manejador bloqueado, datos_async:     p50={bloqueo['p50']:.3f}ms p95={bloqueo['p95']:.3f}ms")
+        print(f"  resultado recibido, datos_async:      p50={resultado['p50']:.1f}ms p95={resultado['p95']:.1f}ms")
+    elif args.benchmark == "login":
+        antes, ahora = login()
+        print(f"1000000 usuarios: dos consultas con LOWER(email)={antes:.1f} logins/s  "
+              f"autenticar_usuario={ahora:.0f} logins/s")
+    elif args.benchmark == "hash_contrasenas":
+        velocidades, logins, consulta = hash_contrasenas()
+        for nombre, por_segundo in velocidades:
+            print(f"{nombre:34s} {por_segundo:10.1f} hashes/s por hilo")
+        print(f"8 sesiones iniciando sesión a la vez ({bd_medica.ALGORITMO_HASH}, pool de "
+              f"{bd_medica.MAX_HASH_TRABAJADORES} hilos): {logins:.1f} logins/s; obtener_usuario mientras tanto "
+              f"p50={consulta['p50']:.2f}ms p95={consulta['p95']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
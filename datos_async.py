@@ -0,0 +1,80 @@
+"""
+Fachada asíncrona de acceso a datos para las interfaces Flet.
+Los manejadores de eventos encolan aquí las llamadas a bd_medica (u otras operaciones lentas)
+en lugar de ejecutarlas en el hilo del evento: la interfaz se actualiza de inmediato (por ejemplo,
+se muestra el indicador de carga) y el resultado llega después a una función de retorno.
+Las llamadas de una misma sesión se ejecutan en orden, una a la vez; las de sesiones distintas
+se reparten entre un máximo de MAX_TRABAJADORES hilos compartidos.
+"""
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+MAX_TRABAJADORES = 8
+
+_ejecutor = ThreadPoolExecutor(max_workers=MAX_TRABAJADORES, thread_name_prefix="datos")
+_lock = threading.Lock()
+_colas = {}  # id(sesion) -> deque de llamadas pendientes; existe mientras la sesión tenga una en curso
+
+def ejecutar(sesion, funcion, *args, al_terminar=None, al_fallar=None, clave=None, **kwargs):
+    """
+    Encola funcion(*args, **kwargs) para la sesión indicada (normalmente la página de Flet)
+    y retorna enseguida un concurrent.futures.Future con su resultado.
+    Al terminar se llama a al_terminar(resultado) o, si hubo una excepción, a al_fallar(excepcion)
+    (sin al_fallar, la excepción se imprime). Ambas se ejecutan en el hilo trabajador, antes de
+    pasar a la siguiente llamada de la misma sesión.
+    Si se indica `clave` y la sesión tiene en espera (aún sin empezar) otra llamada con la misma
+    clave, esa llamada se descarta (su Future queda cancelado) y la nueva va al final de la cola.
+    """
+    futuro = Future()
+    llamada = (funcion, args, kwargs, al_terminar, al_fallar, futuro, clave)
+    clave_sesion = id(sesion)
+    with _lock:
+        cola = _colas.get(clave_sesion)
+        if cola is not None:
+            # La sesión ya tiene una llamada en curso: esta se ejecuta después.
+            if clave is not None:
+                for previa in [p for p in cola if p[6] == clave]:
+                    cola.remove(previa)
+                    previa[5].cancel()
+            cola.append(llamada)
+            return futuro
+        _colas[clave_sesion] = deque()
+    _ejecutor.submit(_trabajar, clave_sesion, llamada)
+    return futuro
+
+def pendientes(sesion):
+    """Retorna cuántas llamadas de la sesión esperan detrás de la que está en curso."""
+    with _lock:
+        cola = _colas.get(id(sesion))
+        return len(cola) if cola is not None else 0
+
+def _trabajar(clave_sesion, llamada):
+    while llamada is not None:
+        funcion, args, kwargs, al_terminar, al_fallar, futuro, _ = llamada
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            futuro.set_exception(e)
+            _notificar(al_fallar, e, error=e)
+        else:
+            futuro.set_result(resultado)
+            _notificar(al_terminar, resultado)
+        with _lock:
+            cola = _colas[clave_sesion]
+            if cola:
+                llamada = cola.popleft()
+            else:
+                del _colas[clave_sesion]
+                llamada = None
+
+def _notificar(funcion, valor, error=None):
+    if funcion is None:
+        if error is not None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        return
+    try:
+        funcion(valor)
+    except Exception:
+        traceback.print_exc()
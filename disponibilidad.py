@@ -0,0 +1,72 @@
+"""
+Caché de horas disponibles por (médico, fecha) para el panel de agendamiento del paciente.
+Al elegir un médico se precarga en segundo plano una ventana de los próximos días con una sola
+consulta; después, cambiar de fecha o abrir el diálogo de edición no consulta la base de datos.
+Las entradas de un médico se invalidan con los eventos de citas del bus de bd_medica y, por
+cambios hechos desde otro proceso, vencen a los TTL_DISPONIBILIDAD segundos.
+"""
+from datetime import date, timedelta
+
+import datos_async
+from bd_medica import CacheReferencia, obtener_horarios_disponibles_rango, suscribir
+
+# Días (desde hoy) que se precargan al elegir un médico.
+DIAS_PRECARGA = 14
+TTL_DISPONIBILIDAD = 60
+TAMANO_CACHE_DISPONIBILIDAD = 4096
+
+_cache = CacheReferencia(tamano=TAMANO_CACHE_DISPONIBILIDAD, ttl=TTL_DISPONIBILIDAD)
+
+def horas_libres(medico_id, fecha):
+    """Retorna las horas disponibles ["HH:MM", ...] del médico en la fecha ("YYYY-MM-DD")."""
+    horas = _cache.buscar((medico_id, fecha))
+    if horas is None:
+        horas = _cargar(medico_id, fecha, fecha)[fecha]
+    return list(horas)
+
+def dias_con_horas(medico_id, desde=None, dias=DIAS_PRECARGA):
+    """
+    Retorna las fechas ("YYYY-MM-DD") de la ventana [desde, desde + dias) en las que el médico
+    tiene al menos una hora disponible. Si falta algún día en la caché, la ventana completa se
+    carga con una sola consulta.
+    """
+    desde = desde or date.today()
+    fechas = [(desde + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(dias)]
+    horas = {fecha: _cache.buscar((medico_id, fecha)) for fecha in fechas}
+    if any(h is None for h in horas.values()):
+        horas = _cargar(medico_id, fechas[0], fechas[-1])
+    return [fecha for fecha in fechas if horas[fecha]]
+
+def precargar(sesion, medico_id, al_terminar=None):
+    """
+    Precarga con datos_async, en la cola de la sesión, la ventana de DIAS_PRECARGA días del médico
+    y, si se indica, llama a al_terminar(fechas con horas disponibles). La carga puede escribir
+    Horarios, así que no se hace en el hilo del planificador. Una precarga nueva de la misma sesión
+    reemplaza a la que aún no empezó.
+    """
+    datos_async.ejecutar(sesion, dias_con_horas, medico_id, al_terminar=al_terminar, clave="precarga-disponibilidad")
+
+def invalidar(medico_id=None):
+    """Descarta las horas en caché de un médico (o de todos)."""
+    if medico_id is None:
+        _cache.invalidar()
+    else:
+        _cache.invalidar(lambda clave: clave[0] == medico_id)
+
+def estadisticas():
+    """Retorna un dict con aciertos, fallos, vencidas, invalidaciones y entradas de la caché."""
+    return _cache.estadisticas_actuales()
+
+def _cargar(medico_id, fecha_inicio, fecha_fin):
+    version = _cache.version
+    horas = obtener_horarios_disponibles_rango(medico_id, fecha_inicio, fecha_fin)
+    for fecha, horas_dia in horas.items():
+        _cache.guardar((medico_id, fecha), tuple(horas_dia), version)
+    return horas
+
+def _on_evento_cita(evento):
+    # Reagendar cambia dos fechas y el evento no trae ninguna: se descarta todo el médico.
+    if evento["medico_id"] is not None:
+        invalidar(evento["medico_id"])
+
+suscribir("*", _on_evento_cita)
@@ -1,8 +1,11 @@
 import flet as ft
 import datetime
-from datetime import date, datetime as dt, timedelta
+from datetime import date, datetime as dt
 import calendar
 
+import datos_async
+import disponibilidad
+import planificador
 from bd_medica import (
     obtener_todas_citas,
     registrar_cita_admin,
@@ -11,9 +14,51 @@ from bd_medica import (
     actualizar_datos_usuario,
     obtener_medico_id_por_usuario_id,
     cancelar_cita_por_id,  # Asegúrate de tener la versión modificada (actualiza el estado a 'Cancelada')
-    atender_cita
+    atender_cita,
+    buscar_pacientes_de_medico,
+    obtener_medicos,
+    suscribir,
+    cancelar_suscripcion
 )
 
+# Cantidad de citas por página en las pestañas "Citas Activas" e "Historial".
+TAMANO_PAGINA = 50
+ESTADOS_HISTORIAL = ["Presente", "Ausente", "Cancelada"]
+# Segundos sin teclear antes de lanzar la búsqueda en vivo.
+RETARDO_BUSQUEDA = 0.3
+
+def busqueda_diferida(page, clave, consultar, aplicar, retardo=RETARDO_BUSQUEDA):
+    """
+    Retorna una función disparar() para usar en on_change de un campo de búsqueda.
+    Cada llamada reinicia la espera en el planificador; cuando pasan `retardo` segundos sin
+    llamadas, consultar() se encola en datos_async con `clave`: reemplaza a la carga de la misma
+    lista que aún no empezó y se ejecuta en orden con las demás consultas de la sesión, así que
+    aplicar(resultado) nunca recibe una lista más vieja que la última pedida.
+    """
+    def encolar():
+        datos_async.ejecutar(page, consultar, al_terminar=aplicar, clave=clave)
+
+    def disparar(e=None):
+        planificador.programar((id(page), clave), encolar, retraso=retardo)
+
+    return disparar
+
+def actualizar_filas(filas_previas, registros, crear_fila):
+    """
+    Retorna las DataRow de `registros` reutilizando las de `filas_previas` (dict registro -> fila)
+    para los registros que no cambiaron, de modo que Flet solo envíe las filas nuevas o quitadas.
+    Actualiza filas_previas con las filas actuales.
+    """
+    filas = []
+    actuales = {}
+    for registro in registros:
+        fila = filas_previas.get(registro) or crear_fila(registro)
+        actuales[registro] = fila
+        filas.append(fila)
+    filas_previas.clear()
+    filas_previas.update(actuales)
+    return filas
+
 def main(page: ft.Page, admin_id: int):
     # Se obtiene el id del médico correspondiente al administrador logueado.
     medico_id = obtener_medico_id_por_usuario_id(admin_id)
@@ -52,6 +97,7 @@ def main(page: ft.Page, admin_id: int):
         page.update()
 
     def cerrar_sesion(e):
+        terminar_sesion()
         page.clean()
         import login_flet
         login_flet.main(page)
@@ -99,7 +145,12 @@ def main(page: ft.Page, admin_id: int):
                 msg.value = "Las contraseñas no coinciden."
                 page.update()
                 return
-            ok, mensaje = cambiar_contrasena(admin_id, pw_curr, pw_new)
+            # El hash de la contraseña es costoso: se calcula fuera del hilo del evento.
+            msg.value = "Actualizando la contraseña..."
+            page.update()
+            datos_async.ejecutar(page, cambiar_contrasena, admin_id, pw_curr, pw_new, al_terminar=mostrar_resultado)
+        def mostrar_resultado(resultado):
+            ok, mensaje = resultado
             if ok:
                 page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="green")
                 dialog.open = False
@@ -146,7 +197,10 @@ def main(page: ft.Page, admin_id: int):
                 msg.value = "Ningún campo puede quedar vacío."
                 page.update()
                 return
-            ok, texto = actualizar_datos_usuario(admin_id, n, a, em, t)
+            datos_async.ejecutar(page, actualizar_datos_usuario, admin_id, n, a, em, t,
+                                 al_terminar=mostrar_resultado)
+        def mostrar_resultado(resultado):
+            ok, texto = resultado
             if ok:
                 page.snack_bar = ft.SnackBar(ft.Text(texto, color="white"), bgcolor="green")
                 dial.open = False
@@ -178,6 +232,7 @@ def main(page: ft.Page, admin_id: int):
 
     def cerrar_sesion_dialog(e):
         def do_cerrar_sesion(e2):
+            terminar_sesion()
             dialog.open = False
             page.update()
             page.clean()
@@ -275,11 +330,28 @@ def main(page: ft.Page, admin_id: int):
         on_click=lambda e: [
             setattr(filter_date_active, "value", None),
             setattr(filter_search_active, "value", ""),
-            cargar_citas_activas(),
+            cargar_citas_activas(reiniciar=True),
             page.update()
         ]
     )
 
+    def cambiar_pagina(paginas, cargar, avanzar, boton_siguiente):
+        if avanzar and boton_siguiente.data:
+            paginas.append(boton_siguiente.data)
+        elif not avanzar and len(paginas) > 1:
+            paginas.pop()
+        cargar()
+
+    texto_pagina_activas = ft.Text("Página 1")
+    btn_anterior_activas = ft.IconButton(
+        icon=ft.icons.CHEVRON_LEFT, tooltip="Página anterior", disabled=True,
+        on_click=lambda e: cambiar_pagina(paginas_activas, cargar_citas_activas, False, btn_siguiente_activas)
+    )
+    btn_siguiente_activas = ft.IconButton(
+        icon=ft.icons.CHEVRON_RIGHT, tooltip="Página siguiente", disabled=True,
+        on_click=lambda e: cambiar_pagina(paginas_activas, cargar_citas_activas, True, btn_siguiente_activas)
+    )
+
     citas_data_table = ft.DataTable(
         columns=[
             ft.DataColumn(ft.Text("Fecha")),
@@ -292,76 +364,95 @@ def main(page: ft.Page, admin_id: int):
         rows=[]
     )
 
-    def cargar_citas_activas():
-        citas = obtener_todas_citas(medico_id=medico_id)
-        active = [c for c in citas if c[5].strip().lower() == "pendiente"]
+    # Paginación por clave: inicio de cada página visitada, (fecha, hora, id) de la última cita de la anterior.
+    paginas_activas = [None]
+
+    filas_activas = {}
+
+    def mostrar_resultado_cita(resultado):
+        ok, mensaje = resultado
+        page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="green" if ok else "red")
+        page.snack_bar.open = True
+        cargar_citas_activas()
+        cargar_historial()
+        page.update()
+
+    def crear_fila_activa(c):
+        c_id, c_fecha, c_hora, c_paciente, c_medico, c_estado = c
+        def atender_cita_click(e, cid=c_id):
+            def confirmar_atencion(asistencia):
+                def on_confirm():
+                    datos_async.ejecutar(page, atender_cita, cid, asistencia, al_terminar=mostrar_resultado_cita)
+                dialog_confirmacion("Atender Cita", f"¿Está seguro de marcar esta cita como {asistencia}?", on_confirm)
+            atencion_dlg = ft.AlertDialog(
+                modal=True,
+                title=ft.Text("Atender Cita"),
+                content=ft.Column([
+                    ft.ElevatedButton("Presente", on_click=lambda e: confirmar_atencion("Presente")),
+                    ft.ElevatedButton("Ausente", on_click=lambda e: confirmar_atencion("Ausente")),
+                    ft.TextButton("Cancelar", on_click=lambda e: [setattr(atencion_dlg, "open", False), page.update()])
+                ], spacing=10, tight=True),
+                actions_alignment="end"
+            )
+            if atencion_dlg not in page.overlay:
+                page.overlay.append(atencion_dlg)
+            atencion_dlg.open = True
+            page.update()
+        def cancelar_cita_click(e, cid=c_id):
+            def do_cancel():
+                datos_async.ejecutar(page, cancelar_cita_por_id, cid, al_terminar=mostrar_resultado_cita)
+            dialog_confirmacion("Cancelar Cita", "¿Está seguro de cancelar esta cita?", do_cancel)
+        acciones = ft.Row([
+            ft.ElevatedButton("Atender", on_click=atender_cita_click, icon=ft.icons.CHECK, icon_color="white", bgcolor="blue", color="white"),
+            ft.ElevatedButton("Cancelar", on_click=cancelar_cita_click, icon=ft.icons.DELETE, icon_color="white", bgcolor="red", color="white")
+        ], spacing=5)
+        return ft.DataRow(cells=[
+            ft.DataCell(ft.Text(c_fecha)),
+            ft.DataCell(ft.Text(c_hora)),
+            ft.DataCell(ft.Text(c_paciente)),
+            ft.DataCell(ft.Text(c_medico)),
+            ft.DataCell(ft.Text(c_estado)),
+            ft.DataCell(acciones)
+        ])
+
+    def consultar_citas_activas():
         fecha_filter = filter_date_active.value.strftime("%Y-%m-%d") if filter_date_active.value else None
-        search_filter = filter_search_active.value.strip().lower() if filter_search_active.value else ""
-        filtradas = []
-        for c in active:
-            _, fecha, hora, paciente, medico, estado = c
-            if fecha_filter and fecha != fecha_filter:
-                continue
-            if search_filter and (search_filter not in paciente.lower() and search_filter not in medico.lower()):
-                continue
-            filtradas.append(c)
-        citas_data_table.rows.clear()
-        for c in filtradas:
-            c_id, c_fecha, c_hora, c_paciente, c_medico, c_estado = c
-            def atender_cita_click(e, cid=c_id):
-                def confirmar_atencion(asistencia):
-                    def on_confirm():
-                        ok, mensaje = atender_cita(cid, asistencia)
-                        if ok:
-                            page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="green")
-                        else:
-                            page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="red")
-                        page.snack_bar.open = True
-                        cargar_citas_activas()
-                        cargar_historial()
-                        page.update()
-                    dialog_confirmacion("Atender Cita", f"¿Está seguro de marcar esta cita como {asistencia}?", on_confirm)
-                atencion_dlg = ft.AlertDialog(
-                    modal=True,
-                    title=ft.Text("Atender Cita"),
-                    content=ft.Column([
-                        ft.ElevatedButton("Presente", on_click=lambda e: confirmar_atencion("Presente")),
-                        ft.ElevatedButton("Ausente", on_click=lambda e: confirmar_atencion("Ausente")),
-                        ft.TextButton("Cancelar", on_click=lambda e: [setattr(atencion_dlg, "open", False), page.update()])
-                    ], spacing=10, tight=True),
-                    actions_alignment="end"
-                )
-                if atencion_dlg not in page.overlay:
-                    page.overlay.append(atencion_dlg)
-                atencion_dlg.open = True
-                page.update()
-            def cancelar_cita_click(e, cid=c_id):
-                def do_cancel():
-                    ok, mensaje = cancelar_cita_por_id(cid)
-                    if ok:
-                        page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="green")
-                    else:
-                        page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="red")
-                    page.snack_bar.open = True
-                    cargar_citas_activas()
-                    cargar_historial()
-                    page.update()
-                dialog_confirmacion("Cancelar Cita", "¿Está seguro de cancelar esta cita?", do_cancel)
-            acciones = ft.Row([
-                ft.ElevatedButton("Atender", on_click=atender_cita_click, icon=ft.icons.CHECK, icon_color="white", bgcolor="blue", color="white"),
-                ft.ElevatedButton("Cancelar", on_click=cancelar_cita_click, icon=ft.icons.DELETE, icon_color="white", bgcolor="red", color="white")
-            ], spacing=5)
-            row = ft.DataRow(cells=[
-                ft.DataCell(ft.Text(c_fecha)),
-                ft.DataCell(ft.Text(c_hora)),
-                ft.DataCell(ft.Text(c_paciente)),
-                ft.DataCell(ft.Text(c_medico)),
-                ft.DataCell(ft.Text(c_estado)),
-                ft.DataCell(acciones)
-            ])
-            citas_data_table.rows.append(row)
+        search_filter = filter_search_active.value.strip() if filter_search_active.value else ""
+        return obtener_todas_citas(
+            medico_id=medico_id,
+            estados=["Pendiente"],
+            fecha=fecha_filter,
+            busqueda=search_filter or None,
+            limite=TAMANO_PAGINA + 1,
+            despues_de=paginas_activas[-1]
+        )
+
+    def mostrar_citas_activas(filtradas):
+        if not filtradas and len(paginas_activas) > 1:
+            # La página quedó vacía (p. ej. se atendió su última cita): se vuelve a la anterior.
+            paginas_activas.pop()
+            cargar_citas_activas()
+            return
+        hay_siguiente = len(filtradas) > TAMANO_PAGINA
+        filtradas = filtradas[:TAMANO_PAGINA]
+        btn_anterior_activas.disabled = len(paginas_activas) == 1
+        btn_siguiente_activas.disabled = not hay_siguiente
+        btn_siguiente_activas.data = (filtradas[-1][1], filtradas[-1][2], filtradas[-1][0]) if hay_siguiente else None
+        texto_pagina_activas.value = f"Página {len(paginas_activas)}"
+        citas_data_table.rows = actualizar_filas(filas_activas, filtradas, crear_fila_activa)
         page.update()
 
+    def cargar_citas_activas(reiniciar=False):
+        if reiniciar:
+            del paginas_activas[1:]
+        datos_async.ejecutar(page, consultar_citas_activas, al_terminar=mostrar_citas_activas, clave="citas-activas")
+
+    buscar_activas_diferido = busqueda_diferida(page, "citas-activas", consultar_citas_activas, mostrar_citas_activas)
+
+    def buscar_activas_en_vivo(e):
+        del paginas_activas[1:]
+        buscar_activas_diferido()
+
     # ------------- TAB 2: AGENDAR CITA -------------
     paciente_dropdown = ft.Dropdown(label="Paciente", width=200, options=[])
     medico2_dropdown = ft.Dropdown(label="Médico", width=200, options=[])
@@ -369,46 +460,48 @@ def main(page: ft.Page, admin_id: int):
     hora_dropdown_agendar = ft.Dropdown(label="Hora disponible", width=150, options=[])
     msg_agendar = ft.Text(color="red")
 
-    def cargar_pacientes_y_medicos():
-        paciente_dropdown.options.clear()
-        from bd_medica import obtener_pacientes_de_medico
-        pacientes_dropdown_data = obtener_pacientes_de_medico(medico_id)
-        for pid, pnombre in pacientes_dropdown_data:
-            paciente_dropdown.options.append(ft.dropdown.Option(key=str(pid), text=pnombre))
+    buscar_paciente_tf = ft.TextField(label="Buscar paciente", width=200)
+
+    def consultar_pacientes():
+        # Solo se listan los pacientes que coinciden con lo escrito (hasta 20), no todos.
+        return buscar_pacientes_de_medico(medico_id, buscar_paciente_tf.value or "")
+
+    def mostrar_pacientes(pacientes_dropdown_data):
+        paciente_dropdown.options = [ft.dropdown.Option(key=str(pid), text=pnombre)
+                                     for pid, pnombre in pacientes_dropdown_data]
         paciente_dropdown.value = None
-        from bd_medica import obtener_medicos
-        med_list = obtener_medicos(usuario_id=admin_id)
-        medico2_dropdown.options.clear()
-        for m_ in med_list:
-            mid, mname = m_
-            medico2_dropdown.options.append(ft.dropdown.Option(key=str(mid), text=mname))
+        page.update()
+
+    buscar_paciente_tf.on_change = busqueda_diferida(page, "pacientes", consultar_pacientes, mostrar_pacientes)
+
+    def mostrar_medicos(med_list):
+        medico2_dropdown.options = [ft.dropdown.Option(key=str(mid), text=mname) for mid, mname in med_list]
         medico2_dropdown.value = None
         page.update()
 
+    def cargar_pacientes_y_medicos():
+        datos_async.ejecutar(page, consultar_pacientes, al_terminar=mostrar_pacientes, clave="pacientes")
+        datos_async.ejecutar(page, obtener_medicos, usuario_id=admin_id, al_terminar=mostrar_medicos)
+
     cargar_pacientes_y_medicos()
 
     def actualizar_horas_agendar(e):
         if not medico2_dropdown.value or date_picker_agendar.value is None:
             return
         med_id = int(medico2_dropdown.value)
-        fecha_str = date_picker_agendar.value.strftime("%Y-%m-%d")
-        from bd_medica import obtener_horarios_disponibles
-        horarios = obtener_horarios_disponibles(med_id, fecha_str)
-        if not horarios:
-            horarios = []
-            inicio = dt.strptime("08:00", "%H:%M")
-            fin = dt.strptime("17:00", "%H:%M")
-            while inicio <= fin:
-                hora_str = inicio.strftime("%H:%M")
-                if date_picker_agendar.value == date.today():
-                    if inicio.time() >= dt.now().time():
-                        horarios.append((None, hora_str))
-                else:
-                    horarios.append((None, hora_str))
-                inicio += timedelta(minutes=30)
-        hora_dropdown_agendar.options = [ft.dropdown.Option(text=h[1], key=h[1]) for h in horarios]
-        hora_dropdown_agendar.value = None
-        page.update()
+        fecha_sel = date_picker_agendar.value
+        # Las horas salen de la jornada configurada del médico (y del modo de disponibilidad);
+        # si no queda ninguna, no se inventan turnos.
+        def mostrar_horas(horas):
+            if fecha_sel == date.today():
+                ahora = dt.now().strftime("%H:%M")
+                horas = [h for h in horas if h > ahora]
+            hora_dropdown_agendar.options = [ft.dropdown.Option(text=h, key=h) for h in horas]
+            hora_dropdown_agendar.value = None
+            msg_agendar.value = "" if horas else "Sin horarios disponibles para esa fecha."
+            page.update()
+        datos_async.ejecutar(page, disponibilidad.horas_libres, med_id, fecha_sel.strftime("%Y-%m-%d"),
+                             al_terminar=mostrar_horas)
 
     date_picker_agendar.on_change = lambda e: actualizar_horas_agendar(e)
     medico2_dropdown.on_change = actualizar_horas_agendar
@@ -428,7 +521,9 @@ def main(page: ft.Page, admin_id: int):
         fecha = date_picker_agendar.value.strftime("%Y-%m-%d")
         hora = hora_dropdown_agendar.value
         def do_agendar():
-            ok, mensaje = registrar_cita_admin(pac_id, med_id, fecha, hora)
+            datos_async.ejecutar(page, registrar_cita_admin, pac_id, med_id, fecha, hora, al_terminar=mostrar_resultado)
+        def mostrar_resultado(resultado):
+            ok, mensaje = resultado
             if ok:
                 page.snack_bar = ft.SnackBar(ft.Text(mensaje + " ✅", color="white"), bgcolor="green")
                 paciente_dropdown.value = None
@@ -446,6 +541,7 @@ def main(page: ft.Page, admin_id: int):
 
     tab_agendar = ft.Column([
         ft.Text("Agendar una nueva cita para un paciente", size=16, weight="bold"),
+        buscar_paciente_tf,
         paciente_dropdown,
         medico2_dropdown,
         ft.Row([
@@ -459,39 +555,58 @@ def main(page: ft.Page, admin_id: int):
 
     # ------------- TAB 3: HISTORIAL DE CITAS -------------
     # Se incluirán las citas cuyo estado sea "presente", "ausente" o "cancelada"
-    def cargar_historial():
-        citas = obtener_todas_citas(medico_id=medico_id)
-        historial = [c for c in citas if c[5].strip().lower() in ["presente", "ausente", "cancelada"]]
+    # El historial se muestra de la cita más reciente a la más antigua.
+    paginas_historial = [None]
+
+    filas_historial = {}
+
+    def crear_fila_historial(c):
+        c_id, c_fecha, c_hora, c_paciente, c_medico, c_estado = c
+        return ft.DataRow(cells=[
+            ft.DataCell(ft.Text(c_fecha)),
+            ft.DataCell(ft.Text(c_hora)),
+            ft.DataCell(ft.Text(c_paciente)),
+            ft.DataCell(ft.Text(c_medico)),
+            ft.DataCell(ft.Text(c_estado)),
+        ])
+
+    def consultar_historial():
         estado_val = filtro_estado.value.strip() if filtro_estado.value else ""
         estado_filter = estado_val if (estado_val and estado_val.lower() != "todos") else None
+        estados = [e for e in ESTADOS_HISTORIAL if not estado_filter or e.lower() == estado_filter.lower()]
         fecha_filter = filtro_datepicker.value.strftime("%Y-%m-%d") if filtro_datepicker.value else None
-        busqueda = campo_busqueda.value.strip().lower() if campo_busqueda.value else ""
-        resultados = []
-        if not estado_filter and not fecha_filter and not busqueda:
-            resultados = historial
-        else:
-            for c in historial:
-                _, fecha, hora, paciente, medico, estado = c
-                if estado_filter and estado.strip().lower() != estado_filter.lower():
-                    continue
-                if fecha_filter and fecha != fecha_filter:
-                    continue
-                if busqueda and (busqueda not in paciente.lower() and busqueda not in medico.lower()):
-                    continue
-                resultados.append(c)
-        historial_data_table.rows.clear()
-        for c in resultados:
-            c_id, c_fecha, c_hora, c_paciente, c_medico, c_estado = c
-            row = ft.DataRow(cells=[
-                ft.DataCell(ft.Text(c_fecha)),
-                ft.DataCell(ft.Text(c_hora)),
-                ft.DataCell(ft.Text(c_paciente)),
-                ft.DataCell(ft.Text(c_medico)),
-                ft.DataCell(ft.Text(c_estado)),
-            ])
-            historial_data_table.rows.append(row)
+        busqueda = campo_busqueda.value.strip() if campo_busqueda.value else ""
+        return obtener_todas_citas(
+            medico_id=medico_id,
+            estados=estados,
+            fecha=fecha_filter,
+            busqueda=busqueda or None,
+            orden="desc",
+            limite=TAMANO_PAGINA + 1,
+            despues_de=paginas_historial[-1]
+        )
+
+    def mostrar_historial(resultados):
+        hay_siguiente = len(resultados) > TAMANO_PAGINA
+        resultados = resultados[:TAMANO_PAGINA]
+        btn_anterior_historial.disabled = len(paginas_historial) == 1
+        btn_siguiente_historial.disabled = not hay_siguiente
+        btn_siguiente_historial.data = (resultados[-1][1], resultados[-1][2], resultados[-1][0]) if hay_siguiente else None
+        texto_pagina_historial.value = f"Página {len(paginas_historial)}"
+        historial_data_table.rows = actualizar_filas(filas_historial, resultados, crear_fila_historial)
         page.update()
 
+    def cargar_historial(reiniciar=False):
+        if reiniciar:
+            del paginas_historial[1:]
+        datos_async.ejecutar(page, consultar_historial, al_terminar=mostrar_historial, clave="historial")
+
+    buscar_historial_diferido = busqueda_diferida(page, "historial", consultar_historial, mostrar_historial)
+
+    def buscar_historial_en_vivo(e):
+        del paginas_historial[1:]
+        buscar_historial_diferido()
+
     filtro_estado = ft.Dropdown(
         label="Estado",
         options=[
@@ -514,10 +629,19 @@ def main(page: ft.Page, admin_id: int):
             setattr(filtro_estado, "value", ""),
             setattr(filtro_datepicker, "value", None),
             setattr(campo_busqueda, "value", ""),
-            cargar_historial(),
+            cargar_historial(reiniciar=True),
             page.update()
         ]
     )
+    texto_pagina_historial = ft.Text("Página 1")
+    btn_anterior_historial = ft.IconButton(
+        icon=ft.icons.CHEVRON_LEFT, tooltip="Página anterior", disabled=True,
+        on_click=lambda e: cambiar_pagina(paginas_historial, cargar_historial, False, btn_siguiente_historial)
+    )
+    btn_siguiente_historial = ft.IconButton(
+        icon=ft.icons.CHEVRON_RIGHT, tooltip="Página siguiente", disabled=True,
+        on_click=lambda e: cambiar_pagina(paginas_historial, cargar_historial, True, btn_siguiente_historial)
+    )
     historial_data_table = ft.DataTable(
         columns=[
             ft.DataColumn(ft.Text("Fecha")),
@@ -537,10 +661,12 @@ def main(page: ft.Page, admin_id: int):
     )
 
     def buscar_historial(e):
-        cargar_historial()
+        cargar_historial(reiniciar=True)
 
-    filtro_estado.on_change = lambda e: cargar_historial()
-    filtro_datepicker.on_change = lambda e: cargar_historial()
+    filtro_estado.on_change = lambda e: cargar_historial(reiniciar=True)
+    filtro_datepicker.on_change = lambda e: cargar_historial(reiniciar=True)
+    campo_busqueda.on_submit = buscar_historial
+    campo_busqueda.on_change = buscar_historial_en_vivo
 
     tab_historial = ft.Column([
         ft.Text("Historial de Citas", size=16, weight="bold"),
@@ -552,7 +678,9 @@ def main(page: ft.Page, admin_id: int):
             ft.ElevatedButton("Buscar", on_click=buscar_historial),
             btn_actualizar
         ], spacing=10),
-        scrollable_historial
+        scrollable_historial,
+        ft.Row([btn_anterior_historial, texto_pagina_historial, btn_siguiente_historial],
+               alignment=ft.MainAxisAlignment.CENTER)
     ], spacing=10, expand=True)
 
     scrollable_table = ft.ListView(
@@ -562,7 +690,10 @@ def main(page: ft.Page, admin_id: int):
     )
 
     # Definición de controles para la pestaña "Citas Activas"
-    filter_search_active = ft.TextField(label="Buscar (Paciente/Médico)")
+    filter_search_active = ft.TextField(label="Buscar (Paciente/Médico)",
+                                        on_change=buscar_activas_en_vivo,
+                                        on_submit=lambda e: cargar_citas_activas(reiniciar=True))
+    filter_date_active.on_change = lambda e: cargar_citas_activas(reiniciar=True)
 
     tabs = ft.Tabs(
         selected_index=0,
@@ -573,7 +704,9 @@ def main(page: ft.Page, admin_id: int):
                     filter_search_active,
                     btn_refresh_active
                 ], spacing=10),
-                scrollable_table
+                scrollable_table,
+                ft.Row([btn_anterior_activas, texto_pagina_activas, btn_siguiente_activas],
+                       alignment=ft.MainAxisAlignment.CENTER)
             ])),
             ft.Tab(text="Agendar Cita", content=tab_agendar),
             ft.Tab(text="Historial", content=tab_historial),
@@ -588,6 +721,21 @@ def main(page: ft.Page, admin_id: int):
         tabs
     ], spacing=10, expand=True)
 
+    # Las tablas se recargan cuando cambia alguna cita del médico (desde esta sesión,
+    # la de un paciente o la de administración), en lugar de consultar periódicamente.
+    def on_evento_cita(evento):
+        cargar_citas_activas()
+        cargar_historial()
+
+    def terminar_sesion():
+        cancelar_suscripcion(("medico", medico_id), on_evento_cita)
+        planificador.cancelar((id(page), "citas-activas"))
+        planificador.cancelar((id(page), "historial"))
+        planificador.cancelar((id(page), "pacientes"))
+
+    suscribir(("medico", medico_id), on_evento_cita)
+    page.on_disconnect = lambda e: terminar_sesion()
+
     page.add(layout)
     cargar_citas_activas()
     cargar_historial()
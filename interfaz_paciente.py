@@ -3,17 +3,22 @@ import datetime
 from datetime import datetime as dt, timedelta, date
 import calendar
 
+import datos_async
+import disponibilidad
+import planificador
 from bd_medica import (
-    obtener_medicos,
-    obtener_horarios_disponibles,
+    obtener_especialidades,
+    obtener_medicos_por_especialidad,
+    version_cache_referencia,
     registrar_cita,
     obtener_usuario,
     actualizar_datos_usuario,
     cambiar_contrasena,
-    obtener_citas_paciente,
+    obtener_citas_paciente_rango,
     cancelar_cita,
-    generar_horarios_disponibles,
-    editar_cita
+    editar_cita,
+    suscribir,
+    cancelar_suscripcion
 )
 
 def main(page: ft.Page, user_id: int):
@@ -106,7 +111,13 @@ def main(page: ft.Page, user_id: int):
                 page.update()
                 return
 
-            ok, respuesta = cambiar_contrasena(user_id, pw_current, pw_new)
+            # El hash de la contraseña es costoso: se calcula fuera del hilo del evento.
+            msg.value = "Actualizando la contraseña..."
+            page.update()
+            datos_async.ejecutar(page, cambiar_contrasena, user_id, pw_current, pw_new, al_terminar=mostrar_resultado)
+
+        def mostrar_resultado(resultado):
+            ok, respuesta = resultado
             if ok:
                 page.snack_bar = ft.SnackBar(ft.Text(respuesta, color="white"), bgcolor="green")
                 dialog.open = False
@@ -153,7 +164,11 @@ def main(page: ft.Page, user_id: int):
                 msg.value = "Ningún campo puede quedar vacío."
                 page.update()
                 return
-            ok, respuesta = actualizar_datos_usuario(user_id, n, a, em, tel)
+            datos_async.ejecutar(page, actualizar_datos_usuario, user_id, n, a, em, tel,
+                                 al_terminar=lambda resultado: mostrar_resultado(resultado, n, a, em, tel))
+
+        def mostrar_resultado(resultado, n, a, em, tel):
+            ok, respuesta = resultado
             if ok:
                 page.snack_bar = ft.SnackBar(ft.Text(respuesta, color="white"), bgcolor="green")
                 dialog.open = False
@@ -193,6 +208,7 @@ def main(page: ft.Page, user_id: int):
 
     def cerrar_sesion_dialog(_):
         def do_cerrar_sesion(_2):
+            terminar_sesion()
             dialog.open = False
             page.update()
             page.clean()
@@ -252,10 +268,21 @@ def main(page: ft.Page, user_id: int):
         page.update()
 
     # 4) FUNCIONES DE NOTIFICACIONES
-    def show_notifications(e):
+    def cargar_notificaciones(accion=None, *args):
+        # Aplica la acción pedida (marcar, eliminar) y retorna (notificaciones, no leídas).
         import notificaciones_paciente
+        if accion is not None:
+            accion(*args)
         notificaciones_paciente.generar_notificaciones(user_id)
-        notifs = notificaciones_paciente.obtener_notificaciones(user_id)
+        return notificaciones_paciente.obtener_notificaciones(user_id), notificaciones_paciente.contar_no_leidas(user_id)
+
+    def show_notifications(e, accion=None, *args):
+        datos_async.ejecutar(page, cargar_notificaciones, accion, *args, al_terminar=mostrar_notificaciones)
+
+    def mostrar_notificaciones(resultado):
+        import notificaciones_paciente
+        notifs, count = resultado
+        pintar_badge(count)
         notif_controls = []
         if not notifs:
             notif_controls.append(ft.Text("No hay notificaciones."))
@@ -263,11 +290,9 @@ def main(page: ft.Page, user_id: int):
             for notif in notifs:
                 notif_id = notif["id"]
                 def mark_read(e, notif_id=notif_id):
-                    notificaciones_paciente.marcar_notificacion_leida(notif_id)
-                    show_notifications(e)
+                    show_notifications(e, notificaciones_paciente.marcar_notificacion_leida, notif_id)
                 def delete_notif(e, notif_id=notif_id):
-                    notificaciones_paciente.eliminar_notificacion(notif_id)
-                    show_notifications(e)
+                    show_notifications(e, notificaciones_paciente.eliminar_notificacion, notif_id)
                 row = ft.Row(
                     controls=[
                         ft.Text(notif["message"], expand=True),
@@ -280,6 +305,11 @@ def main(page: ft.Page, user_id: int):
         def close_notif_dialog(e):
             notif_dialog.open = False
             page.update()
+        def mark_all_read(e):
+            show_notifications(e, notificaciones_paciente.marcar_notificaciones_leidas, user_id)
+        acciones = [ft.TextButton("Cerrar", on_click=close_notif_dialog)]
+        if any(n["leido"] == 0 for n in notifs):
+            acciones.insert(0, ft.TextButton("Marcar todas como leídas", on_click=mark_all_read))
         notif_dialog = ft.AlertDialog(
             modal=True,
             title=ft.Text("Notificaciones"),
@@ -287,7 +317,7 @@ def main(page: ft.Page, user_id: int):
                 content=ft.Column(notif_controls, spacing=10, scroll=ft.ScrollMode.AUTO),
                 height=300
             ),
-            actions=[ft.TextButton("Cerrar", on_click=close_notif_dialog)],
+            actions=acciones,
             actions_alignment="end"
         )
         if notif_dialog not in page.overlay:
@@ -295,27 +325,43 @@ def main(page: ft.Page, user_id: int):
         notif_dialog.open = True
         page.update()
 
-    def update_notification_badge():
+    # La campanita se actualiza por eventos del bus de citas y con una única tarea del
+    # planificador programada para cuando la próxima cita entre en la ventana de 24 horas;
+    # mientras no ocurre nada, la sesión no consulta la base de datos.
+    clave_notificaciones = f"notificaciones-paciente-{id(page)}"
+    ultimo_conteo = None
+
+    def actualizar_badge():
         import notificaciones_paciente
-        notificaciones_paciente.generar_notificaciones(user_id)
-        notifs = notificaciones_paciente.obtener_notificaciones(user_id)
-        count = len([n for n in notifs if n["leido"] == 0])
+        datos_async.ejecutar(page, notificaciones_paciente.contar_no_leidas, user_id,
+                             al_terminar=pintar_badge, clave="badge")
+
+    def pintar_badge(count):
+        nonlocal ultimo_conteo
+        if count == ultimo_conteo:
+            return  # Sin cambios: no se envía nada a la interfaz.
+        ultimo_conteo = count
         badge_text = str(count) if count > 0 else ""
         badge_container.content.value = badge_text
         badge_container.visible = True if count > 0 else False
         page.update()
-    import asyncio
-
-    import threading
-
-    def periodic_update():
-        update_notification_badge()
-        threading.Timer(10, periodic_update).start()  # Llama a periodic_update() cada 10 segundos
-
-
 
+    def consultar_recordatorios():
+        import notificaciones_paciente
+        notificaciones_paciente.generar_notificaciones(user_id)
+        return notificaciones_paciente.contar_no_leidas(user_id), notificaciones_paciente.proximo_recordatorio(user_id)
 
+    def revisar_recordatorios():
+        # El planificador solo dispara la revisión; las consultas van por datos_async.
+        datos_async.ejecutar(page, consultar_recordatorios, al_terminar=programar_recordatorio, clave="recordatorios")
 
+    def programar_recordatorio(resultado):
+        count, segundos = resultado
+        pintar_badge(count)
+        if segundos is None:
+            planificador.cancelar(clave_notificaciones)
+        else:
+            planificador.programar(clave_notificaciones, revisar_recordatorios, retraso=segundos)
 
     # 5) ÍCONOS DE CAMPANITA Y CONFIGURACIÓN (CABECERA)
     bell_icon_button = ft.IconButton(
@@ -340,7 +386,7 @@ def main(page: ft.Page, user_id: int):
             ft.Container(content=badge_container, alignment=ft.alignment.top_right)
         ]
     )
-    update_notification_badge()
+    revisar_recordatorios()
 
     menu_config_btn = ft.IconButton(
         icon=ft.icons.SETTINGS,
@@ -365,13 +411,7 @@ def main(page: ft.Page, user_id: int):
     )
 
     # 7) BLOQUE 2: PANEL DE AGENDAMIENTO DE CITA
-    especialidades = [
-        (1, "Medicina General"),
-        (2, "Medicina Familiar"),
-        (3, "Odontología"),
-        (4, "Obstetricia"),
-        (5, "Ginecología")
-    ]
+    especialidades = obtener_especialidades()
     especialidad_dropdown = ft.Dropdown(
         label="Especialidad",
         options=[ft.dropdown.Option(text=esp[1], key=str(esp[0])) for esp in especialidades],
@@ -394,6 +434,9 @@ def main(page: ft.Page, user_id: int):
         page.update()
 
     fecha_picker_btn = ft.ElevatedButton("Seleccionar Fecha", on_click=open_date_picker)
+    # El DatePicker no permite resaltar días: los próximos días con horas libres del médico
+    # elegido se muestran como botones debajo del selector de fecha.
+    dias_disponibles_row = ft.Row(controls=[], wrap=True, spacing=5)
 
     def agendar_cita(_):
         if (not especialidad_dropdown.value or 
@@ -418,15 +461,18 @@ def main(page: ft.Page, user_id: int):
             med_id = int(medico_dropdown.value)
             fecha = selected_date.strftime("%Y-%m-%d")
             hora = hora_dropdown.value
-            resultado, mensaje = registrar_cita(paciente_id, med_id, fecha, hora)
-            if resultado:
-                page.snack_bar = ft.SnackBar(ft.Text("¡Cita agendada con éxito! ✅", color="white"), bgcolor="green")
-            else:
-                page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="red")
-            page.snack_bar.open = True
-            actualizar_horas(None)
-            bloque_3_refrescar_calendario()
-            page.update()
+            def mostrar_resultado(respuesta):
+                resultado, mensaje = respuesta
+                disponibilidad.invalidar(med_id)
+                if resultado:
+                    page.snack_bar = ft.SnackBar(ft.Text("¡Cita agendada con éxito! ✅", color="white"), bgcolor="green")
+                else:
+                    page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="red")
+                page.snack_bar.open = True
+                actualizar_horas(None)
+                bloque_3_refrescar_calendario()
+                page.update()
+            datos_async.ejecutar(page, registrar_cita, paciente_id, med_id, fecha, hora, al_terminar=mostrar_resultado)
         def on_confirm_agendar():
             do_agendar()
         dialog = ft.AlertDialog(
@@ -462,6 +508,7 @@ def main(page: ft.Page, user_id: int):
                 medico_dropdown,
                 ft.Text("Seleccione la fecha de la cita:", size=14, weight=ft.FontWeight.BOLD),
                 fecha_picker_btn,
+                dias_disponibles_row,
                 ft.Text("Seleccione la hora disponible:", size=14, weight=ft.FontWeight.BOLD),
                 hora_dropdown,
                 botones_accion
@@ -488,18 +535,20 @@ def main(page: ft.Page, user_id: int):
             if not edit_date_picker.value:
                 return
             med_id = cita_info["medico_id"]
-            fecha_str = edit_date_picker.value.strftime("%Y-%m-%d")
-            generar_horarios_disponibles(med_id, fecha_str)
-            horarios = obtener_horarios_disponibles(med_id, fecha_str)
-            if edit_date_picker.value == date.today():
-                now_time = dt.now().time()
-                horarios = [h for h in horarios if dt.strptime(h[1], "%H:%M").time() > now_time]
-            new_time_dropdown.options = [ft.dropdown.Option(text=h[1], key=h[1]) for h in horarios]
-            if any(h[1] == cita_info["hora"] for h in horarios):
-                new_time_dropdown.value = cita_info["hora"]
-            else:
-                new_time_dropdown.value = None
-            page.update()
+            fecha_sel = edit_date_picker.value
+            def mostrar_horas(horas):
+                if fecha_sel == date.today():
+                    ahora = dt.now().strftime("%H:%M")
+                    horas = [h for h in horas if h > ahora]
+                new_time_dropdown.options = [ft.dropdown.Option(text=h, key=h) for h in horas]
+                if cita_info["hora"] in horas:
+                    new_time_dropdown.value = cita_info["hora"]
+                else:
+                    new_time_dropdown.value = None
+                page.update()
+            # Si la fecha no está en caché, horas_libres consulta (y puede generar Horarios).
+            datos_async.ejecutar(page, disponibilidad.horas_libres, med_id, fecha_sel.strftime("%Y-%m-%d"),
+                                 al_terminar=mostrar_horas, clave="horas-edicion")
         edit_date_picker.on_change = lambda e: (
             selected_date_text.__setattr__("value", edit_date_picker.value.strftime("%d/%m/%Y")),
             update_edit_horas(e),
@@ -514,15 +563,19 @@ def main(page: ft.Page, user_id: int):
                 return
             new_fecha_str = edit_date_picker.value.strftime("%Y-%m-%d")
             cita_id = cita_info["cita_id"]
-            ok, res = editar_cita(cita_id, new_fecha_str, new_time_dropdown.value)
-            if ok:
-                page.snack_bar = ft.SnackBar(ft.Text(res, color="white"), bgcolor="green")
-                edit_dialog.open = False
-                bloque_3_refrescar_calendario()
-            else:
-                msg_edit.value = res
-            page.snack_bar.open = True
-            page.update()
+            def mostrar_resultado(respuesta):
+                ok, res = respuesta
+                disponibilidad.invalidar(cita_info["medico_id"])
+                if ok:
+                    page.snack_bar = ft.SnackBar(ft.Text(res, color="white"), bgcolor="green")
+                    edit_dialog.open = False
+                    bloque_3_refrescar_calendario()
+                else:
+                    msg_edit.value = res
+                page.snack_bar.open = True
+                page.update()
+            datos_async.ejecutar(page, editar_cita, cita_id, new_fecha_str, new_time_dropdown.value,
+                                 al_terminar=mostrar_resultado)
         edit_dialog = ft.AlertDialog(
             modal=True,
             title=ft.Text("Editar Cita"),
@@ -548,10 +601,18 @@ def main(page: ft.Page, user_id: int):
     today = date.today()
     current_year = today.year
     current_month = today.month
-    def bloque_3_refrescar_calendario():
-        nuevo_cal = crear_calendario(current_year, current_month)
-        bloque_3.content.controls[1] = nuevo_cal
+    def consultar_calendario(year, month):
+        # Solo se consultan las citas del mes mostrado.
+        num_days = calendar.monthrange(year, month)[1]
+        return year, month, obtener_citas_paciente_rango(
+            user_id, date(year, month, 1).isoformat(), date(year, month, num_days).isoformat(), por_dia=True
+        )
+    def mostrar_calendario(resultado):
+        bloque_3.content.controls[1] = crear_calendario(*resultado)
         page.update()
+    def bloque_3_refrescar_calendario():
+        datos_async.ejecutar(page, consultar_calendario, current_year, current_month,
+                             al_terminar=mostrar_calendario, clave="calendario")
     def anterior_mes(_):
         nonlocal current_year, current_month
         current_month -= 1
@@ -566,25 +627,22 @@ def main(page: ft.Page, user_id: int):
             current_month = 1
             current_year += 1
         bloque_3_refrescar_calendario()
-    def crear_calendario(year: int, month: int) -> ft.Column:
-        citas_paciente = obtener_citas_paciente(user_id)
+    def crear_calendario(year: int, month: int, citas_mes: dict) -> ft.Column:
+        first_weekday, num_days = calendar.monthrange(year, month)
         citas_dict = {}
-        for c in citas_paciente:
-            cita_id, fecha_str, especialidad, medico, hora, medico_id = c
-            cita_date = dt.strptime(fecha_str, "%Y-%m-%d").date()
-            if cita_date.year == year and cita_date.month == month:
-                citas_dict.setdefault(cita_date.day, []).append({
-                    "cita_id": cita_id,
-                    "especialidad": especialidad,
-                    "medico": medico,
-                    "fecha": cita_date,
-                    "hora": hora,
-                    "medico_id": medico_id
-                })
+        for fecha_str, citas_del_dia in citas_mes.items():
+            cita_date = date(year, month, int(fecha_str[8:10]))
+            citas_dict[cita_date.day] = [{
+                "cita_id": cita_id,
+                "especialidad": especialidad,
+                "medico": medico,
+                "fecha": cita_date,
+                "hora": hora,
+                "medico_id": medico_id
+            } for cita_id, _, especialidad, medico, hora, medico_id in citas_del_dia]
         dias_semana = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
         header = [ft.Container(content=ft.Text(d, weight="bold", size=12), alignment=ft.alignment.center, width=40, height=40) for d in dias_semana]
         cells = []
-        first_weekday, num_days = calendar.monthrange(year, month)
         for _ in range(first_weekday):
             cells.append(ft.Container(width=40, height=40))
         for day in range(1, num_days + 1):
@@ -601,15 +659,18 @@ def main(page: ft.Page, user_id: int):
                             def _cancel(_2):
                                 def do_cancel():
                                     fecha_str = ci['fecha'].strftime("%Y-%m-%d")
-                                    ok, mensaje = cancelar_cita(user_id, ci["medico_id"], fecha_str, ci["hora"])
-                                    if ok:
-                                        page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="green")
-                                    else:
-                                        page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="red")
-                                    page.snack_bar.open = True
-                                    detalle_dialog.open = False
-                                    bloque_3_refrescar_calendario()
-                                    page.update()
+                                    def mostrar_resultado(respuesta):
+                                        ok, mensaje = respuesta
+                                        if ok:
+                                            page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="green")
+                                        else:
+                                            page.snack_bar = ft.SnackBar(ft.Text(mensaje, color="white"), bgcolor="red")
+                                        page.snack_bar.open = True
+                                        detalle_dialog.open = False
+                                        bloque_3_refrescar_calendario()
+                                        page.update()
+                                    datos_async.ejecutar(page, cancelar_cita, user_id, ci["medico_id"], fecha_str, ci["hora"],
+                                                         al_terminar=mostrar_resultado)
                                 confirm_dialog = ft.AlertDialog(
                                     modal=True,
                                     title=ft.Text("Cancelar Cita"),
@@ -674,7 +735,8 @@ def main(page: ft.Page, user_id: int):
             ft.IconButton(ft.icons.CHEVRON_RIGHT, on_click=siguiente_mes)
         ], alignment=ft.MainAxisAlignment.CENTER)
         return ft.Column([nav_row, ft.Container(content=grid, width=350, height=350, alignment=ft.alignment.center, padding=10, border=ft.border.all(1, "#aaa"), border_radius=10, bgcolor="#FFFDE7")], alignment=ft.MainAxisAlignment.CENTER, horizontal_alignment=ft.CrossAxisAlignment.CENTER)
-    calendario_widget = crear_calendario(current_year, current_month)
+    # El mes se dibuja vacío y se completa cuando llegan sus citas.
+    calendario_widget = crear_calendario(current_year, current_month, {})
     bloque_3 = ft.Container(
         content=ft.Column([ft.Text("Calendario de Citas", size=20, weight=ft.FontWeight.BOLD, color="#1B5E20"), calendario_widget],
                           alignment="center", horizontal_alignment="center", spacing=10, expand=True),
@@ -688,35 +750,93 @@ def main(page: ft.Page, user_id: int):
     page.add(layout)
     page.overlay.append(date_picker)
     page.update()
+    bloque_3_refrescar_calendario()
 
-    def actualizar_medicos(_):
+    # Médicos de todas las especialidades, cargados una vez con una sola consulta; cambiar de
+    # especialidad solo cambia las opciones del dropdown. Se recarga si se registra un médico.
+    version_medicos = None
+    medicos_por_especialidad = {}
+
+    def recargar_medicos():
+        return version_cache_referencia(), obtener_medicos_por_especialidad()
+
+    def mostrar_medicos(resultado=None):
+        nonlocal medicos_por_especialidad, version_medicos
+        if resultado is not None:
+            version_medicos, medicos_por_especialidad = resultado
         if not especialidad_dropdown.value:
             return
         esp_id = int(especialidad_dropdown.value)
-        medicos = obtener_medicos(esp_id)
+        medicos = medicos_por_especialidad.get(esp_id, [])
         medico_dropdown.options = [ft.dropdown.Option(text=m[1], key=str(m[0])) for m in medicos]
         medico_dropdown.value = None
         page.update()
+
+    def actualizar_medicos(_):
+        if not especialidad_dropdown.value:
+            return
+        if version_cache_referencia() != version_medicos:
+            datos_async.ejecutar(page, recargar_medicos, al_terminar=mostrar_medicos, clave="medicos")
+        else:
+            mostrar_medicos()
     especialidad_dropdown.on_change = actualizar_medicos
+    datos_async.ejecutar(page, recargar_medicos, al_terminar=mostrar_medicos, clave="medicos")
 
     def actualizar_horas(_):
         if not medico_dropdown.value or date_picker.value is None:
             return
         med_id = int(medico_dropdown.value)
-        fecha_str = date_picker.value.strftime("%Y-%m-%d")
-        generar_horarios_disponibles(med_id, fecha_str)
-        horarios = obtener_horarios_disponibles(med_id, fecha_str)
-        if date_picker.value == date.today():
-            now_time = dt.now().time()
-            horarios = [h for h in horarios if dt.strptime(h[1], "%H:%M").time() > now_time]
-        hora_dropdown.options = [ft.dropdown.Option(text=h[1], key=h[1]) for h in horarios]
-        hora_dropdown.value = None
-        page.update()
+        fecha_sel = date_picker.value
+        def mostrar_horas(horas):
+            if fecha_sel == date.today():
+                ahora = dt.now().strftime("%H:%M")
+                horas = [h for h in horas if h > ahora]
+            hora_dropdown.options = [ft.dropdown.Option(text=h, key=h) for h in horas]
+            hora_dropdown.value = None
+            page.update()
+        datos_async.ejecutar(page, disponibilidad.horas_libres, med_id, fecha_sel.strftime("%Y-%m-%d"),
+                             al_terminar=mostrar_horas)
     def on_date_change(_):
         on_date_selected(_)
         actualizar_horas(_)
-    periodic_update()
+
+    def mostrar_dias_disponibles(fechas):
+        def elegir_dia(fecha):
+            def _elegir(_):
+                date_picker.value = dt.strptime(fecha, "%Y-%m-%d").date()
+                on_date_change(None)
+            return _elegir
+        dias_disponibles_row.controls = [
+            ft.OutlinedButton(dt.strptime(f, "%Y-%m-%d").strftime("%d/%m"), on_click=elegir_dia(f))
+            for f in fechas
+        ]
+        page.update()
+
+    def on_medico_change(_):
+        dias_disponibles_row.controls = []
+        actualizar_horas(_)
+        if medico_dropdown.value:
+            med_id = medico_dropdown.value
+            def al_terminar(fechas):
+                if medico_dropdown.value == med_id:  # El paciente no cambió de médico mientras tanto.
+                    mostrar_dias_disponibles(fechas)
+            disponibilidad.precargar(page, int(med_id), al_terminar)
+    # Cambios en las citas del paciente (hechos desde esta sesión, la del médico o la de
+    # administración): se refrescan la campanita y el calendario y se reprograma el recordatorio.
+    def on_evento_cita(evento):
+        if evento["tipo"] == "recordatorio":
+            actualizar_badge()
+            return
+        revisar_recordatorios()
+        bloque_3_refrescar_calendario()
+
+    def terminar_sesion():
+        planificador.cancelar(clave_notificaciones)
+        cancelar_suscripcion(("paciente", user_id), on_evento_cita)
+
+    suscribir(("paciente", user_id), on_evento_cita)
+    page.on_disconnect = lambda e: terminar_sesion()
 
     date_picker.on_change = on_date_change
-    medico_dropdown.on_change = actualizar_horas
+    medico_dropdown.on_change = on_medico_change
 
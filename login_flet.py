@@ -1,5 +1,6 @@
 import flet as ft
-from bd_medica import verificar_credenciales, crear_base_de_datos, conectar_bd
+from bd_medica import autenticar_usuario, crear_base_de_datos
+import datos_async
 import registro_flet
 import interfaz_paciente
 import interfaz_medico
@@ -16,19 +17,6 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-def correo_existe(email: str) -> bool:
-    """
-    Verifica si el correo (en minúsculas y sin espacios) existe en la tabla Usuarios.
-    Retorna True si existe, False en caso contrario.
-    """
-    email = email.strip().lower()
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM Usuarios WHERE LOWER(email) = ?", (email,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
-
 def main(page: ft.Page):
     crear_base_de_datos()
     page.title = "Inicio de Sesión - Citas Médicas"
@@ -132,9 +120,24 @@ def main(page: ft.Page):
             page.update()
             return
 
-        email_val = email_input.value.strip().lower()
+        # La consulta se hace fuera del hilo del evento para que el indicador de carga se vea.
+        datos_async.ejecutar(page, autenticar_usuario, email_input.value, password_input.value,
+                             al_terminar=mostrar_resultado_login, al_fallar=mostrar_error_login)
+
+    def mostrar_error_login(ex):
+        # Por ejemplo, la base de datos bloqueada: se devuelve el control para reintentar.
+        page.snack_bar = ft.SnackBar(
+            ft.Text(f"No se pudo iniciar sesión: {ex}", color="white"),
+            bgcolor="red"
+        )
+        page.snack_bar.open = True
+        loading_indicator.visible = False
+        login_button.disabled = False
+        page.update()
 
-        if not correo_existe(email_val):
+    def mostrar_resultado_login(resultado):
+        existe, valid, tipo_bd, user_id = resultado
+        if not existe:
             email_input.border_color = "red"
             page.snack_bar = ft.SnackBar(
                 ft.Text("El correo no está registrado", color="white"), 
@@ -146,7 +149,6 @@ def main(page: ft.Page):
             page.update()
             return
 
-        valid, tipo_bd, user_id = verificar_credenciales(email_val, password_input.value)
         if valid:
             tipo_radio = user_type_radio.value
             if tipo_bd != tipo_radio:
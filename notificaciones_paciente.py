@@ -1,17 +1,21 @@
 import sqlite3
+import time
 from datetime import datetime, timedelta
 
-DB_NAME = "citas_medicas.db"
+from bd_medica import asegurar_esquema, conectar_bd, crear_base_de_datos, publicar_evento, registrar_esquema
 
-def conectar_bd():
-    """Conecta a la base de datos y activa las claves foráneas."""
-    conexion = sqlite3.connect(DB_NAME)
-    conexion.execute("PRAGMA foreign_keys = ON;")
-    return conexion
+# Resumen de la última pasada del trabajo global de recordatorios en EstadoTareas (cuántas
+# notificaciones generó y cuántas citas revisó; `actualizado` indica cuándo). Es solo informativo:
+# cada pasada revisa la ventana completa de 24 horas, no continúa desde la anterior.
+ESTADO_RECORDATORIOS = "recordatorios.estado"
+# Retención usada por el mantenimiento: las notificaciones leídas se borran pasados estos días
+# y cada paciente conserva como máximo esta cantidad (las más recientes).
+DIAS_RETENCION = 90
+MAXIMO_POR_PACIENTE = 200
 
-def crear_tabla_notificaciones():
-    """Crea la tabla Notificaciones (si no existe)."""
-    conexion = conectar_bd()
+@registrar_esquema
+def _esquema_notificaciones(conexion):
+    """Crea la tabla Notificaciones y sus índices (si no existen)."""
     cursor = conexion.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS Notificaciones (
@@ -20,44 +24,149 @@ def crear_tabla_notificaciones():
             paciente_id INTEGER,
             message TEXT,
             leido INTEGER DEFAULT 0,
+            creado TEXT,
             FOREIGN KEY(cita_id) REFERENCES Citas(id) ON DELETE CASCADE,
             FOREIGN KEY(paciente_id) REFERENCES Usuarios(id) ON DELETE CASCADE
         );
     """)
-    conexion.commit()
-    conexion.close()
+    columnas = [fila[1] for fila in cursor.execute("PRAGMA table_info(Notificaciones)")]
+    if "creado" not in columnas:
+        # Bases anteriores: las notificaciones existentes cuentan desde hoy para la retención.
+        cursor.execute("ALTER TABLE Notificaciones ADD COLUMN creado TEXT")
+        cursor.execute("UPDATE Notificaciones SET creado = ?", (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notificaciones_paciente ON Notificaciones(paciente_id)")
+    # Índice parcial: solo contiene las no leídas, así contar_no_leidas no depende del historial.
+    # Incluye leido para que el COUNT se resuelva solo con el índice, sin leer la tabla;
+    # idx_notificaciones_no_leidas (solo paciente_id) obligaba a leer cada fila.
+    cursor.execute("DROP INDEX IF EXISTS idx_notificaciones_no_leidas")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_no_leidas_paciente
+        ON Notificaciones(paciente_id, leido) WHERE leido = 0
+    """)
+    cursor.execute("""
+        SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_notificaciones_cita_paciente'
+    """)
+    if cursor.fetchone() is None:
+        # Bases anteriores pueden tener notificaciones repetidas: se conserva la primera de cada cita.
+        cursor.execute("""
+            DELETE FROM Notificaciones
+            WHERE cita_id IS NOT NULL AND id NOT IN (
+                SELECT MIN(id) FROM Notificaciones GROUP BY cita_id, paciente_id
+            )
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX idx_notificaciones_cita_paciente ON Notificaciones(cita_id, paciente_id)
+        """)
+
+def crear_tabla_notificaciones():
+    """Crea la tabla Notificaciones (si no existe). Solo consulta la base la primera vez del proceso."""
+    asegurar_esquema()
+
+# Citas 'Pendiente' dentro de las próximas 24 horas; el rango por fecha permite usar los índices.
+_VENTANA_SQL = """
+    C.estado = 'Pendiente'
+    AND C.fecha BETWEEN ? AND ?
+    AND C.fecha || ' ' || C.hora > ? AND C.fecha || ' ' || C.hora <= ?
+"""
+
+def _params_ventana(ahora):
+    limite = ahora + timedelta(hours=24)
+    return (ahora.strftime("%Y-%m-%d"), limite.strftime("%Y-%m-%d"),
+            ahora.strftime("%Y-%m-%d %H:%M"), limite.strftime("%Y-%m-%d %H:%M"))
+
+def _insertar_recordatorios(cursor, ahora, filtro, params):
+    """
+    Inserta, en una sola sentencia, las notificaciones que faltan para las citas 'Pendiente'
+    de las próximas 24 horas que además cumplan `filtro`. Retorna la cantidad insertada.
+    """
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO Notificaciones (cita_id, paciente_id, message, leido, creado)
+        SELECT C.id, C.paciente_id,
+               'Tienes una cita de ' || E.nombre || ' con ' || M.nombres || ' ' || M.apellidos ||
+               ' el ' || substr(C.fecha, 9, 2) || '/' || substr(C.fecha, 6, 2) || '/' || substr(C.fecha, 1, 4) ||
+               ' a las ' || C.hora || '.',
+               0, ?
+        FROM Citas C
+        JOIN Medicos M ON C.medico_id = M.id
+        JOIN Especialidades E ON M.especialidad_id = E.id
+        WHERE {_VENTANA_SQL}
+          AND {filtro}
+          AND NOT EXISTS (
+              SELECT 1 FROM Notificaciones N WHERE N.cita_id = C.id AND N.paciente_id = C.paciente_id
+          )
+    """, (ahora.strftime("%Y-%m-%d %H:%M:%S"), *_params_ventana(ahora), *params))
+    return cursor.rowcount
 
 def generar_notificaciones(paciente_id):
     """
     Genera notificaciones para las citas en estado 'Pendiente' que ocurran en menos de 24 horas.
     Se inserta una notificación si aún no existe para la cita.
+    La ventana de 24 horas y la verificación de duplicados se resuelven en una sola sentencia,
+    así que el costo no depende del historial del paciente.
     """
     crear_tabla_notificaciones()
     conexion = conectar_bd()
     cursor = conexion.cursor()
-    now = datetime.now()
-    cursor.execute("""
-        SELECT C.id, C.fecha, C.hora, E.nombre, (M.nombres || ' ' || M.apellidos)
-        FROM Citas C
-        JOIN Medicos M ON C.medico_id = M.id
-        JOIN Especialidades E ON M.especialidad_id = E.id
-        WHERE C.paciente_id = ? AND C.estado = 'Pendiente'
-    """, (paciente_id,))
-    citas = cursor.fetchall()
-    for cita in citas:
-        cita_id, fecha_str, hora_str, especialidad, medico = cita
-        cita_dt = datetime.strptime(f"{fecha_str} {hora_str}", "%Y-%m-%d %H:%M")
-        diff = cita_dt - now
-        if timedelta(0) < diff <= timedelta(hours=24):
-            cursor.execute("SELECT id FROM Notificaciones WHERE cita_id = ? AND paciente_id = ?", (cita_id, paciente_id))
-            if cursor.fetchone() is None:
-                message = f"Tienes una cita de {especialidad} con {medico} el {cita_dt.strftime('%d/%m/%Y')} a las {cita_dt.strftime('%H:%M')}."
-                cursor.execute("""
-                    INSERT INTO Notificaciones (cita_id, paciente_id, message, leido)
-                    VALUES (?, ?, ?, 0)
-                """, (cita_id, paciente_id, message))
+    nuevas = _insertar_recordatorios(cursor, datetime.now(), "C.paciente_id = ?", (paciente_id,))
     conexion.commit()
     conexion.close()
+    if nuevas > 0:
+        publicar_evento("recordatorio", paciente_id=paciente_id)
+
+def generar_recordatorios_globales():
+    """
+    Genera en una sola pasada los recordatorios de todos los pacientes, tengan o no la sesión abierta.
+    Cada pasada revisa la ventana de 24 horas completa (con idx_citas_pendientes_fecha), así que
+    también cubre las citas que editar_cita movió hacia una parte de la ventana ya revisada
+    (conservan su id; editar_cita borra el recordatorio de la fecha anterior). Repetirla es seguro: el índice único de Notificaciones descarta lo que ya
+    se generó, y el costo depende de las citas de la ventana, no del historial.
+    Retorna (notificaciones generadas, citas revisadas, segundos).
+    """
+    crear_tabla_notificaciones()
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    inicio = time.perf_counter()
+    try:
+        # Bloqueo de escritura desde el inicio: el conteo y la inserción ven las mismas citas.
+        cursor.execute("BEGIN IMMEDIATE")
+        ahora = datetime.now()
+        cursor.execute(f"SELECT COUNT(*) FROM Citas C WHERE {_VENTANA_SQL}", _params_ventana(ahora))
+        revisadas = cursor.fetchone()[0]
+        generadas = _insertar_recordatorios(cursor, ahora, "1", ())
+        actualizado = ahora.strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute("""
+            INSERT INTO EstadoTareas (tarea, valor, actualizado) VALUES (?, ?, ?)
+            ON CONFLICT(tarea) DO UPDATE SET valor = excluded.valor, actualizado = excluded.actualizado
+        """, (ESTADO_RECORDATORIOS, f"{generadas} generadas, {revisadas} revisadas", actualizado))
+        conexion.commit()
+    except sqlite3.Error:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+    return generadas, revisadas, time.perf_counter() - inicio
+
+def proximo_recordatorio(paciente_id):
+    """
+    Retorna los segundos que faltan para que la próxima cita 'Pendiente' del paciente entre
+    en la ventana de 24 horas (momento en que hay que generar su notificación),
+    o None si no tiene citas pendientes fuera de esa ventana.
+    """
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    limite = datetime.now() + timedelta(hours=24)
+    cursor.execute("""
+        SELECT fecha, hora FROM Citas
+        WHERE paciente_id = ? AND estado = 'Pendiente' AND fecha || ' ' || hora > ?
+        ORDER BY fecha, hora
+        LIMIT 1
+    """, (paciente_id, limite.strftime("%Y-%m-%d %H:%M")))
+    row = cursor.fetchone()
+    conexion.close()
+    if row is None:
+        return None
+    cita_dt = datetime.strptime(f"{row[0]} {row[1]}", "%Y-%m-%d %H:%M")
+    return max((cita_dt - timedelta(hours=24) - datetime.now()).total_seconds(), 0)
 
 def obtener_notificaciones(paciente_id):
     """Retorna la lista de notificaciones para el paciente."""
@@ -82,6 +191,16 @@ def obtener_notificaciones(paciente_id):
         })
     return notifs
 
+def contar_no_leidas(paciente_id):
+    """Retorna la cantidad de notificaciones no leídas del paciente (consulta solo al índice parcial)."""
+    crear_tabla_notificaciones()
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Notificaciones WHERE paciente_id = ? AND leido = 0", (paciente_id,))
+    count = cursor.fetchone()[0]
+    conexion.close()
+    return count
+
 def marcar_notificacion_leida(notif_id):
     """Marca la notificación como leída."""
     conexion = conectar_bd()
@@ -97,3 +216,101 @@ def eliminar_notificacion(notif_id):
     cursor.execute("DELETE FROM Notificaciones WHERE id = ?", (notif_id,))
     conexion.commit()
     conexion.close()
+
+def marcar_notificaciones_leidas(paciente_id, ids=None):
+    """
+    Marca como leídas, en una sola sentencia, las notificaciones `ids` del paciente
+    (todas las no leídas si ids es None). Retorna la cantidad marcada.
+    """
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    sql = "UPDATE Notificaciones SET leido = 1 WHERE paciente_id = ? AND leido = 0"
+    params = [paciente_id]
+    if ids is not None:
+        sql += f" AND id IN ({', '.join('?' * len(ids))})"
+        params.extend(ids)
+    cursor.execute(sql, params)
+    conexion.commit()
+    conexion.close()
+    return cursor.rowcount
+
+def eliminar_notificaciones(paciente_id, ids=None):
+    """
+    Elimina, en una sola sentencia, las notificaciones `ids` del paciente
+    (todas las del paciente si ids es None). Retorna la cantidad eliminada.
+    """
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    sql = "DELETE FROM Notificaciones WHERE paciente_id = ?"
+    params = [paciente_id]
+    if ids is not None:
+        sql += f" AND id IN ({', '.join('?' * len(ids))})"
+        params.extend(ids)
+    cursor.execute(sql, params)
+    conexion.commit()
+    conexion.close()
+    return cursor.rowcount
+
+def purgar_notificaciones(dias=DIAS_RETENCION):
+    """Elimina las notificaciones leídas creadas hace más de `dias` días. Retorna la cantidad eliminada."""
+    crear_tabla_notificaciones()
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    limite = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("DELETE FROM Notificaciones WHERE leido = 1 AND creado < ?", (limite,))
+    conexion.commit()
+    conexion.close()
+    return cursor.rowcount
+
+def limitar_notificaciones(maximo=MAXIMO_POR_PACIENTE):
+    """
+    Deja a cada paciente solo sus `maximo` notificaciones más recientes.
+    Retorna la cantidad eliminada.
+    """
+    crear_tabla_notificaciones()
+    conexion = conectar_bd()
+    cursor = conexion.cursor()
+    cursor.execute("""
+        DELETE FROM Notificaciones WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY paciente_id ORDER BY id DESC) AS orden
+                FROM Notificaciones
+            ) WHERE orden > ?
+        )
+    """, (maximo,))
+    conexion.commit()
+    conexion.close()
+    return cursor.rowcount
+
+def mantenimiento_notificaciones(dias=DIAS_RETENCION, maximo=MAXIMO_POR_PACIENTE):
+    """Aplica la retención de notificaciones. Retorna (purgadas por antigüedad, recortadas por paciente)."""
+    return purgar_notificaciones(dias), limitar_notificaciones(maximo)
+
+def _main():
+    """
+    Trabajo de recordatorios y mantenimiento de notificaciones para todos los pacientes.
+    Por defecto hace una pasada y termina (para cron); con --bucle repite cada N segundos.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Genera los recordatorios de citas de todos los pacientes.")
+    parser.add_argument("--bucle", type=float, metavar="SEGUNDOS",
+                        help="Repite la pasada cada SEGUNDOS segundos en lugar de hacer una sola.")
+    parser.add_argument("--dias-retencion", type=int, default=DIAS_RETENCION,
+                        help=f"Días que se conservan las notificaciones leídas ({DIAS_RETENCION} por defecto).")
+    parser.add_argument("--maximo", type=int, default=MAXIMO_POR_PACIENTE,
+                        help=f"Notificaciones que conserva cada paciente ({MAXIMO_POR_PACIENTE} por defecto).")
+    args = parser.parse_args()
+
+    crear_base_de_datos()
+    while True:
+        generadas, revisadas, segundos = generar_recordatorios_globales()
+        print(f"✅ {generadas} recordatorios generados, {revisadas} citas revisadas en {segundos:.3f}s "
+              f"({revisadas / segundos if segundos else 0:.0f} citas/s).")
+        purgadas, recortadas = mantenimiento_notificaciones(args.dias_retencion, args.maximo)
+        print(f"✅ Mantenimiento: {purgadas} notificaciones leídas antiguas y {recortadas} sobre el máximo eliminadas.")
+        if not args.bucle:
+            break
+        time.sleep(args.bucle)
+
+if __name__ == "__main__":
+    _main()
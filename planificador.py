@@ -0,0 +1,71 @@
+"""
+Planificador de tareas periódicas compartido por todas las sesiones de la aplicación.
+Un único hilo (daemon) ejecuta las tareas de todas las sesiones en el momento que les toca,
+en lugar de crear un threading.Timer nuevo por sesión en cada ciclo.
+"""
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+_lock = threading.Condition()
+_cola = []            # heap de (momento, secuencia, clave)
+_tareas = {}          # clave -> (funcion, intervalo, secuencia)
+_secuencia = itertools.count()
+_hilo = None
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is None or not _hilo.is_alive():
+        _hilo = threading.Thread(target=_trabajar, name="planificador", daemon=True)
+        _hilo.start()
+
+def programar(clave, funcion, intervalo=None, retraso=0.0):
+    """
+    Programa funcion() para dentro de `retraso` segundos y, si se indica `intervalo`,
+    para repetirse cada `intervalo` segundos. Si ya había una tarea con la misma clave,
+    se reemplaza. Las tareas se ejecutan en el hilo del planificador, así que deben ser breves.
+    """
+    with _lock:
+        secuencia = next(_secuencia)
+        _tareas[clave] = (funcion, intervalo, secuencia)
+        heapq.heappush(_cola, (time.monotonic() + retraso, secuencia, clave))
+        _asegurar_hilo()
+        _lock.notify()
+
+def cancelar(clave):
+    """Cancela la tarea con esa clave (no hace nada si no existe)."""
+    with _lock:
+        _tareas.pop(clave, None)
+        _lock.notify()
+
+def tareas_activas():
+    """Retorna la cantidad de tareas programadas."""
+    with _lock:
+        return len(_tareas)
+
+def _trabajar():
+    while True:
+        with _lock:
+            while True:
+                # Se descartan las entradas de tareas canceladas o reprogramadas.
+                while _cola and _tareas.get(_cola[0][2], (None, None, None))[2] != _cola[0][1]:
+                    heapq.heappop(_cola)
+                if not _cola:
+                    _lock.wait()
+                    continue
+                espera = _cola[0][0] - time.monotonic()
+                if espera <= 0:
+                    break
+                _lock.wait(espera)
+            momento, secuencia, clave = heapq.heappop(_cola)
+            funcion, intervalo, _ = _tareas[clave]
+            if intervalo is None:
+                del _tareas[clave]
+            else:
+                heapq.heappush(_cola, (max(momento + intervalo, time.monotonic()), secuencia, clave))
+        try:
+            funcion()
+        except Exception:
+            traceback.print_exc()
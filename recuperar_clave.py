@@ -14,10 +14,12 @@ SECURITY_QUESTIONS = [
 
 def reset_password(user_id: int, new_password: str) -> (bool, str):
     """Actualiza la contraseña del usuario en la base de datos."""
+    # El hash es costoso: se calcula antes de tomar una conexión.
+    hashed_pass = hash_password(new_password)
     try:
         conexion = conectar_bd()
         cursor = conexion.cursor()
-        cursor.execute("UPDATE Usuarios SET password = ? WHERE id = ?", (hash_password(new_password), user_id))
+        cursor.execute("UPDATE Usuarios SET password = ? WHERE id = ?", (hashed_pass, user_id))
         conexion.commit()
         conexion.close()
         return True, "Contraseña actualizada correctamente."
@@ -1,6 +1,7 @@
 import flet as ft
 import re
 from bd_medica import registrar_usuario_en_bd
+import datos_async
 
 def main(page: ft.Page, prefill_data=None):
     """
@@ -318,8 +319,10 @@ def main(page: ft.Page, prefill_data=None):
             else None
         )
 
-        # Registrar en la BD
-        exito, mensaje, new_user_id = registrar_usuario_en_bd(
+        # Registrar en la BD (fuera del hilo del evento: el hash de la contraseña es costoso)
+        datos_async.ejecutar(
+            page,
+            registrar_usuario_en_bd,
             user_type.value,
             nombres,
             apellidos,
@@ -331,9 +334,12 @@ def main(page: ft.Page, prefill_data=None):
             security_q1_dropdown.value, security_q1_answer.value.strip(),
             security_q2_dropdown.value, security_q2_answer.value.strip(),
             security_q3_dropdown.value, security_q3_answer.value.strip(),
-            None  # Sin fotografía
+            None,  # Sin fotografía
+            al_terminar=mostrar_resultado_registro
         )
 
+    def mostrar_resultado_registro(resultado):
+        exito, mensaje, new_user_id = resultado
         global_message.value = mensaje
         global_message.color = "green" if exito else "red"
         page.update()
@@ -1,9 +1,17 @@
 # archivo: registro_google.py
 
+import base64
+import hashlib
+import json
+import secrets
+import threading
+import time
+import webbrowser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
 import flet as ft
 import requests
-import webbrowser
-from google_auth_oauthlib.flow import Flow
 
 SCOPES = [
     "openid",
@@ -11,6 +19,250 @@ SCOPES = [
     "https://www.googleapis.com/auth/userinfo.profile"
 ]
 
+# Endpoints de Google. Se pueden reemplazar con configurar_endpoints() (por ejemplo, para
+# probar el flujo contra un servidor OAuth local).
+ENDPOINTS = {
+    "auth": "https://accounts.google.com/o/oauth2/auth",
+    "token": "https://oauth2.googleapis.com/token",
+    "userinfo": "https://www.googleapis.com/oauth2/v1/userinfo",
+}
+# Segundos para conectar y para esperar la respuesta de cada solicitud HTTP.
+TIMEOUT_HTTP = (5, 10)
+# Intentos ante errores de conexión, 429 o 5xx, con espera exponencial desde ESPERA_REINTENTO segundos.
+INTENTOS_HTTP = 3
+ESPERA_REINTENTO = 0.5
+# Métodos que se pueden repetir aunque el servidor ya haya procesado la solicitud.
+METODOS_IDEMPOTENTES = {"GET", "HEAD", "OPTIONS"}
+
+# Segundos que se espera la redirección del navegador antes de abandonar el intento.
+TIEMPO_ESPERA_REDIRECCION = 300
+# Credencial de tipo "Aplicación de escritorio" descargada de Google Cloud.
+CLIENT_SECRET_FILE = "client_secret.json"
+
+_sesion = None
+_sesion_lock = threading.Lock()
+_client_configs = {}  # ruta -> configuración del cliente ya leída
+
+def configurar_endpoints(**endpoints):
+    """Reemplaza los endpoints indicados (auth, token, userinfo)."""
+    desconocidos = set(endpoints) - set(ENDPOINTS)
+    if desconocidos:
+        raise ValueError(f"Endpoints desconocidos: {', '.join(sorted(desconocidos))}")
+    ENDPOINTS.update(endpoints)
+
+def _sesion_http():
+    """Sesión HTTP compartida del proceso (reutiliza las conexiones TLS entre solicitudes)."""
+    global _sesion
+    with _sesion_lock:
+        if _sesion is None:
+            _sesion = requests.Session()
+        return _sesion
+
+def _solicitar(metodo, url, **kwargs):
+    """
+    Hace la solicitud con TIMEOUT_HTTP y la reintenta, con espera exponencial, ante errores de
+    conexión, 429 o 5xx. Si la respuesta no llega a tiempo (ReadTimeout) solo se reintentan los
+    métodos idempotentes: el POST de tokens pudo haber consumido ya el código de autorización.
+    Retorna la respuesta (de cualquier código) del último intento.
+    """
+    if metodo.upper() in METODOS_IDEMPOTENTES:
+        errores_reintentables = (requests.ConnectionError, requests.Timeout)
+    else:
+        errores_reintentables = requests.ConnectionError  # incluye ConnectTimeout
+    for intento in range(INTENTOS_HTTP):
+        ultimo = intento == INTENTOS_HTTP - 1
+        try:
+            resp = _sesion_http().request(metodo, url, timeout=TIMEOUT_HTTP, **kwargs)
+        except errores_reintentables:
+            if ultimo:
+                raise
+        else:
+            if ultimo or (resp.status_code != 429 and resp.status_code < 500):
+                return resp
+        time.sleep(ESPERA_REINTENTO * 2 ** intento)
+
+def cargar_client_config(ruta=CLIENT_SECRET_FILE):
+    """Retorna la configuración del cliente OAuth (sección "installed" o "web"), leída una vez por proceso."""
+    with _sesion_lock:
+        config = _client_configs.get(ruta)
+        if config is None:
+            with open(ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+            config = datos.get("installed") or datos.get("web")
+            if not config:
+                raise ValueError(f"{ruta} no contiene una credencial OAuth de tipo 'installed' o 'web'.")
+            _client_configs[ruta] = config
+        return config
+
+def intercambiar_codigo(codigo, client_config, redirect_uri, code_verifier=None):
+    """Intercambia el código de autorización por los tokens. Retorna el dict de tokens."""
+    datos = {
+        "grant_type": "authorization_code",
+        "code": codigo,
+        "client_id": client_config["client_id"],
+        "client_secret": client_config.get("client_secret", ""),
+        "redirect_uri": redirect_uri,
+    }
+    if code_verifier is not None:
+        datos["code_verifier"] = code_verifier
+    resp = _solicitar("POST", ENDPOINTS["token"], data=datos)
+    if resp.status_code != 200:
+        raise Exception("El código no es válido o ya expiró.")
+    return resp.json()
+
+def obtener_datos_usuario(access_token):
+    """Retorna los datos del usuario (email, given_name, family_name...) desde el endpoint userinfo."""
+    resp = _solicitar("GET", ENDPOINTS["userinfo"], headers={"Authorization": f"Bearer {access_token}"})
+    if resp.status_code != 200:
+        raise Exception("Error al obtener datos de usuario.")
+    return resp.json()
+
+def datos_registro(user_info):
+    """Convierte los datos de Google en los datos con que se prellena registro_flet."""
+    # Dividir los nombres
+    given_name = user_info.get("given_name", "").strip()
+    fn_parts = given_name.split(maxsplit=1)
+    first_name = fn_parts[0] if len(fn_parts) > 0 else ""
+    second_name = fn_parts[1] if len(fn_parts) > 1 else ""
+
+    # Dividir los apellidos
+    family_name = user_info.get("family_name", "").strip()
+    ln_parts = family_name.split(maxsplit=1)
+    last_name = ln_parts[0] if len(ln_parts) > 0 else ""
+    second_last_name = ln_parts[1] if len(ln_parts) > 1 else ""
+
+    return {
+        "first_name": first_name,
+        "second_name": second_name,
+        "last_name": last_name,
+        "second_last_name": second_last_name,
+        "email": user_info.get("email", ""),
+        "phone": ""  # Google no provee teléfono por defecto
+    }
+
+def completar_autenticacion(codigo, client_config, redirect_uri, code_verifier=None):
+    """Intercambia el código y obtiene los datos del usuario. Retorna los datos para registro_flet."""
+    tokens = intercambiar_codigo(codigo, client_config, redirect_uri, code_verifier)
+    return datos_registro(obtener_datos_usuario(tokens["access_token"]))
+
+_PAGINA_RESPUESTA = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>Citas Médicas</title></head>
+<body style="font-family: sans-serif; text-align: center; margin-top: 60px"><h2>{}</h2>
+<p>Ya puedes cerrar esta ventana y volver a la aplicación.</p></body></html>"""
+
+class ReceptorRedireccion:
+    """
+    Recibe en 127.0.0.1 (puerto efímero) la redirección de Google con el código de autorización,
+    valida el `state` (de un solo uso), completa el intercambio con PKCE en su propio hilo y
+    llama a al_terminar(datos para registro_flet) o a al_fallar(excepcion).
+    Atiende una sola autenticación y luego se cierra.
+    """
+
+    def __init__(self, client_config, al_terminar, al_fallar, tiempo_espera=TIEMPO_ESPERA_REDIRECCION):
+        self.client_config = client_config
+        self.al_terminar = al_terminar
+        self.al_fallar = al_fallar
+        self.state = secrets.token_urlsafe(32)
+        self.code_verifier = secrets.token_urlsafe(64)
+        self._lock = threading.Lock()
+        self._terminado = False
+        receptor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                receptor._recibir(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = HTTPServer(("127.0.0.1", 0), Manejador)
+        self.redirect_uri = f"http://127.0.0.1:{self._servidor.server_port}/"
+        self._temporizador = threading.Timer(tiempo_espera, self._vencer)
+        self._temporizador.daemon = True
+
+    def url_autorizacion(self):
+        """URL de Google a la que se envía al usuario, con state y el desafío PKCE (S256)."""
+        desafio = base64.urlsafe_b64encode(hashlib.sha256(self.code_verifier.encode("ascii")).digest())
+        return ENDPOINTS["auth"] + "?" + urlencode({
+            "response_type": "code",
+            "client_id": self.client_config["client_id"],
+            "redirect_uri": self.redirect_uri,
+            "scope": " ".join(SCOPES),
+            "state": self.state,
+            "code_challenge": desafio.decode("ascii").rstrip("="),
+            "code_challenge_method": "S256",
+            "prompt": "consent",
+        })
+
+    def iniciar(self):
+        """Empieza a escuchar en segundo plano."""
+        threading.Thread(target=self._servidor.serve_forever, name="oauth-redireccion", daemon=True).start()
+        self._temporizador.start()
+
+    def cancelar(self):
+        """Deja de escuchar sin avisar a nadie (por ejemplo, si el usuario canceló)."""
+        with self._lock:
+            self._terminado = True
+        self._cerrar()
+
+    def _cerrar(self):
+        self._temporizador.cancel()
+        # shutdown() espera al hilo del servidor: se llama desde otro hilo para no bloquearlo.
+        threading.Thread(target=lambda: (self._servidor.shutdown(), self._servidor.server_close()),
+                         daemon=True).start()
+
+    def _vencer(self):
+        with self._lock:
+            if self._terminado:
+                return
+            self._terminado = True
+        self._cerrar()
+        self.al_fallar(Exception("Se agotó el tiempo de espera de la autorización de Google."))
+
+    def _recibir(self, solicitud):
+        params = parse_qs(urlparse(solicitud.path).query)
+        state = params.get("state", [None])[0]
+        with self._lock:
+            # El state se consume en la primera redirección válida; cualquier otra se rechaza.
+            valido = not self._terminado and state is not None and secrets.compare_digest(state, self.state)
+            if valido:
+                self._terminado = True
+        if not valido:
+            self._responder(solicitud, 400, "Solicitud de autorización no válida.")
+            return
+        codigo = params.get("code", [None])[0]
+        if codigo is None:
+            self._responder(solicitud, 200, "No se concedió el acceso.")
+            self._cerrar()
+            self.al_fallar(Exception(f"Google no autorizó el acceso ({params.get('error', ['desconocido'])[0]})."))
+            return
+        self._responder(solicitud, 200, "Autenticación completada.")
+        self._cerrar()
+        try:
+            datos = completar_autenticacion(codigo, self.client_config, self.redirect_uri, self.code_verifier)
+        except Exception as e:
+            self.al_fallar(e)
+        else:
+            self.al_terminar(datos)
+
+    @staticmethod
+    def _responder(solicitud, codigo, mensaje):
+        cuerpo = _PAGINA_RESPUESTA.format(mensaje).encode("utf-8")
+        solicitud.send_response(codigo)
+        solicitud.send_header("Content-Type", "text/html; charset=utf-8")
+        solicitud.send_header("Content-Length", str(len(cuerpo)))
+        solicitud.end_headers()
+        solicitud.wfile.write(cuerpo)
+
+def iniciar_autenticacion(al_terminar, al_fallar, abrir_navegador=webbrowser.open, client_config=None):
+    """
+    Inicia el flujo OAuth con redirección a un receptor local y abre el navegador.
+    Retorna el ReceptorRedireccion (para cancelarlo si el usuario abandona la pantalla).
+    """
+    receptor = ReceptorRedireccion(client_config or cargar_client_config(), al_terminar, al_fallar)
+    receptor.iniciar()
+    abrir_navegador(receptor.url_autorizacion())
+    return receptor
+
 def main(page: ft.Page):
     page.title = "Registro con Google"
     page.theme_mode = ft.ThemeMode.LIGHT
@@ -19,32 +271,15 @@ def main(page: ft.Page):
     page.padding = 0
     page.update()
 
-    # 1) Preparamos el flujo OAuth sin run_local_server()
-    flow = Flow.from_client_secrets_file(
-        "client_secret.json",  # <-- Asegúrate de que sea credencial de tipo "Aplicación de escritorio"
-        scopes=SCOPES
-    )
-    flow.redirect_uri = "urn:ietf:wg:oauth:2.0:oob"
-
-    # 2) Generar la URL de autorización y abrir el navegador
-    auth_url, _ = flow.authorization_url(prompt="consent")
-    webbrowser.open(auth_url)
-
-    # ----- INTERFAZ FLET -----
-    # Creamos un TextField para que el usuario pegue el código de Google
-    code_input = ft.TextField(
-        label="Pega aquí el código de Google",
-        autofocus=True,
-        width=300,
-    )
-
-    # Texto de estado para mostrar mensajes de error
-    status_text = ft.Text("", size=14, color="red", text_align=ft.TextAlign.CENTER)
+    # Texto de estado para mostrar el avance y los errores
+    status_text = ft.Text("Esperando la autorización en el navegador...", size=14, color="blue",
+                          text_align=ft.TextAlign.CENTER)
 
     def cancel(_):
         """
         Si el usuario no desea continuar, limpiamos la pantalla y regresamos a login_flet.
         """
+        receptor.cancelar()
         page.snack_bar = ft.SnackBar(ft.Text("Autenticación cancelada."), bgcolor="red")
         page.snack_bar.open = True
         page.update()
@@ -53,87 +288,52 @@ def main(page: ft.Page):
         import login_flet
         login_flet.main(page)
 
-    def confirm(_):
-        """
-        El usuario pegó el código y hace clic en "Confirmar".
-        Intentamos intercambiarlo por tokens y obtener los datos de usuario.
-        """
-        code = code_input.value.strip()
-        if not code:
-            status_text.value = "No ingresaste ningún código. Por favor, pégalo o presiona 'Cancelar'."
-            status_text.color = "red"
-            page.update()
-            return
+    def autenticacion_exitosa(prefill_data):
+        page.snack_bar = ft.SnackBar(ft.Text("¡Autenticación exitosa! Redirigiendo..."), bgcolor="green")
+        page.snack_bar.open = True
+        page.update()
 
-        try:
-            # Intercambiar el código por tokens
-            flow.fetch_token(code=code)
-            credentials = flow.credentials
-
-            # Obtener datos del usuario desde la API de Google
-            resp = requests.get(
-                "https://www.googleapis.com/oauth2/v1/userinfo",
-                headers={"Authorization": f"Bearer {credentials.token}"}
-            )
-            if resp.status_code != 200:
-                raise Exception("Error al obtener datos de usuario.")
-
-            user_info = resp.json()
-
-            # Dividir los nombres
-            given_name = user_info.get("given_name", "").strip()
-            fn_parts = given_name.split(maxsplit=1)
-            first_name = fn_parts[0] if len(fn_parts) > 0 else ""
-            second_name = fn_parts[1] if len(fn_parts) > 1 else ""
-
-            # Dividir los apellidos
-            family_name = user_info.get("family_name", "").strip()
-            ln_parts = family_name.split(maxsplit=1)
-            last_name = ln_parts[0] if len(ln_parts) > 0 else ""
-            second_last_name = ln_parts[1] if len(ln_parts) > 1 else ""
-
-            prefill_data = {
-                "first_name": first_name,
-                "second_name": second_name,
-                "last_name": last_name,
-                "second_last_name": second_last_name,
-                "email": user_info.get("email", ""),
-                "phone": ""  # Google no provee teléfono por defecto
-            }
-
-            page.snack_bar = ft.SnackBar(ft.Text("¡Autenticación exitosa! Redirigiendo..."), bgcolor="green")
-            page.snack_bar.open = True
-            page.update()
-
-            page.clean()
-            import registro_flet
-            registro_flet.main(page, prefill_data=prefill_data)
-
-        except Exception as ex:
-            status_text.value = f"Ocurrió un error: {str(ex)}"
-            status_text.color = "red"
-            page.update()
-
-    # Botones "Confirmar" y "Cancelar"
-    confirm_button = ft.ElevatedButton("Confirmar", on_click=confirm, bgcolor="blue", color="white")
+        page.clean()
+        import registro_flet
+        registro_flet.main(page, prefill_data=prefill_data)
+
+    def autenticacion_fallida(ex):
+        status_text.value = f"Ocurrió un error: {str(ex)}"
+        status_text.color = "red"
+        retry_button.visible = True
+        page.update()
+
+    def reintentar(_):
+        nonlocal receptor
+        receptor.cancelar()
+        status_text.value = "Esperando la autorización en el navegador..."
+        status_text.color = "blue"
+        retry_button.visible = False
+        page.update()
+        receptor = iniciar_autenticacion(autenticacion_exitosa, autenticacion_fallida)
+
+    # Botones "Reintentar" y "Cancelar"
+    retry_button = ft.ElevatedButton("Reintentar", on_click=reintentar, bgcolor="blue", color="white", visible=False)
     cancel_button = ft.ElevatedButton("Cancelar", on_click=cancel, bgcolor="red", color="white")
 
-    # Contenido principal: título + instrucciones + TextField + Botones + Mensaje
+    # Contenido principal: título + instrucciones + Botones + Mensaje
     info_label = ft.Text(
         "Se abrió el navegador para que inicies sesión con Google.\n"
-        "Copia el código que te muestre Google y pégalo aquí:",
+        "Al terminar, la aplicación continuará automáticamente.",
         text_align=ft.TextAlign.CENTER,
         size=14
     )
 
+    # El navegador vuelve a un receptor local (127.0.0.1) que completa el flujo solo.
+    receptor = iniciar_autenticacion(autenticacion_exitosa, autenticacion_fallida)
+
     # "Tarjeta" centrada
     card_content = ft.Column(
         [
             ft.Text("Autenticación con Google", size=20, weight=ft.FontWeight.BOLD, text_align=ft.TextAlign.CENTER),
             info_label,
-            code_input,
             ft.Row(
-                [confirm_button, cancel_button],
+                [retry_button, cancel_button],
                 alignment=ft.MainAxisAlignment.CENTER,
                 spacing=20
             ),
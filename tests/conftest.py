@@ -0,0 +1,45 @@
+"""
+Fixtures compartidas de las pruebas: cada prueba trabaja sobre una base de datos temporal,
+nunca sobre citas_medicas.db.
+"""
+import pytest
+
+import bd_medica
+
+
+@pytest.fixture
+def base_de_datos(tmp_path):
+    """
+    Apunta el pool de bd_medica a una base de datos temporal y retorna preparar(medicos, pacientes),
+    que la crea con médicos y pacientes ficticios y retorna (medico_ids, paciente_ids).
+    """
+    anterior = (bd_medica.TAMANO_POOL, bd_medica.DB_NAME, bd_medica.PERFIL_ALMACENAMIENTO)
+    bd_medica.configurar_pool(db_name=str(tmp_path / "citas.db"))
+
+    def preparar(medicos=1, pacientes=1):
+        bd_medica.crear_base_de_datos()
+        conexion = bd_medica.conectar_bd()
+        cursor = conexion.cursor()
+        for i in range(medicos):
+            cursor.execute("""
+                INSERT INTO Usuarios (tipo_usuario, nombres, apellidos, email, telefono, cedula, password)
+                VALUES ('Administrador', ?, ?, ?, '0999999999', ?, 'x')
+            """, (f"Medico{i}", f"Apellido{i}", f"medico{i}@prueba.com", f"1{i:09d}"))
+            cursor.execute("""
+                INSERT INTO Medicos (nombres, apellidos, especialidad_id, telefono, email, usuario_id)
+                VALUES (?, ?, ?, '0999999999', ?, ?)
+            """, (f"Medico{i}", f"Apellido{i}", i % 5 + 1, f"medico{i}@prueba.com", cursor.lastrowid))
+        for i in range(pacientes):
+            cursor.execute("""
+                INSERT INTO Usuarios (tipo_usuario, nombres, apellidos, email, telefono, cedula, password)
+                VALUES ('Paciente', ?, ?, ?, '0999999999', ?, 'x')
+            """, (f"Paciente{i}", f"Apellido{i}", f"paciente{i}@prueba.com", f"2{i:09d}"))
+        conexion.commit()
+        medico_ids = [r[0] for r in cursor.execute("SELECT id FROM Medicos").fetchall()]
+        paciente_ids = [r[0] for r in cursor.execute(
+            "SELECT id FROM Usuarios WHERE tipo_usuario = 'Paciente'").fetchall()]
+        conexion.close()
+        return medico_ids, paciente_ids
+
+    yield preparar
+    bd_medica.configurar_pool(*anterior)
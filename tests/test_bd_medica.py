@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+import bd_medica
+
+MANANA = (date.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _horas_libres(medico_id, fecha=MANANA):
+    bd_medica.generar_horarios_disponibles(medico_id, fecha)
+    return [hora for _, hora in bd_medica.obtener_horarios_disponibles(medico_id, fecha)]
+
+
+def test_reserva_concurrente_tiene_un_solo_ganador(base_de_datos):
+    medico_ids, paciente_ids = base_de_datos(medicos=1, pacientes=50)
+    for hora in _horas_libres(medico_ids[0])[:3]:
+        barrera = threading.Barrier(len(paciente_ids))
+        ganadores = []
+
+        def agendar(paciente_id):
+            barrera.wait()
+            ok, _ = bd_medica.registrar_cita(paciente_id, medico_ids[0], MANANA, hora)
+            if ok:
+                ganadores.append(paciente_id)
+
+        hilos = [threading.Thread(target=agendar, args=(pid,)) for pid in paciente_ids]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        assert len(ganadores) == 1
+    conexion = bd_medica.conectar_bd()
+    assert conexion.execute("SELECT COUNT(*) FROM Citas").fetchone()[0] == 3
+    conexion.close()
+
+
+def test_editar_cita_con_la_base_bloqueada_retorna_error(base_de_datos, monkeypatch):
+    monkeypatch.setitem(bd_medica.PERFILES_ALMACENAMIENTO[bd_medica.PERFIL_ALMACENAMIENTO], "busy_timeout", 100)
+    medico_ids, paciente_ids = base_de_datos()
+    horas = _horas_libres(medico_ids[0])
+    assert bd_medica.registrar_cita(paciente_ids[0], medico_ids[0], MANANA, horas[0])[0]
+    cita_id = bd_medica.obtener_citas_paciente(paciente_ids[0])[0][0]
+    bloqueo = sqlite3.connect(bd_medica.DB_NAME)
+    bloqueo.execute("BEGIN IMMEDIATE")
+    try:
+        ok, mensaje = bd_medica.editar_cita(cita_id, MANANA, horas[1])
+    finally:
+        bloqueo.rollback()
+        bloqueo.close()
+    assert not ok and "locked" in mensaje
+    assert bd_medica.editar_cita(cita_id, MANANA, horas[1]) == (True, "Cita reagendada correctamente.")
+
+
+def test_with_confirma_y_devuelve_la_conexion_al_pool(base_de_datos):
+    base_de_datos()
+    bd_medica.configurar_pool(tamano=1)
+    for i in range(5):
+        with bd_medica.conectar_bd() as conexion:
+            conexion.execute("UPDATE Usuarios SET telefono = ? WHERE id = 1", (f"{i:010d}",))
+    try:
+        with bd_medica.conectar_bd() as conexion:
+            conexion.execute("UPDATE Usuarios SET telefono = '1111111111' WHERE id = 1")
+            raise ValueError
+    except ValueError:
+        pass
+    conexion = bd_medica.conectar_bd()
+    assert conexion.execute("SELECT telefono FROM Usuarios WHERE id = 1").fetchone()[0] == "0000000004"
+    conexion.close()
+    assert bd_medica.estadisticas_conexiones()["abiertas"] == 1
+
+
+def test_medico_sin_fila_no_queda_en_cache(base_de_datos):
+    _, paciente_ids = base_de_datos(medicos=0, pacientes=1)
+    assert bd_medica.obtener_medico_id_por_usuario_id(paciente_ids[0]) is None
+    conexion = bd_medica.conectar_bd()
+    medico_id = conexion.execute("""
+        INSERT INTO Medicos (nombres, apellidos, especialidad_id, telefono, email, usuario_id)
+        VALUES ('Ana', 'Pérez', 1, '0999999999', 'ana@prueba.com', ?)
+    """, (paciente_ids[0],)).lastrowid
+    conexion.commit()
+    conexion.close()
+    assert bd_medica.obtener_medico_id_por_usuario_id(paciente_ids[0]) == medico_id
@@ -0,0 +1,34 @@
+import threading
+
+import datos_async
+
+
+def test_llamadas_de_una_sesion_se_ejecutan_en_orden():
+    sesion = object()
+    orden = []
+    futuros = [datos_async.ejecutar(sesion, orden.append, i) for i in range(100)]
+    futuros[-1].result(timeout=5)
+    assert orden == list(range(100))
+
+
+def test_clave_descarta_la_llamada_en_espera():
+    sesion = object()
+    liberar = threading.Event()
+    datos_async.ejecutar(sesion, liberar.wait, 5)
+    anteriores = [datos_async.ejecutar(sesion, lambda i=i: i, clave="busqueda") for i in range(5)]
+    ultimo = datos_async.ejecutar(sesion, lambda: "última", clave="busqueda")
+    liberar.set()
+    assert ultimo.result(timeout=5) == "última"
+    assert all(futuro.cancelled() for futuro in anteriores)
+
+
+def test_al_fallar_recibe_la_excepcion():
+    recibida = []
+    listo = threading.Event()
+
+    def fallar():
+        raise ValueError("sin conexión")
+
+    datos_async.ejecutar(object(), fallar, al_fallar=lambda e: (recibida.append(e), listo.set()))
+    assert listo.wait(5)
+    assert isinstance(recibida[0], ValueError)
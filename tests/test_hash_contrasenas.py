@@ -0,0 +1,35 @@
+import hashlib
+
+import bd_medica
+
+
+def _guardar_password(usuario_id, valor):
+    conexion = bd_medica.conectar_bd()
+    conexion.execute("UPDATE Usuarios SET password = ? WHERE id = ?", (valor, usuario_id))
+    conexion.commit()
+    conexion.close()
+
+
+def _password_guardado(usuario_id):
+    conexion = bd_medica.conectar_bd()
+    valor = conexion.execute("SELECT password FROM Usuarios WHERE id = ?", (usuario_id,)).fetchone()[0]
+    conexion.close()
+    return valor
+
+
+def test_hash_con_sal_y_verificacion():
+    guardado = bd_medica.hash_password("Clave$123")
+    assert guardado.startswith(bd_medica.ALGORITMO_HASH + "$")
+    assert guardado != bd_medica.hash_password("Clave$123")
+    assert bd_medica.verificar_password("Clave$123", guardado) == (True, False)
+    assert not bd_medica.verificar_password("Clave$124", guardado)[0]
+
+
+def test_hash_antiguo_se_rehace_al_iniciar_sesion(base_de_datos):
+    _, paciente_ids = base_de_datos()
+    _guardar_password(paciente_ids[0], hashlib.sha256(b"Clave$123").hexdigest())
+    existe, valida, _, _ = bd_medica.autenticar_usuario("paciente0@prueba.com", "Clave$123")
+    assert existe and valida
+    assert _password_guardado(paciente_ids[0]).startswith(bd_medica.ALGORITMO_HASH + "$")
+    assert bd_medica.autenticar_usuario("paciente0@prueba.com", "Clave$123")[1]
+    assert not bd_medica.autenticar_usuario("paciente0@prueba.com", "otra")[1]
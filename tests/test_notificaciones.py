@@ -0,0 +1,52 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import bd_medica
+import notificaciones_paciente
+
+
+def _agregar_cita(paciente_id, medico_id, momento):
+    conexion = bd_medica.conectar_bd()
+    cita_id = conexion.execute("""
+        INSERT INTO Citas (paciente_id, medico_id, fecha, hora, estado) VALUES (?, ?, ?, ?, 'Pendiente')
+    """, (paciente_id, medico_id, momento.strftime("%Y-%m-%d"), momento.strftime("%H:%M"))).lastrowid
+    conexion.commit()
+    conexion.close()
+    return cita_id
+
+
+@pytest.fixture
+def ids(base_de_datos):
+    medico_ids, paciente_ids = base_de_datos(medicos=1, pacientes=2)
+    notificaciones_paciente.crear_tabla_notificaciones()
+    return medico_ids[0], paciente_ids
+
+
+def test_recordatorios_globales_solo_generan_lo_que_falta(ids):
+    medico_id, (paciente_a, paciente_b) = ids
+    en_dos_horas = (datetime.now() + timedelta(hours=2)).replace(minute=0, second=0, microsecond=0)
+    _agregar_cita(paciente_a, medico_id, en_dos_horas)
+    _agregar_cita(paciente_a, medico_id, en_dos_horas + timedelta(days=10))
+    assert notificaciones_paciente.generar_recordatorios_globales()[:2] == (1, 1)
+    assert notificaciones_paciente.generar_recordatorios_globales()[:2] == (0, 1)
+    _agregar_cita(paciente_b, medico_id, en_dos_horas + timedelta(minutes=30))
+    assert notificaciones_paciente.generar_recordatorios_globales()[:2] == (1, 2)
+    assert notificaciones_paciente.contar_no_leidas(paciente_a) == 1
+    assert notificaciones_paciente.contar_no_leidas(paciente_b) == 1
+
+
+def test_cita_reagendada_recibe_recordatorio_de_la_nueva_fecha(ids):
+    medico_id, (paciente_id, _) = ids
+    cita_id = _agregar_cita(paciente_id, medico_id, datetime.now() + timedelta(days=30))
+    notificaciones_paciente.generar_recordatorios_globales()
+    # Hacia la parte de la ventana ya revisada: mañana a las 00:00 siempre cae en las próximas 24 horas.
+    manana = (date.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+    assert bd_medica.editar_cita(cita_id, manana, "00:00")[0]
+    assert notificaciones_paciente.generar_recordatorios_globales()[0] == 1
+    # Otra vez dentro de la ventana, ya con recordatorio: se reemplaza por el de la nueva hora.
+    nueva = (datetime.now() + timedelta(hours=2)).replace(minute=0)
+    assert bd_medica.editar_cita(cita_id, nueva.strftime("%Y-%m-%d"), nueva.strftime("%H:%M"))[0]
+    assert notificaciones_paciente.generar_recordatorios_globales()[0] == 1
+    mensajes = [n["message"] for n in notificaciones_paciente.obtener_notificaciones(paciente_id)]
+    assert len(mensajes) == 1 and mensajes[0].endswith(f"a las {nueva.strftime('%H:%M')}.")
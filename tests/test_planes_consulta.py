@@ -0,0 +1,116 @@
+"""
+Revisa con EXPLAIN QUERY PLAN las consultas de las funciones más usadas: ninguna debe recorrer
+una tabla grande completa (tampoco con SCAN ... USING INDEX, que lee el índice entero) y las de
+un médico o paciente deben buscar en su tabla por medico_id o paciente_id.
+"""
+import re
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import bd_medica
+import notificaciones_paciente
+
+# Tablas que crecen con el uso y nunca deben recorrerse completas en las consultas frecuentes.
+TABLAS_GRANDES = ("Citas", "Horarios", "Medicos", "Notificaciones", "Usuarios")
+
+MANANA = (date.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+EN_DOS_SEMANAS = (date.today() + timedelta(days=14)).strftime("%Y-%m-%d")
+
+# (nombre, llamada(medico_id, paciente_id), tabla que debe buscarse por medico_id o paciente_id
+#  (None si la consulta no es de un médico ni de un paciente), solo con el índice)
+CONSULTAS = [
+    ("obtener_todas_citas", lambda m, p: bd_medica.obtener_todas_citas(medico_id=m), "Citas", False),
+    ("obtener_todas_citas (citas activas)", lambda m, p: bd_medica.obtener_todas_citas(
+        medico_id=m, estados=["Pendiente"], limite=51), "Citas", False),
+    ("obtener_todas_citas (búsqueda)", lambda m, p: bd_medica.obtener_todas_citas(
+        medico_id=m, estados=["Pendiente"], busqueda="pac", limite=51), "Citas", False),
+    ("buscar_pacientes_de_medico", lambda m, p: bd_medica.buscar_pacientes_de_medico(m, "pac"), "Citas", False),
+    ("obtener_citas_paciente", lambda m, p: bd_medica.obtener_citas_paciente(p), "Citas", False),
+    ("obtener_citas_paciente_rango", lambda m, p: bd_medica.obtener_citas_paciente_rango(
+        p, "2025-01-01", "2025-01-31", por_dia=True), "Citas", False),
+    ("obtener_horarios_disponibles", lambda m, p: bd_medica.obtener_horarios_disponibles(m, MANANA),
+     "Horarios", False),
+    ("obtener_horarios_disponibles_rango", lambda m, p: bd_medica.obtener_horarios_disponibles_rango(
+        m, MANANA, EN_DOS_SEMANAS), "Horarios", False),
+    ("obtener_medicos", lambda m, p: bd_medica.obtener_medicos(especialidad_id=1), None, False),
+    ("obtener_medico_id_por_usuario_id", lambda m, p: bd_medica.obtener_medico_id_por_usuario_id(1), None, False),
+    ("obtener_pacientes_de_medico", lambda m, p: bd_medica.obtener_pacientes_de_medico(m), "Citas", False),
+    ("obtener_notificaciones", lambda m, p: notificaciones_paciente.obtener_notificaciones(p),
+     "Notificaciones", False),
+    ("contar_no_leidas", lambda m, p: notificaciones_paciente.contar_no_leidas(p), "Notificaciones", True),
+    ("autenticar_usuario", lambda m, p: bd_medica.autenticar_usuario("Paciente0@Prueba.com", "x"), None, False),
+]
+
+_PATRON_TABLA = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b)(\w+))?", re.IGNORECASE)
+
+
+def _capturar_consultas(funcion):
+    """Ejecuta funcion() y retorna las sentencias SELECT (con parámetros expandidos) que emitió."""
+    bd_medica.configurar_pool(tamano=1)
+    conexion = bd_medica.conectar_bd()
+    sentencias = []
+    conexion.set_trace_callback(sentencias.append)
+    conexion.close()
+    try:
+        funcion()
+    finally:
+        conexion = bd_medica.conectar_bd()
+        conexion.set_trace_callback(None)
+        conexion.close()
+    return [s for s in sentencias if s.lstrip().upper().startswith(("SELECT", "WITH"))]
+
+
+def _problemas_de_plan(funcion, alcance, solo_indice):
+    """Retorna los pasos del plan de las consultas de funcion() que no cumplen las reglas del módulo."""
+    problemas = []
+    conexion = sqlite3.connect(bd_medica.DB_NAME)
+    for sentencia in _capturar_consultas(funcion):
+        # Nombre real de cada tabla o alias que aparece en la consulta.
+        tablas = {}
+        for tabla, alias in _PATRON_TABLA.findall(sentencia):
+            tablas[tabla] = tabla
+            if alias:
+                tablas[alias] = tabla
+        for fila in conexion.execute("EXPLAIN QUERY PLAN " + sentencia):
+            paso = re.match(r"(SCAN|SEARCH) (\w+)", fila[3])
+            if not paso:
+                continue
+            tabla = tablas.get(paso.group(2), paso.group(2))
+            if paso.group(1) == "SCAN" and tabla in TABLAS_GRANDES:
+                problemas.append(fila[3])
+            elif tabla == alcance:
+                # Un SEARCH por (estado=?) también usa índice, pero recorre las filas de toda la clínica.
+                restriccion = re.search(r"\(([^)]*)\)", fila[3])
+                if not restriccion or not re.search(r"\b(?:medico_id|paciente_id)=", restriccion.group(1)):
+                    problemas.append(fila[3])
+                elif solo_indice and "COVERING INDEX" not in fila[3]:
+                    problemas.append(fila[3])
+    conexion.close()
+    return problemas
+
+
+@pytest.fixture
+def ids(base_de_datos):
+    medico_ids, paciente_ids = base_de_datos(medicos=2, pacientes=2)
+    notificaciones_paciente.crear_tabla_notificaciones()
+    return medico_ids[0], paciente_ids[0]
+
+
+@pytest.mark.parametrize("nombre, llamada, alcance, solo_indice", CONSULTAS, ids=[c[0] for c in CONSULTAS])
+def test_plan_de_consulta(ids, nombre, llamada, alcance, solo_indice):
+    medico_id, paciente_id = ids
+    assert _problemas_de_plan(lambda: llamada(medico_id, paciente_id), alcance, solo_indice) == []
+
+
+def test_detecta_busqueda_por_estado_de_toda_la_clinica(ids):
+    # Un índice que empieza por estado era elegido para las citas activas de un médico.
+    medico_id, _ = ids
+    conexion = bd_medica.conectar_bd()
+    conexion.execute("CREATE INDEX idx_citas_estado_fecha ON Citas(estado, fecha, hora)")
+    conexion.commit()
+    conexion.close()
+    problemas = _problemas_de_plan(lambda: bd_medica.obtener_todas_citas(
+        medico_id=medico_id, estados=["Pendiente"], limite=51), "Citas", False)
+    assert any("idx_citas_estado_fecha (estado=?)" in p for p in problemas)
@@ -0,0 +1,63 @@
+import threading
+import time
+import types
+
+import datos_async
+import notificaciones_paciente
+import planificador
+
+
+def test_recordatorios_de_muchas_sesiones_no_crean_hilos(base_de_datos, monkeypatch):
+    """
+    Revisión de recordatorios de muchos paneles de paciente, como interfaz_paciente: el planificador
+    la dispara, la consulta va por datos_async y al terminar se vuelve a programar. El reloj del
+    planificador se adelanta en cada ciclo, así que no se espera tiempo real.
+    """
+    sesiones, ciclos, retraso = 100, 50, 60.0
+    _, paciente_ids = base_de_datos(medicos=0, pacientes=sesiones)
+    notificaciones_paciente.crear_tabla_notificaciones()
+    reloj = types.SimpleNamespace(ahora=time.monotonic())
+    reloj.monotonic = lambda: reloj.ahora
+    monkeypatch.setattr(planificador, "time", reloj)
+    listas = threading.Condition()
+    revisadas = 0
+
+    def abrir_sesion(paciente_id):
+        sesion = object()
+        clave = f"notificaciones-paciente-{id(sesion)}"
+
+        def consultar():
+            notificaciones_paciente.generar_notificaciones(paciente_id)
+            return notificaciones_paciente.contar_no_leidas(paciente_id)
+
+        def revisar():
+            datos_async.ejecutar(sesion, consultar, al_terminar=reprogramar, clave="recordatorios")
+
+        def reprogramar(_):
+            nonlocal revisadas
+            planificador.programar(clave, revisar, retraso=retraso)
+            with listas:
+                revisadas += 1
+                listas.notify()
+
+        planificador.programar(clave, revisar, retraso=retraso)
+        return clave
+
+    claves = [abrir_sesion(pid) for pid in paciente_ids]
+    hilos = []
+    try:
+        for _ in range(ciclos):
+            with listas:
+                revisadas = 0
+            with planificador._lock:
+                reloj.ahora += retraso
+                planificador._lock.notify()
+            with listas:
+                assert listas.wait_for(lambda: revisadas == sesiones, timeout=30)
+            hilos.append(threading.active_count())
+        assert planificador.tareas_activas() == sesiones
+    finally:
+        for clave in claves:
+            planificador.cancelar(clave)
+    # Tras unos ciclos de calentamiento (hilos del planificador y de datos_async) no aparecen más.
+    assert max(hilos[3:]) <= hilos[2]
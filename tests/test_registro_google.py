@@ -0,0 +1,148 @@
+"""
+Flujo OAuth de registro_google contra un servidor local que simula a Google (auth, token y userinfo).
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pytest
+
+pytest.importorskip("flet")  # registro_google también contiene la pantalla de Flet
+requests = pytest.importorskip("requests")
+import registro_google  # noqa: E402
+
+CLIENT_CONFIG = {"client_id": "prueba", "client_secret": ""}
+VERIFICADOR = "verificador-prueba"
+
+
+def _desafio_pkce(verificador):
+    return base64.urlsafe_b64encode(hashlib.sha256(verificador.encode("ascii")).digest()).decode("ascii").rstrip("=")
+
+
+class ServidorOAuth:
+    """Servidor OAuth local: registra las solicitudes y puede simular fallas ("503" o "lento")."""
+
+    def __init__(self):
+        self.codigos = {}      # código -> (desafío PKCE, redirect_uri)
+        self.fallas = {}       # ruta -> fallas a simular antes de atender normalmente
+        self.solicitudes = []
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, codigo, datos):
+                cuerpo = json.dumps(datos).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def _simular_falla(self, ruta):
+                servidor.solicitudes.append(ruta)
+                pendientes = servidor.fallas.get(ruta)
+                falla = pendientes.pop(0) if pendientes else None
+                if falla == "503":
+                    self._json(503, {"error": "backend_error"})
+                elif falla == "lento":
+                    time.sleep(registro_google.TIMEOUT_HTTP[1] * 3)
+                return falla is not None
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                if url.path == "/auth":
+                    servidor.codigos["codigo-prueba"] = (params["code_challenge"][0], params["redirect_uri"][0])
+                    self.send_response(302)
+                    self.send_header("Location", params["redirect_uri"][0] + "?" + urlencode(
+                        {"code": "codigo-prueba", "state": params["state"][0]}))
+                    self.end_headers()
+                elif url.path == "/userinfo" and not self._simular_falla("/userinfo"):
+                    self._json(200, {"email": "paciente@prueba.com", "given_name": "Ana María",
+                                     "family_name": "Pérez Gómez"})
+
+            def do_POST(self):
+                datos = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+                if self._simular_falla("/token"):
+                    return
+                desafio, redirect_uri = servidor.codigos.pop(datos["code"][0], (None, None))
+                if (desafio is not None and desafio == _desafio_pkce(datos.get("code_verifier", [""])[0])
+                        and redirect_uri == datos["redirect_uri"][0]):
+                    self._json(200, {"access_token": "token-prueba"})
+                else:
+                    self._json(400, {"error": "invalid_grant"})
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.http.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.http.server_port}"
+
+    def emitir_codigo(self, codigo):
+        self.codigos[codigo] = (_desafio_pkce(VERIFICADOR), "http://127.0.0.1/")
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    servidor = ServidorOAuth()
+    threading.Thread(target=servidor.http.serve_forever, daemon=True).start()
+    for nombre in ("auth", "token", "userinfo"):
+        monkeypatch.setitem(registro_google.ENDPOINTS, nombre, f"{servidor.base}/{nombre}")
+    monkeypatch.setattr(registro_google, "TIMEOUT_HTTP", (1, 0.2))
+    monkeypatch.setattr(registro_google, "ESPERA_REINTENTO", 0.01)
+    yield servidor
+    servidor.http.shutdown()
+    servidor.http.server_close()
+
+
+def _intercambiar(codigo):
+    return registro_google.intercambiar_codigo(codigo, CLIENT_CONFIG, "http://127.0.0.1/", code_verifier=VERIFICADOR)
+
+
+def test_flujo_completo_con_pkce(servidor):
+    terminado = threading.Event()
+    resultado = {}
+
+    def abrir_navegador(url):
+        # El "navegador" sigue la redirección de /auth hasta el receptor local.
+        threading.Thread(target=requests.get, args=(url,), daemon=True).start()
+
+    registro_google.iniciar_autenticacion(
+        lambda datos: (resultado.update(datos=datos), terminado.set()),
+        lambda e: (resultado.update(error=e), terminado.set()),
+        abrir_navegador=abrir_navegador, client_config=CLIENT_CONFIG)
+    assert terminado.wait(10)
+    assert resultado["datos"]["email"] == "paciente@prueba.com"
+    assert resultado["datos"]["second_last_name"] == "Gómez"
+
+
+def test_token_se_reintenta_ante_503(servidor):
+    servidor.emitir_codigo("codigo-503")
+    servidor.fallas["/token"] = ["503"]
+    assert _intercambiar("codigo-503")["access_token"] == "token-prueba"
+    assert servidor.solicitudes == ["/token", "/token"]
+
+
+def test_codigo_invalido_no_se_reintenta(servidor):
+    with pytest.raises(Exception, match="no es válido"):
+        _intercambiar("no-emitido")
+    assert servidor.solicitudes == ["/token"]
+
+
+def test_post_de_token_sin_respuesta_no_se_reintenta(servidor):
+    # El servidor pudo haber consumido el código: repetir el POST no es seguro.
+    servidor.emitir_codigo("codigo-lento")
+    servidor.fallas["/token"] = ["lento"]
+    with pytest.raises(requests.Timeout):
+        _intercambiar("codigo-lento")
+    assert servidor.solicitudes == ["/token"]
+
+
+def test_userinfo_sin_respuesta_se_reintenta(servidor):
+    servidor.fallas["/userinfo"] = ["lento"]
+    assert registro_google.obtener_datos_usuario("token-prueba")["email"] == "paciente@prueba.com"
+    assert servidor.solicitudes == ["/userinfo", "/userinfo"]